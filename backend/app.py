@@ -3,38 +3,159 @@ Main Flask application for the Email Assistant.
 Updated with LLM service abstraction to support both OpenAI and local LLM models.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import json
+import queue
 import os
+import time
+from datetime import datetime
 from gmail_service import GmailService
-from llm_service import create_llm_service, OpenAIService, LocalLLMService
+from llm_service import create_llm_service, resolve_llama_params, OpenAIService, LocalLLMService
+from llm_autotune import autotune, save_autotune_result
 from email_processor import EmailProcessor
+from draft_cache import DraftCache
+from jobs import JobManager
+from events import EventBus
+from scheduler import EmailPoller
+from draft_prefetch import DraftPrefetcher
+from model_manager import ModelManager
+from health import HealthMonitor
 import config
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Total-Count'])  # Enable CORS for all routes
 
 # Initialize services
 gmail_service = None
-llm_service = None
+# Holds the active LLM service; changing model or provider swaps it without downtime
+model_manager = ModelManager()
+# Cached health of the active service, so checks don't call the provider
+health_monitor = HealthMonitor(lambda: model_manager.current)
 email_processor = None
+draft_cache = None
+# One worker more than refresh and rescoring, for draft pre-generation
+job_manager = JobManager(max_workers=3)
+# Model swaps and autotuning can hold a worker for many minutes, so they
+# queue on their own worker instead of starving the jobs above
+model_job_manager = JobManager(max_workers=1)
+event_bus = EventBus()
+email_poller = None
+draft_prefetcher = DraftPrefetcher()
+
+# How long a request waits for a loading local model before giving up with a 503
+LLM_LOAD_WAIT_SECONDS = 10
+# Streams can show loading progress, so they wait longer
+LLM_STREAM_LOAD_WAIT_SECONDS = 300
+
+# Event streams must reach the browser unbuffered: no-transform stops
+# compressing proxies (such as the dev server's) from holding them back
+SSE_HEADERS = {'Cache-Control': 'no-cache, no-transform', 'X-Accel-Buffering': 'no'}
+
+def _llm_unavailable(service, **extra):
+    """Error response if service can't take requests right now, else None.
+    
+    Waits briefly for a model that is still loading, then answers 503 so
+    the client can retry. extra fields are added to the error body.
+    """
+    if service is None:
+        return jsonify(dict(extra, error='LLM service not configured')), 401
+    
+    if service.state == 'loading' and not service.wait_until_ready(LLM_LOAD_WAIT_SECONDS):
+        return jsonify(dict(
+            extra,
+            error='The local model is still loading, please try again shortly',
+            llm_status=service.load_status()
+        )), 503, {'Retry-After': '5'}
+    
+    if not health_monitor.is_healthy(service):
+        load_status = service.load_status()
+        if load_status and load_status['error']:
+            return jsonify(dict(extra, error=f"LLM model failed to load: {load_status['error']}")), 401
+        return jsonify(dict(extra, error='LLM service not configured')), 401
+    
+    return None
+
+def _swap_llm_service(service):
+    """Switch to service in the background once it has loaded and passed a smoke test.
+    
+    Until then the current service keeps answering requests. Returns the job
+    to poll at /api/jobs/<id>.
+    """
+    def run(job):
+        switched = model_manager.swap(service)
+        return dict(model_manager.last_swap or {}, switched=switched)
+    
+    return model_job_manager.submit('llm-swap', run)
+
+# Settings that decide which LLM service should run
+LLM_SETTINGS_KEYS = {'llm_provider', 'openai_api_key', 'local_llm_model_path', 'local_llm_settings'}
+
+# The service most recently asked for, which may still be loading
+requested_llm_service = None
+llm_swap_job = None
+
+def _request_llm_service(service):
+    """Swap to service (see _swap_llm_service) and remember it was asked for"""
+    global requested_llm_service, llm_swap_job
+    requested_llm_service = service
+    llm_swap_job = _swap_llm_service(service)
+    return llm_swap_job
+
+def _llm_service_matches(service, settings):
+    """Whether service already runs what settings ask for"""
+    provider = settings.get('llm_provider', 'openai')
+    if provider == 'openai':
+        return isinstance(service, OpenAIService) and service.api_key == settings.get('openai_api_key', '')
+    if provider == 'local':
+        return (isinstance(service, LocalLLMService)
+                and service.model_path == settings.get('local_llm_model_path', '')
+                and service.params == resolve_llama_params(settings.get('local_llm_settings'))
+                and service.state != 'failed')
+    return False
+
+def _on_settings_changed(settings, changed):
+    """Rebuild only what the changed settings affect"""
+    if changed & LLM_SETTINGS_KEYS and not _llm_service_matches(requested_llm_service, settings):
+        provider = settings.get('llm_provider', 'openai')
+        # Reloading takes a while, so this only happens if the model would change
+        if provider == 'openai' and settings.get('openai_api_key'):
+            _request_llm_service(OpenAIService(settings['openai_api_key']))
+        elif provider == 'local' and settings.get('local_llm_model_path'):
+            _request_llm_service(LocalLLMService(settings['local_llm_model_path'], settings.get('local_llm_settings')))
+    
+    if 'email_check_frequency' in changed and email_poller:
+        email_poller.reschedule()
+
+config.subscribe_settings(_on_settings_changed)
 
 @app.route('/api/status', methods=['GET'])
 def status():
     """Check if services are properly configured and connected"""
     gmail_status = gmail_service is not None and gmail_service.is_authenticated()
-    llm_status = llm_service is not None and llm_service.is_configured()
+    llm_service = model_manager.current
+    # Served from the cached health probe, so polling this makes no provider
+    # calls. A model that is still loading or not probed yet counts as
+    # configured; llm_state and llm_health say which.
+    llm_status = llm_service is not None and (
+        llm_service.state == 'loading' or health_monitor.is_healthy(llm_service, wait=False) is not False
+    )
     
     # Get current LLM provider type
-    settings = config.load_settings()
+    settings = config.settings_snapshot()
     llm_provider = settings.get('llm_provider', 'openai')
     
     return jsonify({
         'gmail_configured': gmail_status,
         'llm_configured': llm_status,
         'llm_provider': llm_provider,
-        'ready': gmail_status and llm_status
+        'ready': gmail_status and llm_status,
+        'llm_state': llm_service.state if llm_service else None,
+        'llm_loading': llm_service.load_status() if llm_service else None,
+        'poller': email_poller.status() if email_poller else None,
+        'llm_metrics': llm_service.metrics() if llm_service else None,
+        'llm_models': model_manager.status(),
+        'llm_health': health_monitor.status(llm_service)
     })
 
 @app.route('/api/setup/gmail', methods=['GET'])
@@ -67,14 +188,15 @@ def gmail_auth_callback():
 @app.route('/api/setup/openai', methods=['POST'])
 def setup_openai():
     """Configure the OpenAI API key"""
-    global llm_service
     api_key = request.json.get('api_key')
     
     try:
-        llm_service = OpenAIService(api_key)
-        if llm_service.is_configured():
+        service = OpenAIService(api_key)
+        if service.is_configured():
+            # Requested before saving, so the settings change doesn't start a second swap
+            job = _request_llm_service(service)
             config.save_openai_key(api_key)
-            return jsonify({'success': True})
+            return jsonify({'success': True, 'job_id': job.id})
         else:
             return jsonify({'success': False, 'error': 'Invalid API key'})
     except Exception as e:
@@ -83,7 +205,6 @@ def setup_openai():
 @app.route('/api/setup/local-llm', methods=['POST'])
 def setup_local_llm():
     """Configure the local LLM model"""
-    global llm_service
     model_path = request.json.get('model_path')
     
     # Check if model file exists
@@ -99,50 +220,172 @@ def setup_local_llm():
             'system_info': system_info
         })
     
+    # The settings page posts here on every save; only a different model
+    # or different parameters are worth loading a second copy for
+    wanted = dict(config.settings_snapshot(), llm_provider='local', local_llm_model_path=model_path)
+    for service in (requested_llm_service, model_manager.current):
+        if _llm_service_matches(service, wanted):
+            if service is not requested_llm_service:
+                # Another model was asked for since; switch back to the one running
+                _request_llm_service(service)
+            config.save_local_llm_path(model_path)
+            job = llm_swap_job if llm_swap_job and llm_swap_job.active else None
+            return jsonify({'success': True, 'llm_state': service.state, 'job_id': job.id if job else None})
+    
     try:
-        # Try to load the model
-        llm_service = LocalLLMService(model_path)
+        # Start loading the model in the background; /api/status reports
+        # progress and the current model keeps serving until it is ready
+        service = LocalLLMService(model_path, config.settings_snapshot().get('local_llm_settings'))
         
-        if llm_service.is_configured():
-            config.save_local_llm_path(model_path)
-            return jsonify({'success': True})
-        else:
-            return jsonify({'success': False, 'error': 'Failed to load the model'})
-    except ImportError:
-        return jsonify({'success': False, 'error': 'Required package llama-cpp-python not installed. Run: pip install llama-cpp-python'})
+        # Fail fast on errors that show up straight away, such as a missing package
+        service.wait_until_ready(timeout=1)
+        if service.state == 'failed':
+            return jsonify({'success': False, 'error': service.load_error or 'Failed to load the model'})
+        
+        job = _request_llm_service(service)
+        config.save_local_llm_path(model_path)
+        return jsonify({'success': True, 'llm_state': service.state, 'job_id': job.id})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/setup/local-llm/autotune', methods=['POST'])
+def autotune_local_llm():
+    """Benchmark llama-cpp parameters in the background and keep the fastest.
+    
+    Returns the job to poll at /api/jobs/<id>. When it finishes, the chosen
+    parameters are saved and the local model is reloaded with them.
+    """
+    settings = config.settings_snapshot()
+    model_path = settings.get('local_llm_model_path')
+    if not model_path or not os.path.exists(model_path):
+        return jsonify({'error': f'Model file not found: {model_path}'}), 400
+    
+    def run(job):
+        result = autotune(
+            model_path,
+            config.check_system_requirements(),
+            base_params=resolve_llama_params(settings.get('local_llm_settings')),
+            progress=job.add_progress
+        )
+        # Saving changes local_llm_settings, which reloads the local model with them
+        save_autotune_result(result)
+        return {name: value for name, value in result.items() if name != 'trials'}
+    
+    job = model_job_manager.submit('llm-autotune', run, key='llm-autotune')
+    return jsonify(job.to_dict()), 202
+
 @app.route('/api/test-llm', methods=['POST'])
 def test_llm():
     """Test the configured LLM model"""
-    if not llm_service or not llm_service.is_configured():
-        return jsonify({'success': False, 'error': 'LLM service not configured'}), 401
+    with model_manager.use() as service:
+        unavailable = _llm_unavailable(service, success=False)
+        if unavailable:
+            return unavailable
+        
+        try:
+            # Simple test prompt
+            test_result = service.generate_reply(
+                sender="Test User <test@example.com>",
+                subject="Test Email",
+                body="This is a test email to verify that the LLM service is working correctly.",
+                style="concise"
+            )
+            
+            health_monitor.record_success(service)
+            return jsonify({
+                'success': True, 
+                'provider': service.provider,
+                'model': service.model_name,
+                'response': test_result
+            })
+        except Exception as e:
+            health_monitor.mark_stale(service, str(e))
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+def _parse_email_query(args):
+    """Convert /api/emails/important query parameters into EmailStore.query_emails filters"""
+    query = {}
+    
+    if 'limit' in args:
+        query['limit'] = min(max(int(args['limit']), 1), 1000)
+    if args.get('cursor'):
+        query['cursor'] = args['cursor']
+    if 'min_score' in args:
+        query['min_score'] = float(args['min_score'])
+    if 'max_score' in args:
+        query['max_score'] = float(args['max_score'])
+    
+    processed = args.get('processed', 'all')
+    if processed in ('processed', 'true', '1'):
+        query['processed'] = True
+    elif processed in ('unprocessed', 'false', '0'):
+        query['processed'] = False
+    elif processed != 'all':
+        raise ValueError(f"Invalid processed filter: {processed}")
+    
+    timeframe = args.get('timeframe', 'all')
+    if timeframe == 'today':
+        query['since'] = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    elif timeframe == 'week':
+        query['since'] = time.time() - 7 * 24 * 3600
+    elif timeframe == 'month':
+        query['since'] = time.time() - 30 * 24 * 3600
+    elif timeframe != 'all':
+        raise ValueError(f"Invalid timeframe: {timeframe}")
+    if 'since' in args:
+        query['since'] = float(args['since'])
+    if 'until' in args:
+        query['until'] = float(args['until'])
+    
+    if args.get('sender'):
+        query['sender'] = args['sender']
+    if args.get('domain'):
+        query['domain'] = args['domain']
+    # A dashboard group from /api/emails/aggregates, e.g. group=domain&group_key=Unknown
+    if args.get('group'):
+        query['group'] = (args['group'], args.get('group_key', ''))
+    if 'sort' in args:
+        query['sort'] = args['sort']
+    if 'order' in args:
+        query['order'] = args['order']
+    
+    return query
+
+@app.route('/api/emails/important', methods=['GET'])
+def get_important_emails():
+    """Get a list of important emails, optionally filtered, sorted and paged"""
+    global email_processor
+    
+    if not gmail_service or not gmail_service.is_authenticated():
+        return jsonify({'error': 'Gmail service not configured'}), 401
+    
+    if not email_processor:
+        email_processor = EmailProcessor(gmail_service)
     
     try:
-        # Get current LLM provider
-        settings = config.load_settings()
-        provider = settings.get('llm_provider', 'openai')
-        
-        # Simple test prompt
-        test_result = llm_service.generate_reply(
-            sender="Test User <test@example.com>",
-            subject="Test Email",
-            body="This is a test email to verify that the LLM service is working correctly.",
-            style="concise"
-        )
+        query = _parse_email_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if not query:
+            important_emails = email_processor.get_important_emails()
+            return jsonify(important_emails)
         
-        return jsonify({
-            'success': True, 
-            'provider': provider,
-            'response': test_result
-        })
+        emails, next_cursor, total = email_processor.query_emails(**query)
+        response = jsonify(emails)
+        response.headers['X-Total-Count'] = str(total)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'error': str(e)}), 500
 
-@app.route('/api/emails/important', methods=['GET'])
-def get_important_emails():
-    """Get a list of important emails"""
+@app.route('/api/emails/search', methods=['GET'])
+def search_emails():
+    """Full-text search over stored emails, best matches first"""
     global email_processor
     
     if not gmail_service or not gmail_service.is_authenticated():
@@ -151,15 +394,22 @@ def get_important_emails():
     if not email_processor:
         email_processor = EmailProcessor(gmail_service)
     
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    
     try:
-        important_emails = email_processor.get_important_emails()
-        return jsonify(important_emails)
+        results, total = email_processor.search_emails(query, limit=limit, offset=offset)
+        return jsonify({'results': results, 'total': total})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/emails/refresh', methods=['POST'])
-def refresh_emails():
-    """Manually refresh emails from Gmail"""
+@app.route('/api/emails/aggregates', methods=['GET'])
+def get_email_aggregates():
+    """Get email counts and importance grouped by domain, sender, priority or day"""
     global email_processor
     
     if not gmail_service or not gmail_service.is_authenticated():
@@ -168,13 +418,106 @@ def refresh_emails():
     if not email_processor:
         email_processor = EmailProcessor(gmail_service)
     
+    group_by = request.args.get('group_by', 'domain').split(',')
+    
     try:
-        email_processor.refresh_emails()
-        important_emails = email_processor.get_important_emails()
-        return jsonify(important_emails)
+        return jsonify({
+            'summary': email_processor.get_summary(),
+            'groups': {grouping: email_processor.get_aggregates(grouping) for grouping in group_by}
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/emails/refresh', methods=['POST'])
+def refresh_emails():
+    """Start refreshing emails from Gmail in the background.
+    
+    Returns the job to poll at /api/jobs/<id>; a refresh that is already
+    running is returned instead of starting another.
+    """
+    job = _submit_refresh()
+    if job is None:
+        return jsonify({'error': 'Gmail service not configured'}), 401
+    return jsonify(job.to_dict()), 202
+
+def _submit_refresh():
+    """Start (or join) a background refresh; None if Gmail is not set up.
+    
+    Publishes a 'new_mail' event when the refresh stored new emails.
+    """
+    global email_processor
+    
+    if not gmail_service or not gmail_service.is_authenticated():
+        return None
+    
+    if not email_processor:
+        email_processor = EmailProcessor(gmail_service)
+    
+    processor = email_processor
+    
+    def run(job):
+        processor.refresh_emails(progress=job.add_progress)
+        summary = processor.get_summary()
+        new_count = job.progress.get('scored', 0)
+        if new_count:
+            event_bus.publish('new_mail', {'count': new_count, 'summary': summary})
+        _submit_draft_prefetch(processor)
+        return {'summary': summary}
+    
+    return job_manager.submit('refresh', run, key='refresh')
+
+def _submit_draft_prefetch(processor):
+    """Start pre-generating drafts for the top emails, if enabled and possible"""
+    settings = config.settings_snapshot()
+    if not settings.get('draft_prefetch_enabled', True) or draft_cache is None or model_manager.current is None:
+        return None
+    
+    def run(job):
+        with model_manager.use() as service:
+            if service is None:
+                return {'skipped': 'LLM service not configured'}
+            # After a restart the local model may still be loading
+            service.wait_until_ready(LLM_STREAM_LOAD_WAIT_SECONDS)
+            if not health_monitor.is_healthy(service):
+                return {'skipped': 'LLM service not configured'}
+            return draft_prefetcher.run(job, processor, gmail_service, service, draft_cache, settings)
+    
+    return job_manager.submit('draft-prefetch', run, key='draft-prefetch')
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Stream server events (such as 'new_mail') as Server-Sent Events"""
+    subscriber = event_bus.subscribe()
+    
+    def generate():
+        try:
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse_event(event, data)
+        finally:
+            event_bus.unsubscribe(subscriber)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status and progress of a background job"""
+    job = job_manager.get(job_id) or model_job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/emails/<email_id>', methods=['GET'])
 def get_email_detail(email_id):
     """Get details of a specific email"""
@@ -193,26 +536,152 @@ def draft_reply(email_id):
     if not gmail_service or not gmail_service.is_authenticated():
         return jsonify({'error': 'Gmail service not configured'}), 401
     
-    if not llm_service or not llm_service.is_configured():
-        return jsonify({'error': 'LLM service not configured'}), 401
+    # Borrowed for the whole request, so a model swap waits for it to finish
+    with model_manager.use() as service:
+        unavailable = _llm_unavailable(service)
+        if unavailable:
+            return unavailable
+        
+        try:
+            email_detail = gmail_service.get_email(email_id)
+            
+            style = request.json.get('style', 'professional')
+            custom_instructions = request.json.get('custom_instructions', '')
+            regenerate = bool(request.json.get('regenerate', False))
+            served_by = model_manager.describe(service)
+            
+            cache_key = _draft_cache_key(service, email_id, email_detail, style, custom_instructions)
+            if draft_cache is not None and not regenerate:
+                draft = draft_cache.get(cache_key)
+                if draft is not None:
+                    return jsonify({'draft': draft, 'cached': True, 'served_by': served_by})
+            
+            with draft_prefetcher.interactive():
+                draft = service.generate_reply(
+                    sender=email_detail['sender'],
+                    subject=email_detail['subject'],
+                    body=email_detail['body'],
+                    style=style,
+                    custom_instructions=custom_instructions
+                )
+            
+            health_monitor.record_success(service)
+            if draft_cache is not None:
+                draft_cache.put(cache_key, draft)
+            
+            return jsonify({'draft': draft, 'cached': False, 'served_by': served_by})
+        except Exception as e:
+            health_monitor.mark_stale(service, str(e))
+            return jsonify({'error': str(e)}), 500
+
+def _draft_cache_key(service, email_id, email_detail, style, custom_instructions):
+    """Cache key for a draft of this email from this LLM service"""
+    return DraftCache.make_key(
+        email_id, email_detail['body'], style, custom_instructions,
+        service.provider, service.model_name
+    )
+
+def _sse_event(event, data):
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/emails/<email_id>/draft-reply/stream', methods=['GET'])
+def stream_draft_reply(email_id):
+    """Stream an AI draft reply for a specific email as Server-Sent Events.
+    
+    Sends a 'token' event per generated chunk and a final 'done' event with
+    the full draft. If the client disconnects, the generator is closed and
+    the LLM stops generating. A cached draft is sent as a lone 'done' event
+    unless regenerate is set. While a local model is still loading,
+    'loading' events report its progress.
+    """
+    # Borrowed until the response is closed, so a model swap waits for the
+    # stream to finish
+    service = model_manager.acquire()
+    try:
+        response = app.make_response(_stream_draft_reply(service, email_id))
+    except Exception:
+        model_manager.release(service)
+        raise
+    response.call_on_close(lambda: model_manager.release(service))
+    return response
+
+def _stream_draft_reply(service, email_id):
+    """The response for stream_draft_reply, drafted by service"""
+    if not gmail_service or not gmail_service.is_authenticated():
+        return jsonify({'error': 'Gmail service not configured'}), 401
+    
+    # A model that is still loading is waited for inside the stream
+    if not service or (service.state != 'loading' and not health_monitor.is_healthy(service)):
+        # Checked again inside, and the service may have recovered meanwhile
+        unavailable = _llm_unavailable(service)
+        if unavailable:
+            return unavailable
     
     try:
         email_detail = gmail_service.get_email(email_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if email_detail is None:
+        return jsonify({'error': 'Email not found'}), 404
+    
+    style = request.args.get('style', 'professional')
+    custom_instructions = request.args.get('custom_instructions', '')
+    regenerate = request.args.get('regenerate', '').lower() in ('1', 'true', 'yes')
+    
+    cache_key = _draft_cache_key(service, email_id, email_detail, style, custom_instructions)
+    served_by = model_manager.describe(service)
+    cached_draft = None
+    if draft_cache is not None and not regenerate:
+        cached_draft = draft_cache.get(cache_key)
+    
+    def generate_cached():
+        yield _sse_event('done', {'draft': cached_draft, 'cached': True, 'served_by': served_by})
+    
+    def generate():
+        # Report loading progress until the model is ready
+        waited = 0
+        while service.state == 'loading' and not service.wait_until_ready(2):
+            waited += 2
+            if waited >= LLM_STREAM_LOAD_WAIT_SECONDS:
+                yield _sse_event('error', {'error': 'The local model is still loading, please try again shortly'})
+                return
+            yield _sse_event('loading', service.load_status())
+        if not health_monitor.is_healthy(service):
+            yield _sse_event('error', {'error': f"LLM model failed to load: {(service.load_status() or {}).get('error')}"})
+            return
         
-        style = request.json.get('style', 'professional')
-        custom_instructions = request.json.get('custom_instructions', '')
-        
-        draft = llm_service.generate_reply(
+        tokens = service.stream_reply(
             sender=email_detail['sender'],
             subject=email_detail['subject'],
             body=email_detail['body'],
             style=style,
             custom_instructions=custom_instructions
         )
-        
-        return jsonify({'draft': draft})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        parts = []
+        with draft_prefetcher.interactive():
+            try:
+                for text in tokens:
+                    parts.append(text)
+                    yield _sse_event('token', {'text': text})
+                draft = ''.join(parts).strip()
+                health_monitor.record_success(service)
+                # Only complete drafts are cached, not ones cut short by a disconnect
+                if draft_cache is not None:
+                    draft_cache.put(cache_key, draft)
+                yield _sse_event('done', {'draft': draft, 'cached': False, 'served_by': served_by})
+            except Exception as e:
+                health_monitor.mark_stale(service, str(e))
+                yield _sse_event('error', {'error': str(e)})
+            finally:
+                # Runs on client disconnect too, cancelling generation
+                tokens.close()
+    
+    return Response(
+        stream_with_context(generate_cached() if cached_draft is not None else generate()),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
 
 @app.route('/api/emails/<email_id>/send-reply', methods=['POST'])
 def send_reply(email_id):
@@ -251,7 +720,7 @@ def get_settings():
 
 @app.route('/api/emails/recalculate-importance', methods=['POST'])
 def recalculate_importance():
-    """Recalculate importance scores for all emails"""
+    """Start recalculating importance scores for all emails in the background"""
     global email_processor
     
     if not gmail_service or not gmail_service.is_authenticated():
@@ -260,43 +729,37 @@ def recalculate_importance():
     if not email_processor:
         email_processor = EmailProcessor(gmail_service)
     
-    try:
-        email_processor.recalculate_importance_scores()
-        important_emails = email_processor.get_important_emails()
-        return jsonify(important_emails)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    processor = email_processor
+    
+    def run(job):
+        changed = processor.recalculate_importance_scores(progress=job.add_progress)
+        return {'changed': changed}
+    
+    job = job_manager.submit('recalculate-importance', run, key='recalculate-importance')
+    return jsonify(job.to_dict()), 202
 
 @app.route('/api/settings', methods=['POST'])
 def update_settings():
     """Update user settings"""
-    global llm_service
-    
     new_settings = request.json
-    current_settings = config.load_settings()
-    
-    # Check if LLM provider has changed
-    old_provider = current_settings.get('llm_provider', 'openai')
-    new_provider = new_settings.get('llm_provider', old_provider)
+    current_settings = config.settings_snapshot()
     
     # Update settings, preserving API keys if not provided
     if 'openai_api_key' not in new_settings and 'openai_api_key' in current_settings:
         new_settings['openai_api_key'] = current_settings['openai_api_key']
     
+    # Subscribers rebuild what changed: a new LLM service (the current one
+    # keeps serving until it is ready), the poller's schedule, the scorer
+    swap_job = llm_swap_job
     config.save_settings(new_settings)
     
-    # Reinitialize LLM service if provider or key was updated
-    if new_provider != old_provider or 'openai_api_key' in new_settings:
-        if new_provider == 'openai':
-            llm_service = OpenAIService(new_settings.get('openai_api_key', ''))
-        elif new_provider == 'local':
-            llm_service = LocalLLMService(new_settings.get('local_llm_model_path', ''))
-    
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'swap_job_id': llm_swap_job.id if llm_swap_job is not swap_job else None})
 
 if __name__ == '__main__':
     # Load existing configuration if available
-    settings = config.load_settings()
+    settings = config.settings_snapshot()
+    
+    draft_cache = DraftCache.from_settings(settings)
     
     # Initialize Gmail service if previously configured
     if config.gmail_credentials_exist():
@@ -308,14 +771,22 @@ if __name__ == '__main__':
     
     # Initialize LLM service based on configured provider
     provider = settings.get('llm_provider', 'openai')
+    # (with nothing to replace, swap() switches it in straight away)
     if provider == 'openai' and 'openai_api_key' in settings and settings['openai_api_key']:
-        llm_service = OpenAIService(settings['openai_api_key'])
+        requested_llm_service = OpenAIService(settings['openai_api_key'])
+        model_manager.swap(requested_llm_service, smoke_test=False)
     elif provider == 'local' and 'local_llm_model_path' in settings and settings['local_llm_model_path']:
-        try:
-            llm_service = LocalLLMService(settings['local_llm_model_path'])
-        except ImportError:
-            print("Warning: llama-cpp-python package not installed. Local LLM functionality will be unavailable.")
-            print("To enable local LLMs, install the package: pip install llama-cpp-python")
+        # Loads in the background so the server starts straight away
+        requested_llm_service = LocalLLMService(settings['local_llm_model_path'], settings.get('local_llm_settings'))
+        model_manager.swap(requested_llm_service, smoke_test=False)
+    
+    # Poll Gmail and probe LLM health in the background. With the debug
+    # reloader this script also runs in a watcher process, which must not
+    # poll; only the serving child has WERKZEUG_RUN_MAIN set.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        email_poller = EmailPoller(_submit_refresh)
+        email_poller.start()
+        health_monitor.start()
     
     # Start Flask app
     app.run(debug=True, port=5000)
\ No newline at end of file
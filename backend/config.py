@@ -6,6 +6,8 @@ Added support for local LLM models.
 import os
 import json
 import shutil
+import tempfile
+import threading
 import psutil
 import platform
 
@@ -15,8 +17,49 @@ CREDENTIALS_DIR = 'credentials'
 CLIENT_SECRET_FILE = os.path.join(CREDENTIALS_DIR, 'client_secret.json')
 TOKEN_FILE = os.path.join(CREDENTIALS_DIR, 'gmail_token.json')
 
-def load_settings():
-    """Load user settings"""
+class _FrozenDict(dict):
+    """A dict that can't be modified, for settings snapshots"""
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Settings snapshots are read-only; edit a copy from load_settings()")
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _read_only
+
+class _FrozenList(list):
+    """A list that can't be modified, for settings snapshots"""
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Settings snapshots are read-only; edit a copy from load_settings()")
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return _FrozenList(_freeze(item) for item in value)
+    return value
+
+def _thaw(value):
+    if isinstance(value, dict):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_thaw(item) for item in value]
+    return value
+
+# The settings as last read or written, and the file version they came from
+_settings_lock = threading.RLock()
+_snapshot = None
+_snapshot_version = None
+_subscribers = []
+
+def _file_version():
+    """Modification time and size of the settings file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(SETTINGS_FILE)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _read_settings_file():
+    """Parse settings.json, falling back to the defaults"""
     if os.path.exists(SETTINGS_FILE):
         try:
             with open(SETTINGS_FILE, 'r') as file:
@@ -27,10 +70,81 @@ def load_settings():
         # Return default settings
         return _get_default_settings()
 
+def settings_snapshot():
+    """The current settings as a read-only snapshot.
+    
+    The file is only re-read when its modification time or size changed
+    since the last read, so this is cheap enough to call on every request.
+    """
+    global _snapshot, _snapshot_version
+    version = _file_version()
+    with _settings_lock:
+        if _snapshot is not None and version == _snapshot_version:
+            return _snapshot
+        previous = _snapshot
+        _snapshot = _freeze(_read_settings_file())
+        _snapshot_version = version
+        snapshot = _snapshot
+    # Edited outside the app; on the first read there's nothing to compare with
+    if previous is not None:
+        _notify(previous, snapshot)
+    return snapshot
+
+def load_settings():
+    """Load user settings as a dict the caller may modify"""
+    return _thaw(settings_snapshot())
+
 def save_settings(settings):
-    """Save user settings"""
-    with open(SETTINGS_FILE, 'w') as file:
-        json.dump(settings, file, indent=2)
+    """Save user settings.
+    
+    Written to a temporary file and renamed into place, so a crash never
+    leaves a partly written file. Subscribers are told which keys changed.
+    """
+    global _snapshot, _snapshot_version
+    previous = settings_snapshot()
+    with _settings_lock:
+        directory = os.path.dirname(os.path.abspath(SETTINGS_FILE))
+        fd, temp_path = tempfile.mkstemp(prefix='.settings-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(settings, file, indent=2)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, SETTINGS_FILE)
+        except:
+            os.remove(temp_path)
+            raise
+        _snapshot = _freeze(settings)
+        _snapshot_version = _file_version()
+        snapshot = _snapshot
+    _notify(previous, snapshot)
+
+def subscribe_settings(callback):
+    """Call callback(settings, changed_keys) whenever the settings change.
+    
+    settings is the new read-only snapshot and changed_keys the set of
+    top-level keys whose values differ. Callbacks run on the thread that
+    saved (or noticed) the change.
+    """
+    with _settings_lock:
+        _subscribers.append(callback)
+
+def unsubscribe_settings(callback):
+    with _settings_lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+def _notify(previous, current):
+    changed = {key for key in set(previous) | set(current) if previous.get(key) != current.get(key)}
+    if not changed:
+        return
+    with _settings_lock:
+        subscribers = list(_subscribers)
+    for callback in subscribers:
+        try:
+            callback(current, changed)
+        except Exception as e:
+            print(f"Error applying settings change: {str(e)}")
 
 def save_openai_key(api_key):
     """Save OpenAI API key"""
@@ -50,8 +164,18 @@ def gmail_credentials_exist():
     """Check if Gmail credentials exist"""
     return os.path.exists(CLIENT_SECRET_FILE) and os.path.exists(TOKEN_FILE)
 
+# Hardware doesn't change while the app runs, so it is only probed once
+_system_info = None
+
 def check_system_requirements():
     """Check system requirements for local LLM usage"""
+    global _system_info
+    if _system_info is None:
+        _system_info = _probe_system()
+    return dict(_system_info)
+
+def _probe_system():
+    """Probe RAM and CPUs with psutil"""
     system_info = {
         'os': platform.system(),
         'ram_gb': psutil.virtual_memory().total / (1024**3),
@@ -79,6 +203,22 @@ def _get_default_settings():
         ],
         'important_senders': [],
         'email_check_frequency': 'daily',
+        'gmail_batch_size': 50,
+        'email_sync_mode': 'incremental',  # 'incremental' or 'full'
+        'email_ingest_mode': 'thread',  # 'thread' (one row per thread) or 'message'
+        'thread_cache_max_threads': 200,
+        'full_sync_max_results': 50,
+        'message_cache_enabled': True,
+        'message_cache_max_mb': 256,
+        'draft_cache_enabled': True,
+        'draft_cache_max_entries': 200,
+        'draft_cache_ttl_hours': 24,
+        'draft_cache_persist': True,
+        'draft_prefetch_enabled': True,
+        'draft_prefetch_count': 5,
+        'draft_prefetch_concurrency': 2,
+        'draft_prefetch_max_per_day': 50,
+        'draft_prefetch_time_budget_seconds': 600,
         'response_style': 'professional',
         'custom_prompts': {
             'professional': 'Draft a professional and concise response.',
@@ -0,0 +1,98 @@
+"""
+Cache of generated draft replies.
+Drafts are keyed on everything that shapes the LLM's output, so reopening an
+email that was already drafted with the same style, instructions and model
+is served instantly instead of generating again. Entries expire after a TTL,
+the least recently used are evicted past a size limit, and the cache is
+optionally persisted to a JSON file so it survives restarts.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+class DraftCache:
+    """Size- and age-bounded LRU cache of draft replies"""
+
+    def __init__(self, path='draft_cache.json', max_entries=200, ttl_seconds=24 * 3600):
+        """Create the cache, loading persisted drafts from path if given"""
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._load()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build the cache from a settings dict, or None if it is disabled"""
+        if not settings.get('draft_cache_enabled', True):
+            return None
+        return cls(
+            settings.get('draft_cache_path', 'draft_cache.json') if settings.get('draft_cache_persist', True) else None,
+            max_entries=int(settings.get('draft_cache_max_entries', 200)),
+            ttl_seconds=float(settings.get('draft_cache_ttl_hours', 24)) * 3600
+        )
+
+    @staticmethod
+    def make_key(email_id, body, style, custom_instructions, provider, model_name):
+        """Key for a draft; the body is hashed so edited messages miss"""
+        body_hash = hashlib.sha256((body or '').encode('utf-8')).hexdigest()
+        return hashlib.sha256(
+            json.dumps([email_id, body_hash, style, custom_instructions or '', provider, model_name]).encode('utf-8')
+        ).hexdigest()
+
+    def get(self, key):
+        """Get a cached draft, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['created_at'] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry['draft']
+
+    def put(self, key, draft):
+        """Store a draft, evicting the least recently used past the size limit"""
+        with self._lock:
+            self._entries[key] = {'draft': draft, 'created_at': time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def _load(self):
+        """Load unexpired drafts from disk"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                entries = json.load(file)
+        except Exception as e:
+            print(f"Ignoring unreadable draft cache: {str(e)}")
+            return
+
+        # Stored oldest first, so insertion order restores the LRU order
+        now = time.time()
+        for key, entry in entries:
+            if now - entry['created_at'] <= self.ttl_seconds:
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        """Write the cache to disk, replacing the file atomically"""
+        if not self.path:
+            return
+        try:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(list(self._entries.items()), file)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Error saving draft cache: {str(e)}")
@@ -0,0 +1,126 @@
+"""
+Speculative draft generation.
+After a refresh, drafts are generated in the background for the
+highest-scored unprocessed emails in the default response style and put in
+the draft cache, so opening one of them shows its draft straight away.
+Drafting the user asked for always comes first: prefetching waits while an
+interactive draft is being generated and is queued at background priority
+on a local model, runs at most a few drafts at a time, and stops once its
+time or daily draft budget is spent.
+"""
+
+import time
+import threading
+from datetime import date
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from draft_cache import DraftCache
+from inference_queue import PRIORITY_BACKGROUND
+
+class DraftPrefetcher:
+    """Pre-generates drafts for the emails most likely to be answered"""
+
+    def __init__(self):
+        self._interactive = 0
+        self._idle = threading.Condition()
+        self._budget_lock = threading.Lock()
+        self._budget_day = None
+        self._generated_today = 0
+
+    @contextmanager
+    def interactive(self):
+        """Mark a user-requested draft as in progress; prefetching waits for it"""
+        with self._idle:
+            self._interactive += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._interactive -= 1
+                self._idle.notify_all()
+
+    def _wait_until_idle(self, deadline):
+        """Wait for interactive drafting to finish; False if the deadline passed first"""
+        with self._idle:
+            while self._interactive:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _take_budget(self, max_per_day):
+        """Count one draft against today's budget; False once it is spent"""
+        with self._budget_lock:
+            today = date.today()
+            if self._budget_day != today:
+                self._budget_day = today
+                self._generated_today = 0
+            if self._generated_today >= max_per_day:
+                return False
+            self._generated_today += 1
+            return True
+
+    def run(self, job, processor, gmail_service, llm_service, draft_cache, settings):
+        """Generate missing drafts for the top unprocessed emails (runs as a job)"""
+        count = int(settings.get('draft_prefetch_count', 5))
+        max_per_day = int(settings.get('draft_prefetch_max_per_day', 50))
+        deadline = time.time() + float(settings.get('draft_prefetch_time_budget_seconds', 600))
+        style = settings.get('response_style', 'professional')
+
+        # A local model only runs one completion at a time anyway
+        concurrency = max(1, int(settings.get('draft_prefetch_concurrency', 2)))
+        if llm_service.provider == 'local':
+            concurrency = 1
+
+        emails, _, _ = processor.query_emails(limit=count, processed=False, sort='importance_score', order='desc')
+        job.add_progress(total=len(emails))
+
+        # Fetched up front in one batch (mostly from the message cache)
+        full_emails = gmail_service.get_emails_batch(
+            [email['id'] for email in emails],
+            batch_size=settings.get('gmail_batch_size')
+        )
+
+        def prefetch(email_id):
+            email_detail = full_emails.get(email_id)
+            if not email_detail:
+                job.add_progress(failed=1)
+                return
+
+            if time.time() >= deadline or not self._wait_until_idle(deadline):
+                job.add_progress(skipped=1)
+                return
+
+            key = DraftCache.make_key(
+                email_id, email_detail['body'], style, '', llm_service.provider, llm_service.model_name
+            )
+            if draft_cache.get(key) is not None:
+                job.add_progress(cached=1)
+                return
+
+            if not self._take_budget(max_per_day):
+                job.add_progress(skipped=1)
+                return
+
+            draft = llm_service.generate_reply(
+                sender=email_detail['sender'],
+                subject=email_detail['subject'],
+                body=email_detail['body'],
+                style=style,
+                priority=PRIORITY_BACKGROUND
+            )
+            draft_cache.put(key, draft)
+            job.add_progress(generated=1)
+
+        def prefetch_safely(email_id):
+            try:
+                prefetch(email_id)
+            except Exception as e:
+                print(f"Error pre-generating draft for {email_id}: {str(e)}")
+                job.add_progress(failed=1)
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='draft-prefetch') as executor:
+            list(executor.map(prefetch_safely, [email['id'] for email in emails]))
+
+        return dict(job.progress)
@@ -1,58 +1,187 @@
-import os
-import json
 import re
 from datetime import datetime
+import numpy as np
 import config
+from email_store import EmailStore
+from importance_scorer import ImportanceScorer, FEATURE_NAMES
+from prompt_builder import strip_quoted
+
+def as_score(value):
+    """Convert a NumPy score to a plain number, keeping whole scores as ints"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
 
 class EmailProcessor:
     def __init__(self, gmail_service):
         """Initialize the email processor with the Gmail service"""
         self.gmail_service = gmail_service
         self.data_file = 'email_data.json'
-        self.emails = self._load_data()
-        self.settings = config.load_settings()
-    
-    def _load_data(self):
-        """Load email data from the data file"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as file:
-                    return json.load(file)
-            except:
-                return {'important_emails': [], 'processed_ids': []}
-        else:
-            return {'important_emails': [], 'processed_ids': []}
-    
-    def _save_data(self):
-        """Save email data to the data file"""
-        with open(self.data_file, 'w') as file:
-            json.dump(self.emails, file)
-    
-    def refresh_emails(self):
-        """Refresh emails from Gmail and identify important ones"""
-        recent_emails = self.gmail_service.get_recent_emails(max_results=50)
-        
-        # Update settings
-        self.settings = config.load_settings()
+        self.store = EmailStore('email_store.db', legacy_json_path=self.data_file)
+        self.scorer = None
+        self._scorer_signature = None
+        self._feature_signature = None
+        # (features_version, ids, feature matrix, scores) of the last rescoring
+        self._feature_cache = None
+        self._update_settings(config.settings_snapshot())
+        # Recompile the scorer as soon as new criteria are saved
+        config.subscribe_settings(lambda settings, changed: self._update_settings(settings))
+    
+    def _update_settings(self, settings):
+        """Use new settings, recompiling the scorer only if its criteria changed"""
+        self.settings = settings
+        signature = ImportanceScorer.settings_signature(settings)
+        if signature != self._scorer_signature:
+            self.scorer = ImportanceScorer.from_settings(settings)
+            self._scorer_signature = signature
+            self._feature_signature = ImportanceScorer.feature_signature(settings)
+    
+    def refresh_emails(self, progress=None):
+        """Refresh emails from Gmail and identify important ones.
         
-        # Process each email to identify important ones
-        for email in recent_emails:
-            # Skip already processed emails
-            if email['id'] in self.emails['processed_ids']:
-                continue
+        progress, if given, is called with counts to add as work completes,
+        e.g. progress(fetched=50, scored=50).
+        """
+        # Pick up edits made to the settings file directly (cheap if unchanged)
+        self._update_settings(config.settings_snapshot())
+        
+        history_id = self.store.get_meta('history_id')
+        synced = False
+        if self.settings.get('email_sync_mode', 'incremental') == 'incremental' and history_id:
+            synced = self._incremental_sync(history_id, progress)
+            if not synced:
+                print("Stored historyId has expired, running a full resync")
+        
+        if not synced:
+            self._full_sync(progress)
+        
+        # Emails stored before search existed are indexed once, from the message cache
+        if not self.store.get_meta('search_backfilled'):
+            self._backfill_search_index()
+    
+    def _backfill_search_index(self):
+        """Add tracked emails that are missing from the full-text index"""
+        missing_ids = self.store.get_unindexed_ids()
+        if missing_ids:
+            full_emails = self.gmail_service.get_emails_batch(
+                missing_ids,
+                batch_size=self.settings.get('gmail_batch_size')
+            )
+            self.store.index_for_search(email for email in full_emails.values() if email)
+        self.store.set_meta('search_backfilled', True)
+    
+    def _thread_mode(self):
+        """Whether emails are ingested, stored and scored a thread at a time"""
+        return self.settings.get('email_ingest_mode', 'thread') == 'thread'
+    
+    def _full_sync(self, progress=None):
+        """List the newest inbox messages and process any new ones"""
+        # Take the historyId before listing so nothing arriving meanwhile is missed
+        history_id = self.gmail_service.get_history_id()
+        
+        if self._thread_mode():
+            # Only threads that changed since they were last ingested are fetched
+            recent_threads = self.gmail_service.list_recent_threads(
+                max_results=self.settings.get('full_sync_max_results', 50)
+            )
+            known = self.store.get_thread_history_ids(thread['id'] for thread in recent_threads)
+            listed_history_ids = {thread['id']: thread.get('historyId') for thread in recent_threads}
+            changed_ids = [thread_id for thread_id, thread_history_id in listed_history_ids.items()
+                           if known.get(thread_id) != thread_history_id]
+            self._process_threads(changed_ids, progress, min_history_ids=listed_history_ids)
             
-            # Mark as processed
-            self.emails['processed_ids'].append(email['id'])
+            self.store.set_meta('history_id', history_id)
+            self.store.set_meta('pending_thread_ids', [])
+            return
+        
+        recent_emails = self.gmail_service.get_recent_emails(
+            max_results=self.settings.get('full_sync_max_results', 50)
+        )
+        
+        # Skip already processed emails
+        new_ids = self.store.filter_unseen_ids(email['id'] for email in recent_emails)
+        self._process_new_emails(new_ids, progress)
+        
+        self.store.set_meta('history_id', history_id)
+        self.store.set_meta('pending_ids', [])
+    
+    def _incremental_sync(self, history_id, progress=None):
+        """Apply inbox changes since history_id; returns False if it has expired"""
+        history = self.gmail_service.get_history(history_id)
+        if history is None:
+            return False
+        
+        # Drop messages that left the inbox, and forget them so that one moved
+        # back later is tracked again
+        if history['removed']:
+            self.store.remove_emails(history['removed'])
+            self.store.forget_seen_ids(history['removed'])
+        
+        if self._thread_mode():
+            # Each thread with new messages is fetched once, however many arrived
+            pending_ids = self.store.get_meta('pending_thread_ids', [])
+            new_message_ids = self.store.filter_unseen_ids(history['added'])
+            thread_ids = [history['thread_ids'].get(message_id) for message_id in new_message_ids]
+            candidate_ids = list(dict.fromkeys(pending_ids + [thread_id for thread_id in thread_ids if thread_id]))
             
-            # Get full email content
-            full_email = self.gmail_service.get_email(email['id'])
+            failed_ids = []
+            if candidate_ids:
+                failed_ids = self._process_threads(candidate_ids, progress, use_cache=False)
+            
+            if history['history_id'] != history_id:
+                self.store.set_meta('history_id', history['history_id'])
+            if failed_ids != pending_ids:
+                self.store.set_meta('pending_thread_ids', failed_ids)
+            return True
+        
+        # Retry messages that failed to fetch on the previous sync
+        pending_ids = self.store.get_meta('pending_ids', [])
+        candidate_ids = list(dict.fromkeys(pending_ids + history['added']))
+        new_ids = self.store.filter_unseen_ids(candidate_ids)
+        
+        failed_ids = []
+        if new_ids:
+            failed_ids = self._process_new_emails(new_ids, progress)
+        
+        if history['history_id'] != history_id:
+            self.store.set_meta('history_id', history['history_id'])
+        if failed_ids != pending_ids:
+            self.store.set_meta('pending_ids', failed_ids)
+        return True
+    
+    def _process_new_emails(self, new_ids, progress=None):
+        """Fetch, score and store emails that have not been processed yet.
+        
+        Returns the IDs that could not be fetched.
+        """
+        if progress:
+            progress(total=len(new_ids))
+        
+        # Get full email content for all new emails in batched requests
+        full_emails = self.gmail_service.get_emails_batch(
+            new_ids,
+            batch_size=self.settings.get('gmail_batch_size')
+        )
+        
+        # Process each email to identify important ones
+        failed_ids = []
+        new_emails = []
+        indexed_emails = []
+        features_by_id = {}
+        for email_id in new_ids:
+            full_email = full_emails.get(email_id)
+            if not full_email:
+                # Leave it unprocessed so the next refresh retries it
+                failed_ids.append(email_id)
+                continue
             
-            # Calculate importance score
-            importance_score = self._calculate_importance(full_email)
+            # Calculate importance score, keeping the features for later reweighting
+            features = self.scorer.extract_features(full_email)
+            features_by_id[email_id] = features
+            importance_score = self.scorer.score_features(features)
             
             # Add all emails to important_emails list with their importance score
             # This change allows us to see all emails in the dashboard, not just "important" ones
-            important_email = {
+            new_emails.append({
                 'id': full_email['id'],
                 'threadId': full_email['threadId'],
                 'sender': full_email['sender'],
@@ -62,44 +191,242 @@ class EmailProcessor:
                 'processed': False,
                 'importance_score': importance_score,
                 'identified_at': datetime.now().isoformat()
-            }
+            })
+            indexed_emails.append(full_email)
+        
+        if progress:
+            progress(fetched=len(new_emails), failed=len(failed_ids))
+        
+        # Save updated data and mark as processed
+        self.store.upsert_emails(new_emails)
+        self.store.upsert_features(features_by_id, self._feature_signature)
+        self.store.index_for_search(indexed_emails)
+        self.store.add_seen_ids(email['id'] for email in new_emails)
+        if progress:
+            progress(scored=len(new_emails))
+        return failed_ids
+    
+    @staticmethod
+    def _thread_email(thread):
+        """The email that represents a thread: its latest received message, with
+        the new text of every message in the thread (newest first) as body"""
+        messages = thread['messages']
+        received = [message for message in messages if 'SENT' not in message.get('labelIds', [])]
+        latest = (received or messages)[-1]
+        # Quoted history is dropped, so text repeated down the thread counts once
+        body = '\n\n'.join(
+            text for text in (strip_quoted(message.get('body', '')) for message in reversed(messages)) if text
+        )
+        return dict(latest, body=body, message_count=len(messages))
+    
+    def _process_threads(self, thread_ids, progress=None, min_history_ids=None, use_cache=True):
+        """Fetch, score and store threads that are new or have changed.
+        
+        Each thread is stored as one row keyed by its latest received message,
+        replacing the row for any earlier message of the thread. Returns the
+        thread IDs that could not be fetched.
+        """
+        if progress:
+            progress(total=len(thread_ids))
+        
+        threads = self.gmail_service.get_threads_batch(
+            thread_ids,
+            batch_size=self.settings.get('gmail_batch_size'),
+            min_history_ids=min_history_ids,
+            use_cache=use_cache
+        )
+        
+        failed_ids = []
+        new_emails = []
+        indexed_emails = []
+        features_by_id = {}
+        superseded_ids = []
+        seen_ids = []
+        thread_rows = []
+        for thread_id in thread_ids:
+            thread = threads.get(thread_id)
+            if not thread or not thread['messages']:
+                # Left pending so the next refresh retries it
+                failed_ids.append(thread_id)
+                continue
             
-            self.emails['important_emails'].append(important_email)
+            email = self._thread_email(thread)
+            features = self.scorer.extract_features(email)
+            features_by_id[email['id']] = features
+            
+            # A thread refetched for a label change keeps its processed flag
+            existing = self.store.get_email(email['id'])
+            new_emails.append({
+                'id': email['id'],
+                'threadId': thread_id,
+                'sender': email['sender'],
+                'subject': email['subject'],
+                'date': email['date'],
+                'snippet': email['snippet'],
+                'processed': existing['processed'] if existing else False,
+                'importance_score': self.scorer.score_features(features),
+                'identified_at': existing['identified_at'] if existing else datetime.now().isoformat()
+            })
+            indexed_emails.append(email)
+            superseded_ids.extend(
+                email_id for email_id in self.store.get_thread_email_ids(thread_id) if email_id != email['id']
+            )
+            seen_ids.extend(message['id'] for message in thread['messages'])
+            thread_rows.append((thread_id, thread.get('historyId'), email['id'], len(thread['messages'])))
         
-        # Save updated data
-        self._save_data()
+        if progress:
+            progress(fetched=len(new_emails), failed=len(failed_ids))
+        
+        if superseded_ids:
+            self.store.remove_emails(superseded_ids)
+        self.store.upsert_emails(new_emails)
+        self.store.upsert_features(features_by_id, self._feature_signature)
+        self.store.index_for_search(indexed_emails)
+        self.store.add_seen_ids(seen_ids)
+        self.store.upsert_threads(thread_rows)
+        if progress:
+            progress(scored=len(new_emails))
+        return failed_ids
+    
+    def fetch_for_scoring(self, email_ids):
+        """Full emails to extract features from, by ID.
+        
+        In thread mode a thread's row is featurized from the whole thread, as
+        when it was ingested; rows for single messages are fetched as before.
+        """
+        emails = {}
+        if self._thread_mode():
+            rows = {email_id: self.store.get_email(email_id) for email_id in email_ids}
+            thread_ids = list(dict.fromkeys(row['threadId'] for row in rows.values() if row and row.get('threadId')))
+            threads = self.gmail_service.get_threads_batch(
+                thread_ids,
+                batch_size=self.settings.get('gmail_batch_size')
+            )
+            for email_id, row in rows.items():
+                thread = threads.get(row['threadId']) if row and row.get('threadId') else None
+                email = self._thread_email(thread) if thread and thread['messages'] else None
+                if email is not None and email['id'] == email_id:
+                    emails[email_id] = email
+        
+        remaining_ids = [email_id for email_id in email_ids if email_id not in emails]
+        if remaining_ids:
+            emails.update(self.gmail_service.get_emails_batch(
+                remaining_ids,
+                batch_size=self.settings.get('gmail_batch_size')
+            ))
+        return emails
     
     def get_important_emails(self):
         """Get the list of important emails"""
-        # Sort by importance score and date (newest first)
-        sorted_emails = sorted(
-            self.emails['important_emails'],
-            key=lambda x: (x['processed'], -x['importance_score'], x['date']),
-            reverse=True
-        )
-        
-        return sorted_emails
+        return self.store.get_all_emails()
+    
+    def query_emails(self, **filters):
+        """Get one filtered, sorted page of emails (see EmailStore.query_emails)"""
+        return self.store.query_emails(**filters)
+    
+    def search_emails(self, text, limit=20, offset=0):
+        """Full-text search over subject, sender, snippet and body"""
+        return self.store.search_emails(text, limit=limit, offset=offset)
+    
+    def get_aggregates(self, grouping):
+        """Get precomputed per-group counts and importance totals"""
+        return self.store.get_aggregates(grouping)
+    
+    def get_summary(self):
+        """Get overall email counts for the dashboard"""
+        return self.store.get_summary()
     
     def mark_as_processed(self, email_id):
         """Mark an email as processed"""
-        for email in self.emails['important_emails']:
-            if email['id'] == email_id:
-                email['processed'] = True
+        self.store.mark_processed(email_id)
+    
+    def recalculate_importance_scores(self, progress=None):
+        """Recalculate importance scores for all emails.
+        
+        progress works as in refresh_emails. Returns the number of scores
+        that changed.
+        """
+        self._update_settings(config.settings_snapshot())
+        
+        # Only emails featurized under different keywords or senders need their content
+        stale_ids = self.store.get_stale_feature_ids(self._feature_signature)
+        if stale_ids:
+            # Get full email content to re-extract features, in batched requests
+            full_emails = self.fetch_for_scoring(stale_ids)
+            features_by_id = {
+                email_id: self.scorer.extract_features(email) for email_id, email in full_emails.items() if email
+            }
+            self.store.upsert_features(features_by_id, self._feature_signature)
+            if progress:
+                progress(fetched=len(features_by_id), failed=len(stale_ids) - len(features_by_id))
         
-        self._save_data()
+        # Save updated data
+        ids, new_scores, changed = self.compute_score_changes()
+        self.save_scores(ids, new_scores, changed)
+        if progress:
+            progress(scored=len(ids), changed=len(changed))
+        return len(changed)
+    
+    def save_scores(self, ids, new_scores, changed):
+        """Write the changed scores returned by compute_score_changes"""
+        self.store.update_scores((ids[i], as_score(new_scores[i])) for i in changed)
+        if self._feature_cache is not None and self._feature_cache[1] is ids:
+            self._feature_cache = self._feature_cache[:3] + (new_scores,)
     
-    def recalculate_importance_scores(self):
-        """Recalculate importance scores for all emails"""
-        for email in self.emails['important_emails']:
-         # Get full email content to recalculate
-            full_email = self.gmail_service.get_email(email['id'])
-            email['importance_score'] = self._calculate_importance(full_email)
+    def compute_score_changes(self, override_features=None):
+        """Score every featurized email with the current weights.
+        
+        override_features maps email IDs to feature dicts to use instead of the
+        stored ones (e.g. freshly extracted but not yet saved). Returns
+        (ids, new scores, indexes of the emails whose score changed).
+        """
+        # Reweighting is one matrix-vector product over the stored features
+        ids, feature_matrix, old_scores = self._load_feature_matrix()
+        if override_features:
+            feature_matrix = feature_matrix.copy()
+            for i, email_id in enumerate(ids):
+                if email_id in override_features:
+                    feature_matrix[i] = [override_features[email_id][name] for name in FEATURE_NAMES]
+            
+            # Emails that had no stored features yet
+            known_ids = set(ids)
+            extra_ids = [email_id for email_id in override_features if email_id not in known_ids]
+            extra_emails = [self.store.get_email(email_id) for email_id in extra_ids]
+            extra_ids = [email['id'] for email in extra_emails if email]
+            if extra_ids:
+                ids = ids + extra_ids
+                feature_matrix = np.vstack([feature_matrix, [
+                    [override_features[email_id][name] for name in FEATURE_NAMES] for email_id in extra_ids
+                ]])
+                old_scores = np.concatenate([old_scores, [
+                    email['importance_score'] for email in extra_emails if email
+                ]])
+        
+        new_scores = self.scorer.score_matrix(feature_matrix)
+        changed = np.flatnonzero(new_scores != old_scores)
+        return ids, new_scores, changed
     
-    # Save updated data
-        self._save_data()
+    def _load_feature_matrix(self):
+        """Get (ids, feature matrix, current scores), reusing the last load if unchanged"""
+        if self._feature_cache is not None and self._feature_cache[0] == self.store.features_version:
+            return self._feature_cache[1:]
+        
+        rows = self.store.get_feature_rows()
+        ids = [row[0] for row in rows]
+        feature_matrix = np.array([row[2] for row in rows], dtype=np.float64).reshape(len(rows), len(FEATURE_NAMES))
+        scores = np.array([row[1] for row in rows], dtype=np.float64)
+        self._feature_cache = (self.store.features_version, ids, feature_matrix, scores)
+        return ids, feature_matrix, scores
 
     def _calculate_importance(self, email):
         """Calculate an importance score for the email based on configurable weights"""
+        return self.scorer.score(email)
+    
+    def _calculate_importance_reference(self, email):
+        """Straightforward per-keyword version of _calculate_importance.
+        
+        Kept as the reference implementation the compiled scorer must agree with.
+        """
         score = 0
         
         # Get importance criteria from settings
@@ -0,0 +1,702 @@
+"""
+SQLite storage for tracked emails.
+Replaces the single email_data.json document with indexed tables so that
+writes are single-row upserts and lookups do not scan every email.
+"""
+
+import base64
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from email.utils import parseaddr, parsedate_to_datetime
+from importance_scorer import FEATURE_NAMES
+
+def parse_timestamp(date_string):
+    """Convert an RFC 2822 Date header to a UNIX timestamp, or None"""
+    if not date_string:
+        return None
+    try:
+        return parsedate_to_datetime(date_string).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def sender_domain(sender):
+    """Get the lowercased domain of a From header"""
+    address = parseaddr(sender or '')[1]
+    if '@' not in address:
+        return ''
+    return address.rsplit('@', 1)[1].lower()
+
+def sender_name(sender):
+    """Display name part of a From header, as the dashboard shows it"""
+    name = (sender or '').split('<')[0].strip()
+    return name or 'Unknown'
+
+# Dashboard priority bands and the lowest score in each, highest first
+PRIORITY_BANDS = [
+    ('High Priority', 10),
+    ('Medium Priority', 7),
+    ('Low Priority', 4),
+    ('Very Low Priority', None)
+]
+
+def priority_band(score):
+    """Dashboard priority band for an importance score"""
+    for band, lowest in PRIORITY_BANDS:
+        if lowest is None or score >= lowest:
+            return band
+
+def day_key(timestamp):
+    """Local calendar day (YYYY-MM-DD) of a timestamp"""
+    if not timestamp:
+        return 'Unknown Date'
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+
+# Groupings maintained in the aggregates table, keyed from an emails row
+AGGREGATE_GROUPINGS = {
+    'domain': lambda row: row['sender_domain'] or 'Unknown',
+    'sender': lambda row: sender_name(row['sender']),
+    'priority': lambda row: priority_band(row['importance_score']),
+    'day': lambda row: day_key(row['timestamp']),
+    'status': lambda row: 'processed' if row['processed'] else 'unprocessed'
+}
+
+def group_condition(grouping, key):
+    """SQL condition and params selecting the emails counted under an
+    aggregates key, so a dashboard group filters to exactly its rows"""
+    if grouping == 'domain':
+        return 'sender_domain = ?', ['' if key == 'Unknown' else key.lower()]
+    if grouping == 'sender':
+        return 'sender_name(sender) = ?', [key]
+    if grouping == 'priority':
+        bands = [lowest for _, lowest in PRIORITY_BANDS]
+        names = [band for band, _ in PRIORITY_BANDS]
+        if key not in names:
+            raise ValueError(f"Unknown priority band: {key}")
+        index = names.index(key)
+        # Half-open [lowest, next band's lowest), so fractional scores fall in one band
+        conditions, params = [], []
+        if bands[index] is not None:
+            conditions.append('importance_score >= ?')
+            params.append(bands[index])
+        if index > 0:
+            conditions.append('importance_score < ?')
+            params.append(bands[index - 1])
+        return ' AND '.join(conditions), params
+    if grouping == 'day':
+        if key == 'Unknown Date':
+            return '(timestamp IS NULL OR timestamp = 0)', []
+        try:
+            day = datetime.strptime(key, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"Invalid day: {key}")
+        # Local midnight to the next local midnight, whatever the day's length
+        return 'timestamp >= ? AND timestamp < ?', [day.timestamp(), (day + timedelta(days=1)).timestamp()]
+    if grouping == 'status':
+        return 'processed = ?', [1 if key == 'processed' else 0]
+    raise ValueError(f"Unsupported grouping: {grouping}")
+
+# Above this many changed rows, rebuilding aggregates beats applying deltas
+_AGGREGATE_REBUILD_THRESHOLD = 2000
+
+# bm25 column weights for subject, sender, snippet and body
+_SEARCH_WEIGHTS = (5.0, 3.0, 2.0, 1.0)
+
+def build_search_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    return ' '.join('"' + word + '"*' for word in words)
+
+# API sort keys and what they order by ('date' sorts by the parsed timestamp).
+# Nullable columns are coalesced so keyset cursors never compare with NULL.
+SORT_COLUMNS = {
+    'importance_score': 'importance_score',
+    'date': 'timestamp',
+    'timestamp': 'timestamp',
+    'sender': "COALESCE(sender, '')",
+    'subject': "COALESCE(subject, '')",
+    'identified_at': "COALESCE(identified_at, '')"
+}
+
+def _encode_cursor(value, email_id):
+    """Opaque page cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps([value, email_id]).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """Inverse of _encode_cursor"""
+    try:
+        value, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return value, email_id
+
+class EmailStore:
+    """Indexed SQLite store for tracked emails, processed IDs and sync state"""
+
+    def __init__(self, db_path='email_store.db', legacy_json_path='email_data.json'):
+        """Open (or create) the store, migrating legacy JSON data on first use"""
+        self.db_path = db_path
+        # Bumped whenever stored feature vectors change, so callers can cache them
+        self.features_version = 0
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.create_function('sender_name', 1, sender_name, deterministic=True)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+
+        # Stores created before the aggregates table existed already hold emails
+        if self.get_meta('aggregates_built') is None:
+            with self._lock:
+                self._rebuild_aggregates()
+                self._conn.commit()
+
+        if legacy_json_path and os.path.exists(legacy_json_path) and self.get_meta('migrated_from_json') is None:
+            self._migrate_from_json(legacy_json_path)
+
+    def _create_schema(self):
+        """Create tables and indexes if they do not exist"""
+        with self._lock:
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS emails (
+                    id TEXT PRIMARY KEY,
+                    thread_id TEXT,
+                    sender TEXT,
+                    sender_domain TEXT,
+                    subject TEXT,
+                    date TEXT,
+                    timestamp REAL,
+                    snippet TEXT,
+                    processed INTEGER NOT NULL DEFAULT 0,
+                    importance_score NUMERIC NOT NULL DEFAULT 0,
+                    identified_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_emails_thread_id ON emails (thread_id);
+                CREATE INDEX IF NOT EXISTS idx_emails_sender_domain ON emails (sender_domain);
+                CREATE INDEX IF NOT EXISTS idx_emails_processed ON emails (processed);
+
+                -- Composite (sort key, id) indexes back keyset pagination
+                DROP INDEX IF EXISTS idx_emails_timestamp;
+                DROP INDEX IF EXISTS idx_emails_importance;
+                CREATE INDEX IF NOT EXISTS idx_emails_timestamp_id ON emails (timestamp, id);
+                CREATE INDEX IF NOT EXISTS idx_emails_importance_id ON emails (importance_score, id);
+                UPDATE emails SET timestamp = 0 WHERE timestamp IS NULL;
+
+                CREATE TABLE IF NOT EXISTS email_features (
+                    id TEXT PRIMARY KEY,
+                    signature TEXT NOT NULL,
+                    subject_keyword INTEGER NOT NULL,
+                    body_keyword INTEGER NOT NULL,
+                    important_sender INTEGER NOT NULL,
+                    question_mark INTEGER NOT NULL,
+                    direct_message INTEGER NOT NULL,
+                    email_length INTEGER NOT NULL,
+                    direct_address INTEGER NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS aggregates (
+                    grouping TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total_importance REAL NOT NULL,
+                    PRIMARY KEY (grouping, key)
+                ) WITHOUT ROWID;
+
+                -- Full-text index over tracked emails; rowid matches emails.rowid
+                CREATE VIRTUAL TABLE IF NOT EXISTS email_search USING fts5(
+                    subject, sender, snippet, body,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                );
+
+                CREATE TABLE IF NOT EXISTS processed_ids (
+                    id TEXT PRIMARY KEY
+                ) WITHOUT ROWID;
+
+                -- Threads ingested as a whole, tracked by the message that represents them
+                CREATE TABLE IF NOT EXISTS threads (
+                    id TEXT PRIMARY KEY,
+                    history_id TEXT,
+                    latest_id TEXT,
+                    message_count INTEGER NOT NULL
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            ''')
+            self._conn.commit()
+
+    def _migrate_from_json(self, json_path):
+        """One-time import of the old email_data.json document"""
+        try:
+            with open(json_path, 'r') as file:
+                data = json.load(file)
+        except Exception as e:
+            print(f"Error reading legacy email data for migration: {str(e)}")
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO processed_ids (id) VALUES (?)',
+                [(email_id,) for email_id in data.get('processed_ids', [])]
+            )
+            for email in data.get('important_emails', []):
+                self._upsert(email)
+            self._set_meta('migrated_from_json', json_path)
+
+            # Bring over the sync state that used to live next to the JSON file
+            sync_state_file = os.path.join(os.path.dirname(json_path), 'email_sync_state.json')
+            if os.path.exists(sync_state_file):
+                try:
+                    with open(sync_state_file, 'r') as file:
+                        sync_state = json.load(file)
+                    self._set_meta('history_id', sync_state.get('history_id'))
+                    self._set_meta('pending_ids', sync_state.get('pending_ids', []))
+                except Exception as e:
+                    print(f"Error reading legacy sync state for migration: {str(e)}")
+
+            self._conn.commit()
+
+        print(f"Migrated {len(data.get('important_emails', []))} emails from {json_path} to {self.db_path}")
+
+    def _row_to_email(self, row):
+        """Convert a database row to the email dict used by the API"""
+        return {
+            'id': row['id'],
+            'threadId': row['thread_id'],
+            'sender': row['sender'],
+            'subject': row['subject'],
+            'date': row['date'],
+            'snippet': row['snippet'],
+            'processed': bool(row['processed']),
+            'importance_score': row['importance_score'],
+            'identified_at': row['identified_at']
+        }
+
+    def _apply_aggregates(self, row, sign):
+        """Add (sign=1) or remove (sign=-1) one emails row from the aggregates (caller holds the lock)"""
+        for grouping, key_for in AGGREGATE_GROUPINGS.items():
+            self._conn.execute('''
+                INSERT INTO aggregates (grouping, key, count, total_importance) VALUES (?, ?, ?, ?)
+                ON CONFLICT(grouping, key) DO UPDATE SET
+                    count = count + excluded.count,
+                    total_importance = total_importance + excluded.total_importance
+            ''', (grouping, key_for(row), sign, sign * row['importance_score']))
+
+    def _rebuild_aggregates(self):
+        """Recompute the aggregates table from the emails table (caller holds the lock)"""
+        totals = {}
+        for row in self._conn.execute(
+            'SELECT sender, sender_domain, timestamp, importance_score, processed FROM emails'
+        ):
+            for grouping, key_for in AGGREGATE_GROUPINGS.items():
+                entry = totals.setdefault((grouping, key_for(row)), [0, 0])
+                entry[0] += 1
+                entry[1] += row['importance_score']
+
+        self._conn.execute('DELETE FROM aggregates')
+        self._conn.executemany(
+            'INSERT INTO aggregates (grouping, key, count, total_importance) VALUES (?, ?, ?, ?)',
+            [(grouping, key, count, total) for (grouping, key), (count, total) in totals.items()]
+        )
+        self._conn.execute('DELETE FROM aggregates WHERE count <= 0')
+        self._set_meta('aggregates_built', True)
+
+    def _get_row(self, email_id):
+        """Fetch the raw emails row for an ID (caller holds the lock)"""
+        return self._conn.execute('SELECT rowid, * FROM emails WHERE id = ?', (email_id,)).fetchone()
+
+    def _upsert(self, email):
+        """Insert or update one email row (caller holds the lock)"""
+        old_row = self._get_row(email['id'])
+        if old_row is not None:
+            self._apply_aggregates(old_row, -1)
+
+        self._conn.execute('''
+            INSERT INTO emails (id, thread_id, sender, sender_domain, subject, date, timestamp,
+                                snippet, processed, importance_score, identified_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                thread_id = excluded.thread_id,
+                sender = excluded.sender,
+                sender_domain = excluded.sender_domain,
+                subject = excluded.subject,
+                date = excluded.date,
+                timestamp = excluded.timestamp,
+                snippet = excluded.snippet,
+                processed = excluded.processed,
+                importance_score = excluded.importance_score,
+                identified_at = excluded.identified_at
+        ''', (
+            email['id'],
+            email.get('threadId'),
+            email.get('sender', ''),
+            sender_domain(email.get('sender', '')),
+            email.get('subject', ''),
+            email.get('date', ''),
+            # Unparseable dates sort as oldest
+            parse_timestamp(email.get('date', '')) or 0,
+            email.get('snippet', ''),
+            1 if email.get('processed') else 0,
+            email.get('importance_score', 0),
+            email.get('identified_at')
+        ))
+        self._apply_aggregates(self._get_row(email['id']), 1)
+
+    def upsert_emails(self, emails):
+        """Insert or update several emails in one transaction"""
+        with self._lock:
+            for email in emails:
+                self._upsert(email)
+            self._conn.execute('DELETE FROM aggregates WHERE count <= 0')
+            self._conn.commit()
+
+    def upsert_email(self, email):
+        """Insert or update one email"""
+        self.upsert_emails([email])
+
+    def get_email(self, email_id):
+        """Get one tracked email, or None"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM emails WHERE id = ?', (email_id,)).fetchone()
+        return self._row_to_email(row) if row else None
+
+    def get_all_emails(self):
+        """Get every tracked email, in the order the dashboard has always used"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM emails ORDER BY processed DESC, importance_score ASC, timestamp DESC'
+            ).fetchall()
+        return [self._row_to_email(row) for row in rows]
+
+    def query_emails(self, limit=None, cursor=None, min_score=None, max_score=None, processed=None,
+                     since=None, until=None, sender=None, domain=None, group=None,
+                     sort='importance_score', order='desc'):
+        """Filter, sort and page tracked emails using the table indexes.
+
+        sort is one of SORT_COLUMNS; processed is True/False or None for both;
+        since/until are UNIX timestamps; group is a (grouping, key) pair from
+        get_aggregates (see group_condition). Paging is keyset-based: pass the
+        returned next_cursor back to get the following page. Returns
+        (emails, next_cursor, total matching emails).
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort key: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Unsupported sort order: {order}")
+        column = SORT_COLUMNS[sort]
+
+        conditions = []
+        params = []
+        if min_score is not None:
+            conditions.append('importance_score >= ?')
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append('importance_score <= ?')
+            params.append(max_score)
+        if processed is not None:
+            conditions.append('processed = ?')
+            params.append(1 if processed else 0)
+        if since is not None:
+            conditions.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('timestamp < ?')
+            params.append(until)
+        if domain:
+            conditions.append('sender_domain = ?')
+            params.append(domain.lower())
+        if sender:
+            conditions.append("sender LIKE ? ESCAPE '\\'")
+            params.append('%' + sender.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if group is not None:
+            condition, condition_params = group_condition(*group)
+            if condition:
+                conditions.append(condition)
+                params.extend(condition_params)
+
+        filter_sql = ' AND '.join(conditions) or '1'
+        filter_params = list(params)
+
+        if cursor:
+            last_value, last_id = _decode_cursor(cursor)
+            comparison = '<' if order == 'desc' else '>'
+            conditions.append(f'({column} {comparison} ? OR ({column} = ? AND id {comparison} ?))')
+            params.extend([last_value, last_value, last_id])
+
+        sql = (f"SELECT *, {column} AS sort_value FROM emails WHERE {' AND '.join(conditions) or '1'} "
+               f"ORDER BY {column} {order}, id {order}")
+        if limit is not None:
+            # One extra row tells us whether there is another page
+            sql += ' LIMIT ?'
+            params.append(int(limit) + 1)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            total = self._conn.execute(f'SELECT COUNT(*) FROM emails WHERE {filter_sql}', filter_params).fetchone()[0]
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]['sort_value'], rows[-1]['id'])
+
+        return [self._row_to_email(row) for row in rows], next_cursor, total
+
+    def count_emails(self):
+        """Get the number of tracked emails"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM emails').fetchone()[0]
+
+    def remove_emails(self, email_ids):
+        """Stop tracking the given emails (they stay marked as seen)"""
+        with self._lock:
+            for email_id in email_ids:
+                row = self._get_row(email_id)
+                if row is not None:
+                    self._apply_aggregates(row, -1)
+                    self._conn.execute('DELETE FROM email_search WHERE rowid = ?', (row['rowid'],))
+            self._conn.execute('DELETE FROM aggregates WHERE count <= 0')
+            self._conn.executemany('DELETE FROM emails WHERE id = ?', [(email_id,) for email_id in email_ids])
+            self._conn.executemany('DELETE FROM email_features WHERE id = ?', [(email_id,) for email_id in email_ids])
+            self._conn.commit()
+            self.features_version += 1
+
+    def _update_rows(self, sql, params_list):
+        """Run an UPDATE per row, keeping the aggregates in step (caller holds the lock).
+
+        Each params tuple must end with the email ID.
+        """
+        if len(params_list) > _AGGREGATE_REBUILD_THRESHOLD:
+            self._conn.executemany(sql, params_list)
+            self._rebuild_aggregates()
+            return
+
+        for params in params_list:
+            old_row = self._get_row(params[-1])
+            if old_row is None:
+                continue
+            self._apply_aggregates(old_row, -1)
+            self._conn.execute(sql, params)
+            self._apply_aggregates(self._get_row(params[-1]), 1)
+        self._conn.execute('DELETE FROM aggregates WHERE count <= 0')
+
+    def mark_processed(self, email_id, processed=True):
+        """Set the processed flag of one email"""
+        with self._lock:
+            self._update_rows('UPDATE emails SET processed = ? WHERE id = ?', [(1 if processed else 0, email_id)])
+            self._conn.commit()
+
+    def update_scores(self, scores):
+        """Update importance scores from an iterable of (email_id, score)"""
+        with self._lock:
+            self._update_rows(
+                'UPDATE emails SET importance_score = ? WHERE id = ?',
+                [(score, email_id) for email_id, score in scores]
+            )
+            self._conn.commit()
+
+    def index_for_search(self, emails):
+        """Add or refresh full emails (with 'body') in the full-text index.
+
+        Emails that are not tracked in the emails table are skipped.
+        """
+        with self._lock:
+            for email in emails:
+                row = self._conn.execute('SELECT rowid FROM emails WHERE id = ?', (email['id'],)).fetchone()
+                if row is None:
+                    continue
+                self._conn.execute('DELETE FROM email_search WHERE rowid = ?', (row[0],))
+                self._conn.execute(
+                    'INSERT INTO email_search (rowid, subject, sender, snippet, body) VALUES (?, ?, ?, ?, ?)',
+                    (row[0], email.get('subject', ''), email.get('sender', ''),
+                     email.get('snippet', ''), email.get('body', ''))
+                )
+            self._conn.commit()
+
+    def get_unindexed_ids(self):
+        """IDs of tracked emails missing from the full-text index"""
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT emails.id FROM emails
+                WHERE NOT EXISTS (SELECT 1 FROM email_search WHERE email_search.rowid = emails.rowid)
+            ''').fetchall()
+        return [row['id'] for row in rows]
+
+    def search_emails(self, text, limit=20, offset=0):
+        """Full-text search; returns (emails ranked best first, total matches).
+
+        Every word in text must match the start of a word in the subject,
+        sender, snippet or body. Each result has a 'match' excerpt.
+        """
+        query = build_search_query(text)
+        if not query:
+            return [], 0
+
+        with self._lock:
+            rows = self._conn.execute(f'''
+                SELECT emails.*, snippet(email_search, -1, '[', ']', '...', 12) AS match
+                FROM email_search JOIN emails ON emails.rowid = email_search.rowid
+                WHERE email_search MATCH ?
+                ORDER BY bm25(email_search, {', '.join(str(weight) for weight in _SEARCH_WEIGHTS)})
+                LIMIT ? OFFSET ?
+            ''', (query, int(limit), int(offset))).fetchall()
+            total = self._conn.execute(
+                'SELECT COUNT(*) FROM email_search WHERE email_search MATCH ?', (query,)
+            ).fetchone()[0]
+
+        results = []
+        for row in rows:
+            email = self._row_to_email(row)
+            email['match'] = row['match']
+            results.append(email)
+        return results, total
+
+    def get_aggregates(self, grouping):
+        """Get [{name, count, total_importance, avg_importance}] for one grouping"""
+        if grouping not in AGGREGATE_GROUPINGS:
+            raise ValueError(f"Unsupported grouping: {grouping}")
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, count, total_importance FROM aggregates WHERE grouping = ? ORDER BY key',
+                (grouping,)
+            ).fetchall()
+        return [
+            {
+                'name': row['key'],
+                'count': row['count'],
+                'total_importance': row['total_importance'],
+                'avg_importance': row['total_importance'] / row['count']
+            }
+            for row in rows
+        ]
+
+    def get_summary(self):
+        """Overall counts for the dashboard summary card"""
+        status = {group['name']: group for group in self.get_aggregates('status')}
+        total = sum(group['count'] for group in status.values())
+        total_importance = sum(group['total_importance'] for group in status.values())
+        with self._lock:
+            unique_senders = self._conn.execute(
+                "SELECT COUNT(*) FROM aggregates WHERE grouping = 'sender'"
+            ).fetchone()[0]
+        return {
+            'total_emails': total,
+            'avg_importance': total_importance / total if total else 0,
+            'unprocessed_emails': status.get('unprocessed', {}).get('count', 0),
+            'unique_senders': unique_senders
+        }
+
+    def upsert_features(self, features_by_id, signature):
+        """Store extracted feature dicts (keyed by email ID) for a feature signature"""
+        with self._lock:
+            self._conn.executemany(
+                f'''INSERT OR REPLACE INTO email_features (id, signature, {', '.join(FEATURE_NAMES)})
+                    VALUES (?, ?, {', '.join('?' * len(FEATURE_NAMES))})''',
+                [
+                    (email_id, signature) + tuple(features[name] for name in FEATURE_NAMES)
+                    for email_id, features in features_by_id.items()
+                ]
+            )
+            self._conn.commit()
+            self.features_version += 1
+
+    def get_stale_feature_ids(self, signature):
+        """IDs of tracked emails without features for the given signature"""
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT emails.id FROM emails
+                LEFT JOIN email_features ON email_features.id = emails.id
+                WHERE email_features.signature IS NULL OR email_features.signature != ?
+            ''', (signature,)).fetchall()
+        return [row['id'] for row in rows]
+
+    def get_feature_rows(self):
+        """Get (email_id, importance_score, feature tuple) for every featurized email"""
+        with self._lock:
+            rows = self._conn.execute(f'''
+                SELECT emails.id, emails.importance_score, {', '.join('email_features.' + name for name in FEATURE_NAMES)}
+                FROM emails JOIN email_features ON email_features.id = emails.id
+            ''').fetchall()
+        return [(row[0], row[1], tuple(row[2:])) for row in rows]
+
+    def filter_unseen_ids(self, email_ids):
+        """Return the IDs (in order) that have never been processed"""
+        ids = list(email_ids)
+        seen = set()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT id FROM processed_ids WHERE id IN ({placeholders})', chunk
+                ).fetchall()
+                seen.update(row['id'] for row in rows)
+        return [email_id for email_id in ids if email_id not in seen]
+
+    def add_seen_ids(self, email_ids):
+        """Record IDs as processed so later refreshes skip them"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO processed_ids (id) VALUES (?)',
+                [(email_id,) for email_id in email_ids]
+            )
+            self._conn.commit()
+
+    def forget_seen_ids(self, email_ids):
+        """Unmark IDs as processed, so they are picked up again if they come back"""
+        with self._lock:
+            self._conn.executemany('DELETE FROM processed_ids WHERE id = ?', [(email_id,) for email_id in email_ids])
+            self._conn.commit()
+
+    def get_thread_history_ids(self, thread_ids):
+        """Map the given thread IDs to the historyId they were last ingested at"""
+        ids = list(thread_ids)
+        history_ids = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT id, history_id FROM threads WHERE id IN ({placeholders})', chunk
+                ).fetchall()
+                history_ids.update((row['id'], row['history_id']) for row in rows)
+        return history_ids
+
+    def upsert_threads(self, threads):
+        """Record ingested threads from an iterable of (thread_id, history_id, latest_id, message_count)"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO threads (id, history_id, latest_id, message_count) VALUES (?, ?, ?, ?)',
+                list(threads)
+            )
+            self._conn.commit()
+
+    def get_thread_email_ids(self, thread_id):
+        """IDs of the tracked emails in a thread"""
+        with self._lock:
+            rows = self._conn.execute('SELECT id FROM emails WHERE thread_id = ?', (thread_id,)).fetchall()
+        return [row['id'] for row in rows]
+
+    def _set_meta(self, key, value):
+        """Store a JSON value in the meta table (caller holds the lock)"""
+        self._conn.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value))
+        )
+
+    def set_meta(self, key, value):
+        """Store a JSON-serialisable value under key"""
+        with self._lock:
+            self._set_meta(key, value)
+            self._conn.commit()
+
+    def get_meta(self, key, default=None):
+        """Get a value stored with set_meta"""
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
@@ -0,0 +1,39 @@
+"""
+In-process publish/subscribe for server events.
+Background work (such as the scheduled mail poller) publishes events here
+and each connected client gets its own bounded queue, relayed to the
+browser as Server-Sent Events.
+"""
+
+import queue
+import threading
+
+class EventBus:
+    """Fans published events out to every subscriber's queue"""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Get a new queue that receives (event, data) tuples"""
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Stop delivering events to a queue"""
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data=None):
+        """Deliver an event to all subscribers; slow ones miss it rather than block"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                pass
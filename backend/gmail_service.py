@@ -1,14 +1,21 @@
 import os
 import base64
 import json
+import threading
 from email.mime.text import MIMEText
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import config
+from message_cache import MessageCache
+from thread_cache import ThreadCache
 
 class GmailService:
+    # Gmail accepts up to 100 calls per batch but recommends 50
+    DEFAULT_BATCH_SIZE = 50
+    MAX_BATCH_SIZE = 100
+    
     def __init__(self):
         self.SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
         self.API_SERVICE_NAME = 'gmail'
@@ -16,10 +23,23 @@ class GmailService:
         self.client_secrets_file = os.path.join('credentials', 'client_secret.json')
         self.token_path = os.path.join('credentials', 'gmail_token.json')
         self.creds = None
-        self.service = None
+        # API clients are built per thread, since they are not thread-safe
+        self._local = threading.local()
         
         # Create credentials directory if it doesn't exist
         os.makedirs('credentials', exist_ok=True)
+        
+        # Local cache of full messages so each one is only downloaded once
+        settings = config.settings_snapshot()
+        self.message_cache = None
+        if settings.get('message_cache_enabled', True):
+            self.message_cache = MessageCache(
+                settings.get('message_cache_path', 'message_cache.db'),
+                max_bytes=int(settings.get('message_cache_max_mb', 256)) * 1024 * 1024
+            )
+        
+        # Threads fetched with threads.get, so replying needs no further calls
+        self.thread_cache = ThreadCache(max_threads=int(settings.get('thread_cache_max_threads', 200)))
     
     def get_authorization_url(self):
         """Get the authorization URL for OAuth"""
@@ -54,7 +74,6 @@ class GmailService:
         with open(self.token_path, 'w') as token_file:
             json.dump(token_data, token_file)
         
-        self.service = build(self.API_SERVICE_NAME, self.API_VERSION, credentials=self.creds)
         return True
     
     def authenticate_with_token(self):
@@ -74,14 +93,30 @@ class GmailService:
             scopes=token_data['scopes']
         )
         
-        self.service = build(self.API_SERVICE_NAME, self.API_VERSION, credentials=self.creds)
         return True
     
+    @property
+    def service(self):
+        """Gmail API client for the calling thread, or None before authentication.
+
+        googleapiclient clients share one httplib2 connection that is not
+        thread-safe, and request threads, background jobs and the poller all
+        call Gmail, so each thread gets its own client. They are built from
+        the bundled discovery document, so this makes no network call.
+        """
+        if self.creds is None:
+            return None
+        local = self._local
+        if getattr(local, 'creds', None) is not self.creds:
+            local.service = build(self.API_SERVICE_NAME, self.API_VERSION, credentials=self.creds)
+            local.creds = self.creds
+        return local.service
+    
     def is_authenticated(self):
         """Check if the service is authenticated"""
-        return self.service is not None
+        return self.creds is not None
     
-    def get_recent_emails(self, max_results=50):
+    def get_recent_emails(self, max_results=50, batch_size=None):
         """Get a list of recent emails"""
         try:
             results = self.service.users().messages().list(
@@ -90,103 +125,321 @@ class GmailService:
                 maxResults=max_results
             ).execute()
             
-            messages = results.get('messages', [])
-            emails = []
+            message_ids = [message['id'] for message in results.get('messages', [])]
+            emails = self.get_emails_batch(message_ids, format='metadata', batch_size=batch_size)
             
-            for message in messages:
-                msg = self.service.users().messages().get(
-                    userId='me', 
-                    id=message['id'],
-                    format='metadata',
-                    metadataHeaders=['From', 'Subject', 'Date']
-                ).execute()
-                
-                email_data = {
-                    'id': msg['id'],
-                    'threadId': msg['threadId'],
-                    'snippet': msg['snippet'],
-                    'sender': '',
-                    'subject': '',
-                    'date': ''
-                }
-                
-                # Extract headers
-                headers = msg['payload']['headers']
-                for header in headers:
-                    if header['name'] == 'From':
-                        email_data['sender'] = header['value']
-                    elif header['name'] == 'Subject':
-                        email_data['subject'] = header['value']
-                    elif header['name'] == 'Date':
-                        email_data['date'] = header['value']
-                
-                emails.append(email_data)
-            
-            return emails
+            # Keep the list order and drop messages that failed to fetch
+            return [emails[message_id] for message_id in message_ids if emails.get(message_id)]
             
         except HttpError as error:
             print(f'An error occurred: {error}')
             return []
     
-    def get_email(self, email_id):
-        """Get the full content of an email"""
+    def list_recent_threads(self, max_results=50):
+        """List the newest inbox threads as dicts with 'id', 'historyId' and 'snippet'"""
         try:
-            message = self.service.users().messages().get(
+            results = self.service.users().threads().list(
                 userId='me',
-                id=email_id,
-                format='full'
+                labelIds=['INBOX'],
+                maxResults=max_results
             ).execute()
+            return results.get('threads', [])
+        except HttpError as error:
+            print(f'An error occurred: {error}')
+            return []
+    
+    def get_history_id(self):
+        """Get the mailbox's current historyId"""
+        profile = self.service.users().getProfile(userId='me').execute()
+        return profile['historyId']
+    
+    def get_history(self, start_history_id, label_id='INBOX'):
+        """Get the inbox changes recorded since start_history_id.
+        
+        Returns a dict with the new 'history_id', the message IDs that were
+        'added' to or 'removed' from the label and the 'thread_ids' of added
+        messages, or None if the start ID is too old and
+        a full resync is needed.
+        """
+        added = {}
+        removed = {}
+        thread_ids = {}
+        history_id = start_history_id
+        page_token = None
+        
+        try:
+            while True:
+                request_args = {
+                    'userId': 'me',
+                    'startHistoryId': start_history_id,
+                    'labelId': label_id,
+                    'historyTypes': ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+                }
+                if page_token:
+                    request_args['pageToken'] = page_token
+                
+                results = self.service.users().history().list(**request_args).execute()
+                
+                for record in results.get('history', []):
+                    for item in record.get('messagesAdded', []) + record.get('labelsAdded', []):
+                        thread_ids[item['message']['id']] = item['message'].get('threadId')
+                    # Later records win, so a message added then deleted ends up removed
+                    for item in record.get('messagesAdded', []):
+                        if label_id in item['message'].get('labelIds', []):
+                            removed.pop(item['message']['id'], None)
+                            added[item['message']['id']] = True
+                    for item in record.get('labelsAdded', []):
+                        if label_id in item.get('labelIds', []):
+                            removed.pop(item['message']['id'], None)
+                            added[item['message']['id']] = True
+                    for item in record.get('labelsRemoved', []):
+                        if label_id in item.get('labelIds', []):
+                            added.pop(item['message']['id'], None)
+                            removed[item['message']['id']] = True
+                    for item in record.get('messagesDeleted', []):
+                        added.pop(item['message']['id'], None)
+                        removed[item['message']['id']] = True
+                
+                history_id = results.get('historyId', history_id)
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as error:
+            if error.resp.status == 404:
+                # The start historyId has expired
+                return None
+            raise error
+        
+        return {
+            'history_id': history_id,
+            'added': list(added),
+            'removed': list(removed),
+            'thread_ids': {message_id: thread_ids.get(message_id) for message_id in added}
+        }
+    
+    def get_emails_batch(self, email_ids, format='full', batch_size=None):
+        """Fetch several emails using batched HTTP requests.
+        
+        Returns a dict mapping each message ID to its parsed email data, or to
+        None if that message could not be fetched.
+        """
+        if batch_size is None:
+            batch_size = config.settings_snapshot().get('gmail_batch_size', self.DEFAULT_BATCH_SIZE)
+        batch_size = max(1, min(int(batch_size), self.MAX_BATCH_SIZE))
+        
+        parse = self._parse_metadata if format == 'metadata' else self._parse_message
+        emails = {}
+        
+        # Full messages already in the local cache need no request
+        if format == 'full' and self.message_cache is not None:
+            emails.update(self.message_cache.get_many(email_ids))
+        
+        def callback(request_id, response, exception):
+            if exception is not None:
+                print(f'An error occurred fetching message {request_id}: {exception}')
+                emails[request_id] = None
+                return
+            try:
+                emails[request_id] = parse(response)
+                if format == 'full' and self.message_cache is not None:
+                    self.message_cache.put(emails[request_id])
+            except Exception as e:
+                print(f'An error occurred parsing message {request_id}: {str(e)}')
+                emails[request_id] = None
+        
+        unique_ids = [email_id for email_id in dict.fromkeys(email_ids) if email_id not in emails]
+        for start in range(0, len(unique_ids), batch_size):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for email_id in unique_ids[start:start + batch_size]:
+                batch.add(self._message_get_request(email_id, format), request_id=email_id)
             
-            email_data = {
-                'id': message['id'],
-                'threadId': message['threadId'],
-                'snippet': message['snippet'],
-                'sender': '',
-                'recipient': '',
-                'cc': [],
-                'subject': '',
-                'date': '',
-                'body': '',
-                'body_html': ''
-            }
-            
-            # Extract headers
-            headers = message['payload']['headers']
-            for header in headers:
-                if header['name'] == 'From':
-                    email_data['sender'] = header['value']
-                elif header['name'] == 'To':
-                    email_data['recipient'] = header['value']
-                elif header['name'] == 'Cc':
-                    email_data['cc'] = [cc.strip() for cc in header['value'].split(',')]
-                elif header['name'] == 'Subject':
-                    email_data['subject'] = header['value']
-                elif header['name'] == 'Date':
-                    email_data['date'] = header['value']
-            
-            # Extract body
-            if 'parts' in message['payload']:
-                for part in message['payload']['parts']:
-                    if part['mimeType'] == 'text/plain':
-                        body_data = part['body'].get('data', '')
-                        if body_data:
-                            email_data['body'] = base64.urlsafe_b64decode(body_data).decode('utf-8')
-                    elif part['mimeType'] == 'text/html':
-                        body_html = part['body'].get('data', '')
-                        if body_html:
-                            email_data['body_html'] = base64.urlsafe_b64decode(body_html).decode('utf-8')
-            else:
-                # For simple messages
-                body_data = message['payload']['body'].get('data', '')
-                if body_data:
-                    email_data['body'] = base64.urlsafe_b64decode(body_data).decode('utf-8')
+            try:
+                batch.execute()
+            except HttpError as error:
+                # The whole batch failed, mark only its messages as missing
+                print(f'An error occurred: {error}')
+                for email_id in unique_ids[start:start + batch_size]:
+                    emails.setdefault(email_id, None)
+        
+        return emails
+    
+    def get_threads_batch(self, thread_ids, batch_size=None, min_history_ids=None, use_cache=True):
+        """Fetch whole threads (one threads.get each) using batched HTTP requests.
+        
+        Returns a dict mapping each thread ID to a thread dict with 'id',
+        'historyId' and its parsed 'messages' (oldest first), or to None if
+        it could not be fetched. Cached threads are reused unless use_cache
+        is False or they are older than min_history_ids[thread_id].
+        """
+        if batch_size is None:
+            batch_size = config.settings_snapshot().get('gmail_batch_size', self.DEFAULT_BATCH_SIZE)
+        batch_size = max(1, min(int(batch_size), self.MAX_BATCH_SIZE))
+        min_history_ids = min_history_ids or {}
+        
+        threads = {}
+        if use_cache:
+            for thread_id in thread_ids:
+                cached = self.thread_cache.get(thread_id, min_history_id=min_history_ids.get(thread_id))
+                if cached is not None:
+                    threads[thread_id] = cached
+        
+        def callback(request_id, response, exception):
+            if exception is not None:
+                print(f'An error occurred fetching thread {request_id}: {exception}')
+                threads[request_id] = None
+                return
+            try:
+                threads[request_id] = self._parse_thread(response)
+                self.thread_cache.put(threads[request_id])
+                # Individual messages stay available after the thread is evicted
+                if self.message_cache is not None:
+                    for message in threads[request_id]['messages']:
+                        self.message_cache.put(message)
+            except Exception as e:
+                print(f'An error occurred parsing thread {request_id}: {str(e)}')
+                threads[request_id] = None
+        
+        unique_ids = [thread_id for thread_id in dict.fromkeys(thread_ids) if thread_id not in threads]
+        for start in range(0, len(unique_ids), batch_size):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for thread_id in unique_ids[start:start + batch_size]:
+                batch.add(
+                    self.service.users().threads().get(userId='me', id=thread_id, format='full'),
+                    request_id=thread_id
+                )
             
+            try:
+                batch.execute()
+            except HttpError as error:
+                # The whole batch failed, mark only its threads as missing
+                print(f'An error occurred: {error}')
+                for thread_id in unique_ids[start:start + batch_size]:
+                    threads.setdefault(thread_id, None)
+        
+        return threads
+    
+    def _parse_thread(self, thread):
+        """Convert a full-format Gmail thread into a dict of its parsed messages"""
+        return {
+            'id': thread['id'],
+            'historyId': thread.get('historyId'),
+            'messages': [self._parse_message(message) for message in thread.get('messages', [])]
+        }
+    
+    def _message_get_request(self, email_id, format):
+        """Build (but do not execute) a messages.get request"""
+        if format == 'metadata':
+            return self.service.users().messages().get(
+                userId='me',
+                id=email_id,
+                format='metadata',
+                metadataHeaders=['From', 'Subject', 'Date']
+            )
+        return self.service.users().messages().get(
+            userId='me',
+            id=email_id,
+            format='full'
+        )
+    
+    def _parse_metadata(self, msg):
+        """Convert a metadata-format Gmail message into our email dict"""
+        email_data = {
+            'id': msg['id'],
+            'threadId': msg['threadId'],
+            'snippet': msg['snippet'],
+            'sender': '',
+            'subject': '',
+            'date': ''
+        }
+        
+        # Extract headers
+        headers = msg['payload']['headers']
+        for header in headers:
+            if header['name'] == 'From':
+                email_data['sender'] = header['value']
+            elif header['name'] == 'Subject':
+                email_data['subject'] = header['value']
+            elif header['name'] == 'Date':
+                email_data['date'] = header['value']
+        
+        return email_data
+    
+    def get_email(self, email_id, min_history_id=None):
+        """Get the full content of an email.
+        
+        Served from a cached thread or the local message cache when possible;
+        pass min_history_id to refetch cached copies older than that historyId.
+        """
+        cached = self.thread_cache.get_message(email_id)
+        if cached is not None and (min_history_id is None or int(cached.get('historyId') or 0) >= int(min_history_id)):
+            return cached
+        
+        if self.message_cache is not None:
+            cached = self.message_cache.get(email_id, min_history_id=min_history_id)
+            if cached is not None:
+                return cached
+        
+        try:
+            message = self._message_get_request(email_id, 'full').execute()
+            email_data = self._parse_message(message)
+            if self.message_cache is not None:
+                self.message_cache.put(email_data)
             return email_data
             
         except HttpError as error:
             print(f'An error occurred: {error}')
             return None
     
+    def _parse_message(self, message):
+        """Convert a full-format Gmail message into our email dict"""
+        email_data = {
+            'id': message['id'],
+            'threadId': message['threadId'],
+            'historyId': message.get('historyId'),
+            'labelIds': message.get('labelIds', []),
+            'snippet': message['snippet'],
+            'sender': '',
+            'recipient': '',
+            'cc': [],
+            'subject': '',
+            'date': '',
+            'body': '',
+            'body_html': ''
+        }
+        
+        # Extract headers
+        headers = message['payload']['headers']
+        for header in headers:
+            if header['name'] == 'From':
+                email_data['sender'] = header['value']
+            elif header['name'] == 'To':
+                email_data['recipient'] = header['value']
+            elif header['name'] == 'Cc':
+                email_data['cc'] = [cc.strip() for cc in header['value'].split(',')]
+            elif header['name'] == 'Subject':
+                email_data['subject'] = header['value']
+            elif header['name'] == 'Date':
+                email_data['date'] = header['value']
+        
+        # Extract body
+        if 'parts' in message['payload']:
+            for part in message['payload']['parts']:
+                if part['mimeType'] == 'text/plain':
+                    body_data = part['body'].get('data', '')
+                    if body_data:
+                        email_data['body'] = base64.urlsafe_b64decode(body_data).decode('utf-8')
+                elif part['mimeType'] == 'text/html':
+                    body_html = part['body'].get('data', '')
+                    if body_html:
+                        email_data['body_html'] = base64.urlsafe_b64decode(body_html).decode('utf-8')
+        else:
+            # For simple messages
+            body_data = message['payload']['body'].get('data', '')
+            if body_data:
+                email_data['body'] = base64.urlsafe_b64decode(body_data).decode('utf-8')
+        
+        return email_data
+    
     def send_reply(self, email_id, reply_text):
         """Send a reply to a specific email"""
         try:
@@ -213,6 +466,9 @@ class GmailService:
                 }
             ).execute()
             
+            # The thread has a new message now
+            self.thread_cache.invalidate(thread_id)
+            
             return sent_message
             
         except HttpError as error:
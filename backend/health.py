@@ -0,0 +1,140 @@
+"""
+Cached health of the active LLM service.
+Probing a provider can be expensive (for OpenAI it is an API round trip), so
+the active service is probed on a background interval and the result is
+kept in memory. /api/status and request checks read that result instead of
+probing. A real request that fails marks the result stale, which triggers
+a fresh probe straight away.
+"""
+
+import time
+import weakref
+import threading
+from datetime import datetime
+
+class HealthMonitor:
+    """Probes the active LLM service in the background and caches the result"""
+
+    def __init__(self, get_service, interval=60, ttl=180):
+        """get_service returns the service to watch (or None). Results are
+        refreshed every interval seconds and trusted for ttl seconds."""
+        self.get_service = get_service
+        self.interval = interval
+        self.ttl = ttl
+        # Weak keys, so a swapped-out service can still be freed
+        self._results = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._probe_locks = weakref.WeakKeyDictionary()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        """Start probing in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='llm-health', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            service = self.get_service()
+            if service is not None and self._needs_probe(service, max_age=self.interval):
+                self.probe(service)
+            # Wake early when a result goes stale or a new service appears
+            self._wake.wait(min(self.interval, 5))
+            self._wake.clear()
+
+    def _needs_probe(self, service, max_age):
+        with self._lock:
+            result = self._results.get(service)
+        return result is None or result['stale'] or time.time() - result['checked'] >= max_age
+
+    def probe(self, service):
+        """Check service now and cache the result; returns whether it is healthy"""
+        requested = time.time()
+        with self._lock:
+            probe_lock = self._probe_locks.setdefault(service, threading.Lock())
+        # Concurrent callers share one probe instead of each making a call
+        with probe_lock:
+            with self._lock:
+                result = self._results.get(service)
+            if result is not None and not result['stale'] and result['checked'] >= requested:
+                return result['healthy']
+
+            start = time.time()
+            error = None
+            if service.state == 'loading':
+                # Nothing to probe yet; loading progress comes from the service
+                healthy = None
+            else:
+                try:
+                    healthy = bool(service.is_configured())
+                except Exception as e:
+                    healthy = False
+                    error = str(e)
+                if not healthy and error is None:
+                    error = (service.load_status() or {}).get('error')
+            self._store(service, healthy, error, probe_seconds=time.time() - start)
+            return healthy
+
+    def _store(self, service, healthy, error=None, probe_seconds=None):
+        with self._lock:
+            self._results[service] = {
+                'healthy': healthy,
+                'error': error,
+                'stale': False,
+                'checked': time.time(),
+                'probe_seconds': probe_seconds
+            }
+
+    def is_healthy(self, service, wait=True):
+        """Cached health of service: True, False, or None if not known yet.
+
+        A missing, expired or stale result is refreshed: synchronously if
+        wait is set, otherwise by the background thread while the last
+        known value is returned.
+        """
+        with self._lock:
+            result = self._results.get(service)
+        fresh = result is not None and not result['stale'] and time.time() - result['checked'] < self.ttl
+        if fresh and not (result['healthy'] is None and service.state != 'loading'):
+            return result['healthy']
+        if wait:
+            return self.probe(service)
+        self._wake.set()
+        return result['healthy'] if result else None
+
+    def record_success(self, service):
+        """A real request succeeded, which is as good as a probe"""
+        self._store(service, True)
+
+    def mark_stale(self, service, error=None):
+        """A real request failed; probe again before trusting the cached result"""
+        with self._lock:
+            result = self._results.get(service)
+            if result is not None:
+                result['stale'] = True
+                result['error'] = error or result['error']
+        self._wake.set()
+
+    def status(self, service):
+        """Cached health details for service, without probing"""
+        if service is None:
+            return None
+        with self._lock:
+            result = dict(self._results.get(service) or {})
+        if not result:
+            self._wake.set()
+            return {'healthy': None, 'stale': True, 'checked_at': None, 'error': None}
+        age = time.time() - result['checked']
+        return {
+            'healthy': result['healthy'],
+            'stale': result['stale'] or age >= self.ttl,
+            'checked_at': datetime.fromtimestamp(result['checked']).isoformat(),
+            'error': result['error'],
+            'probe_seconds': round(result['probe_seconds'], 3) if result['probe_seconds'] is not None else None
+        }
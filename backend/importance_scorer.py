@@ -0,0 +1,170 @@
+"""
+Compiled importance scorer for emails.
+Keyword, sender and direct-address matching is compiled once per settings
+change into combined regexes, so each field is scanned in a single pass
+instead of once per keyword.
+"""
+
+import re
+import numpy as np
+
+DEFAULT_KEYWORDS = ['urgent', 'important', 'asap', 'deadline', 'required']
+
+DEFAULT_WEIGHTS = {
+    'subject_keyword': 3,
+    'body_keyword': 1,
+    'important_sender': 5,
+    'question_mark': 1,
+    'direct_message': 2,
+    'email_length': 1
+}
+
+# "you"/"your" direct addressing adds a fixed point, it has no configurable weight
+DIRECT_ADDRESS_POINTS = 1
+
+_YOU_PATTERN = r'\byou\b|\byour\b'
+
+# Column order of stored feature vectors
+FEATURE_NAMES = list(DEFAULT_WEIGHTS) + ['direct_address']
+
+class SubstringMatcher:
+    """Finds which of a fixed set of substrings occur in a lowercased text"""
+
+    def __init__(self, patterns, extra_pattern=None):
+        """Compile patterns (matched case-insensitively via lowercasing).
+
+        extra_pattern is an optional regex whose match positions are reported
+        alongside the substring hits, so both come from the same scan.
+        """
+        lowered = [pattern.lower() for pattern in patterns]
+
+        # Duplicates in the settings list each count, as they always have
+        self.multiplicity = {}
+        for pattern in lowered:
+            self.multiplicity[pattern] = self.multiplicity.get(pattern, 0) + 1
+
+        # An empty pattern is a substring of every text
+        self.always_hits = self.multiplicity.pop('', 0)
+
+        # Longest first, so at any position the regex reports the longest hit;
+        # every shorter pattern contained in that hit is credited through
+        # contained_in instead of needing its own scan
+        unique = sorted(self.multiplicity, key=len, reverse=True)
+        self.contained_in = {
+            pattern: [other for other in unique if other in pattern]
+            for pattern in unique
+        }
+
+        alternatives = []
+        if unique:
+            alternatives.append('(?P<hit>' + '|'.join(re.escape(pattern) for pattern in unique) + ')')
+        self._extra = None
+        if extra_pattern:
+            self._extra = re.compile(extra_pattern)
+            alternatives.append('(?P<extra>' + extra_pattern + ')')
+        self._regex = re.compile('(?=' + '|'.join(alternatives) + ')') if alternatives else None
+
+    def scan(self, text):
+        """Scan lowercased text once; returns (patterns found, extra match count)"""
+        found = set()
+        extra_count = 0
+        if self._regex is None:
+            return found, extra_count
+
+        for match in self._regex.finditer(text):
+            hit = match.group('hit') if self.multiplicity else None
+            if hit is not None:
+                found.update(self.contained_in[hit])
+                # A substring hit shadows the extra pattern at the same position
+                if self._extra is not None and self._extra.match(text, match.start()):
+                    extra_count += 1
+            else:
+                extra_count += 1
+
+        return found, extra_count
+
+    def count_hits(self, text):
+        """Number of patterns (counting duplicates) that occur in text"""
+        found, _ = self.scan(text)
+        return self.always_hits + sum(self.multiplicity[pattern] for pattern in found)
+
+class ImportanceScorer:
+    """Scores emails against the importance criteria from the settings"""
+
+    def __init__(self, keywords, important_senders, weights):
+        """Compile the matchers for the given criteria"""
+        self.keywords = list(keywords)
+        self.important_senders = list(important_senders)
+        self.weights = dict(DEFAULT_WEIGHTS, **weights)
+
+        self._subject_matcher = SubstringMatcher(self.keywords)
+        self._body_matcher = SubstringMatcher(self.keywords, extra_pattern=_YOU_PATTERN)
+        self._sender_matcher = SubstringMatcher(self.important_senders)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build a scorer from a settings dict"""
+        return cls(
+            settings.get('important_keywords', DEFAULT_KEYWORDS),
+            settings.get('important_senders', []),
+            settings.get('importance_weights', DEFAULT_WEIGHTS)
+        )
+
+    @staticmethod
+    def settings_signature(settings):
+        """Key that changes whenever the scoring criteria in settings change"""
+        return repr((
+            settings.get('important_keywords', DEFAULT_KEYWORDS),
+            settings.get('important_senders', []),
+            sorted(settings.get('importance_weights', DEFAULT_WEIGHTS).items())
+        ))
+
+    @staticmethod
+    def feature_signature(settings):
+        """Key that changes whenever stored features need to be re-extracted.
+        
+        Weights are not part of it: reweighting only needs score_matrix.
+        """
+        return repr((
+            settings.get('important_keywords', DEFAULT_KEYWORDS),
+            settings.get('important_senders', [])
+        ))
+
+    def extract_features(self, email):
+        """Count the scoring signals in an email"""
+        body = email['body'].lower()
+        body_keywords, you_count = self._body_matcher.scan(body)
+
+        return {
+            'subject_keyword': self._subject_matcher.count_hits(email['subject'].lower()),
+            'body_keyword': self._body_matcher.always_hits + sum(
+                self._body_matcher.multiplicity[keyword] for keyword in body_keywords
+            ),
+            'important_sender': 1 if self._sender_matcher.count_hits(email['sender'].lower()) else 0,
+            'question_mark': min(email['body'].count('?'), 3),
+            'direct_address': 1 if you_count >= 2 else 0,
+            'email_length': 1 if 100 <= len(email['body']) <= 1000 else 0,
+            'direct_message': 0 if email['cc'] else 1
+        }
+
+    def score_features(self, features):
+        """Weighted sum of extracted features"""
+        score = features['direct_address'] * DIRECT_ADDRESS_POINTS
+        for name in DEFAULT_WEIGHTS:
+            score += features[name] * self.weights[name]
+        return score
+
+    def weight_vector(self):
+        """Weights as a vector in FEATURE_NAMES order"""
+        return np.array(
+            [self.weights[name] for name in DEFAULT_WEIGHTS] + [DIRECT_ADDRESS_POINTS],
+            dtype=np.float64
+        )
+
+    def score_matrix(self, feature_matrix):
+        """Score many emails at once from an (n_emails, n_features) matrix"""
+        return feature_matrix @ self.weight_vector()
+
+    def score(self, email):
+        """Calculate the importance score of an email"""
+        return self.score_features(self.extract_features(email))
@@ -0,0 +1,205 @@
+"""
+Serialized, prioritized inference for a local model.
+A llama-cpp model can only run one completion at a time, so every request
+goes through a single worker thread fed by a priority queue: drafts the
+user is waiting for run before speculative or bulk work. Requests can be
+cancelled or time out, which stops them between tokens, and the queue
+keeps depth and wait-time metrics.
+"""
+
+import time
+import queue
+import heapq
+import itertools
+import threading
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+class InferenceCancelled(Exception):
+    """Raised when an inference request is cancelled or times out"""
+
+_END = object()
+
+class InferenceTask:
+    """One request waiting for or running on the inference worker"""
+
+    def __init__(self, work, priority, timeout):
+        """work(task) runs on the worker; it should call task.emit() for each
+        token and stop when task.cancelled becomes true."""
+        self.work = work
+        self.priority = priority
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.deadline = self.enqueued_at + timeout if timeout else None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._tokens = queue.Queue()
+        self._result = None
+        self._error = None
+
+    @property
+    def timed_out(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+    @property
+    def cancelled(self):
+        """Whether the task should stop: cancelled by the caller or past its deadline"""
+        return self._cancelled.is_set() or self.timed_out
+
+    def cancel(self):
+        """Stop the task; a queued task is dropped, a running one stops at its next token"""
+        self._cancelled.set()
+
+    def emit(self, text):
+        """Pass a generated token to a streaming caller"""
+        self._tokens.put(text)
+
+    def result(self):
+        """Wait for the task and return what work returned"""
+        remaining = None if self.deadline is None else max(0, self.deadline - time.time())
+        if not self._done.wait(remaining):
+            self.cancel()
+            raise InferenceCancelled("Inference request timed out")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def stream(self):
+        """Yield tokens as they are emitted; closing the generator cancels the task"""
+        try:
+            while True:
+                remaining = None if self.deadline is None else max(0, self.deadline - time.time())
+                try:
+                    text = self._tokens.get(timeout=remaining)
+                except queue.Empty:
+                    raise InferenceCancelled("Inference request timed out")
+                if text is _END:
+                    break
+                yield text
+            if self._error is not None:
+                raise self._error
+        finally:
+            if not self._done.is_set():
+                self.cancel()
+
+    def _finish(self, result=None, error=None):
+        self._result = result
+        self._error = error
+        self._done.set()
+        self._tokens.put(_END)
+
+class InferenceQueue:
+    """Runs inference tasks one at a time on a dedicated thread, by priority"""
+
+    def __init__(self, name='llm-inference'):
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = None
+        self._stopping = False
+        self._stats = {
+            'started': 0,
+            'finished': 0,
+            'completed': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'timed_out': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'total_run_seconds': 0.0
+        }
+        self._thread = threading.Thread(target=self._worker, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, work, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Queue work(task) and return its InferenceTask"""
+        task = InferenceTask(work, priority, timeout)
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Inference queue has been shut down")
+            # The counter keeps equal priorities first-in, first-out
+            heapq.heappush(self._heap, (priority, next(self._counter), task))
+            self._condition.notify()
+        return task
+
+    def shutdown(self):
+        """Stop the worker after the running task; queued tasks are cancelled"""
+        with self._condition:
+            self._stopping = True
+            pending = [task for _, _, task in self._heap]
+            self._heap = []
+            self._condition.notify()
+        for task in pending:
+            task.cancel()
+            task._finish(error=InferenceCancelled("Inference queue has been shut down"))
+
+    def metrics(self):
+        """Queue depth, wait and run times, and outcome counts"""
+        with self._condition:
+            stats = dict(self._stats)
+            depth = len(self._heap)
+            running = self._running
+        started = stats['started']
+        return {
+            'queue_depth': depth,
+            'busy': running is not None,
+            'running_for_seconds': round(time.time() - running.started_at, 3) if running else None,
+            'completed': stats['completed'],
+            'failed': stats['failed'],
+            'cancelled': stats['cancelled'],
+            'timed_out': stats['timed_out'],
+            'avg_wait_seconds': round(stats['total_wait_seconds'] / started, 3) if started else None,
+            'max_wait_seconds': round(stats['max_wait_seconds'], 3),
+            'avg_run_seconds': round(stats['total_run_seconds'] / stats['finished'], 3) if stats['finished'] else None
+        }
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                _, _, task = heapq.heappop(self._heap)
+
+            if task.cancelled:
+                self._record(task, 'cancelled')
+                task._finish(error=InferenceCancelled(
+                    "Inference request timed out" if task.timed_out else "Inference request was cancelled"
+                ))
+                continue
+
+            task.started_at = time.time()
+            with self._condition:
+                self._running = task
+                wait = task.started_at - task.enqueued_at
+                self._stats['started'] += 1
+                self._stats['total_wait_seconds'] += wait
+                self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], wait)
+
+            try:
+                result = task.work(task)
+                if task.cancelled:
+                    raise InferenceCancelled(
+                        "Inference request timed out" if task.timed_out else "Inference request was cancelled"
+                    )
+                outcome, error = 'completed', None
+            except Exception as e:
+                result = None
+                outcome = 'cancelled' if isinstance(e, InferenceCancelled) else 'failed'
+                error = e
+
+            with self._condition:
+                self._running = None
+                self._stats['finished'] += 1
+                self._stats['total_run_seconds'] += time.time() - task.started_at
+            self._record(task, outcome)
+            task._finish(result, error)
+
+    def _record(self, task, outcome):
+        with self._condition:
+            self._stats[outcome] += 1
+            if outcome == 'cancelled' and task.timed_out:
+                self._stats['timed_out'] += 1
@@ -0,0 +1,120 @@
+"""
+In-process background jobs.
+Long-running work such as refreshing or rescoring the mailbox runs on a
+small worker pool instead of inside the HTTP request. Each job reports
+progress counters that clients poll, and submitting a job while an
+identical one is still queued or running returns the existing job.
+"""
+
+import time
+import uuid
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+class Job:
+    """A unit of background work and its progress"""
+
+    def __init__(self, kind, key=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = 'queued'  # 'queued', 'running', 'succeeded' or 'failed'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self._finished_time = None
+        self._lock = threading.Lock()
+
+    def add_progress(self, **counts):
+        """Add to the job's progress counters, e.g. add_progress(fetched=50)"""
+        with self._lock:
+            for name, count in counts.items():
+                self.progress[name] = self.progress.get(name, 0) + count
+
+    @property
+    def active(self):
+        """Whether the job is still queued or running"""
+        return self.status in ('queued', 'running')
+
+    def to_dict(self):
+        """JSON-friendly snapshot of the job"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'progress': dict(self.progress),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+class JobManager:
+    """Runs jobs on a worker pool and keeps finished ones around for a while"""
+
+    def __init__(self, max_workers=2, retention_seconds=3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._active_by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, key=None):
+        """Run func(job) in the background and return its Job.
+
+        If a job with the same key is still queued or running, it is
+        returned instead of starting a duplicate.
+        """
+        with self._lock:
+            self._prune()
+            if key is not None:
+                existing = self._active_by_key.get(key)
+                if existing is not None and existing.active:
+                    return existing
+
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active_by_key[key] = job
+
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id):
+        """Get a job by ID, or None if unknown or expired"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func):
+        """Run a job, recording its outcome"""
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        try:
+            job.result = func(job)
+            job.status = 'succeeded'
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.id}: {str(e)}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            job._finished_time = time.time()
+            with self._lock:
+                if job.key is not None and self._active_by_key.get(job.key) is job:
+                    del self._active_by_key[job.key]
+
+    def _prune(self):
+        """Forget jobs that finished more than retention_seconds ago"""
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job._finished_time is not None and job._finished_time < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
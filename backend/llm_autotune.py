@@ -0,0 +1,197 @@
+"""
+Auto-tuning of llama-cpp runtime parameters.
+Sweeps thread count, batch size, mmap/mlock and context size on this
+machine with a short built-in benchmark, one parameter at a time, and
+stores the fastest configuration under local_llm_settings.tuned. Values
+under local_llm_settings.overrides still take precedence.
+
+Usage: python llm_autotune.py [--model PATH] [--dry-run]
+"""
+
+import os
+import gc
+import time
+import argparse
+from datetime import datetime
+import config
+from llm_service import LLAMA_PARAM_DEFAULTS, resolve_llama_params, llama_kwargs
+
+# A typical email, so prompt evaluation is weighted realistically
+BENCHMARK_PROMPT = (
+    "You are an email assistant. You are an email assistant drafting professional business replies. "
+    "Keep responses clear, concise, and formal.\n\n"
+    "Email from: Dana Whitfield <dana.whitfield@example.com>\n"
+    "Subject: Q3 vendor review - decision needed by Friday\n\n"
+    "Body: Hi,\n\nFollowing last week's meeting I've put together the comparison of the three vendors we "
+    "shortlisted for the data platform migration. Northwind came in lowest on licensing but their support "
+    "hours don't cover our APAC team, Contoso is about 15% more expensive overall but includes the migration "
+    "tooling we'd otherwise build ourselves, and Fabrikam's proposal is still missing the security "
+    "questionnaire we asked for twice. Finance needs a recommendation by Friday so they can lock the budget "
+    "for next quarter. Could you review the attached summary and let me know which option you'd back, or "
+    "whether we should ask for an extension? Happy to set up a call on Thursday if that's easier.\n\n"
+    "Thanks,\nDana\n\nPlease write a reply:"
+)
+
+# Tokens generated per benchmark run, and per real draft when estimating draft time
+BENCHMARK_TOKENS = 32
+DRAFT_TOKENS = 256
+
+# Larger contexts are kept unless they are more than this much slower
+CONTEXT_TOLERANCE = 0.10
+
+def _thread_candidates(system_info):
+    physical = system_info.get('cpu_count') or 1
+    logical = os.cpu_count() or physical
+    return sorted({max(1, physical // 2), physical, logical})
+
+def _benchmark(model_path, params):
+    """Load the model with params and time one benchmark completion"""
+    from llama_cpp import Llama
+
+    load_start = time.time()
+    model = Llama(model_path=model_path, verbose=False, **llama_kwargs(params))
+    load_seconds = time.time() - load_start
+    try:
+        prompt_tokens = len(model.tokenize(BENCHMARK_PROMPT.encode('utf-8')))
+
+        start = time.time()
+        first_token_at = None
+        completion_tokens = 0
+        for _ in model(BENCHMARK_PROMPT, max_tokens=BENCHMARK_TOKENS, temperature=0.0, stream=True):
+            if first_token_at is None:
+                first_token_at = time.time()
+            completion_tokens += 1
+        end = time.time()
+    finally:
+        del model
+        gc.collect()
+
+    prompt_seconds = (first_token_at or end) - start
+    generate_seconds = max(end - (first_token_at or end), 1e-6)
+    tokens_per_second = max(completion_tokens - 1, 1) / generate_seconds
+    prompt_tokens_per_second = prompt_tokens / max(prompt_seconds, 1e-6)
+    return {
+        'params': dict(params),
+        'load_seconds': round(load_seconds, 2),
+        'prompt_tokens_per_second': round(prompt_tokens_per_second, 2),
+        'tokens_per_second': round(tokens_per_second, 2),
+        # What a real draft would take: this prompt plus a full-length reply
+        'estimated_draft_seconds': round(prompt_seconds + DRAFT_TOKENS / tokens_per_second, 2)
+    }
+
+def autotune(model_path, system_info, base_params=None, progress=None):
+    """Find the fastest llama-cpp parameters for model_path on this machine.
+
+    progress, if given, is called with counts to add, e.g. progress(trials=1).
+    Returns the chosen parameters, their benchmark and every trial.
+    """
+    base = dict(base_params or LLAMA_PARAM_DEFAULTS)
+    trials = []
+    results = {}
+
+    thread_options = _thread_candidates(system_info)
+    batch_options = [32, 128, 512]
+    context_options = [2048, 4096, 8192]
+    memory_options = [(True, False), (False, False)]
+    # mlock pins the whole model in RAM, only worth trying if it fits comfortably
+    if os.path.getsize(model_path) < system_info.get('ram_gb', 0) * 1024 ** 3 * 0.5:
+        memory_options.append((True, True))
+
+    if progress:
+        progress(total=len(thread_options) + len(batch_options) + len(memory_options) + len(context_options))
+
+    def run(params):
+        key = tuple(sorted(params.items()))
+        if key not in results:
+            try:
+                results[key] = _benchmark(model_path, params)
+            except Exception as e:
+                print(f"Benchmark failed for {params}: {str(e)}")
+                results[key] = {'params': dict(params), 'error': str(e)}
+            trials.append(results[key])
+            result = results[key]
+            if 'error' not in result:
+                print(f"{params}: {result['tokens_per_second']} tokens/s, "
+                      f"~{result['estimated_draft_seconds']}s per draft")
+        if progress:
+            progress(trials=1)
+        return results[key]
+
+    def fastest(candidates):
+        ok = [result for result in candidates if 'error' not in result]
+        return min(ok, key=lambda result: result['estimated_draft_seconds']) if ok else None
+
+    best_params = dict(base, context_size=context_options[0], batch_size=128, use_mmap=True, use_mlock=False)
+
+    for name, options in (('threads', thread_options), ('batch_size', batch_options)):
+        best = fastest([run(dict(best_params, **{name: option})) for option in options])
+        if best:
+            best_params = best['params']
+
+    best = fastest([
+        run(dict(best_params, use_mmap=use_mmap, use_mlock=use_mlock)) for use_mmap, use_mlock in memory_options
+    ])
+    if best:
+        best_params = best['params']
+
+    # The largest context that loads and is not noticeably slower
+    context_results = [run(dict(best_params, context_size=option)) for option in context_options]
+    best = fastest(context_results)
+    if best is None:
+        raise RuntimeError("Every benchmark run failed; is llama-cpp-python installed and the model valid?")
+    for result in reversed(context_results):
+        if 'error' not in result and \
+                result['estimated_draft_seconds'] <= best['estimated_draft_seconds'] * (1 + CONTEXT_TOLERANCE):
+            best = result
+            break
+
+    return {
+        'model': os.path.basename(model_path),
+        'params': best['params'],
+        'tokens_per_second': best['tokens_per_second'],
+        'prompt_tokens_per_second': best['prompt_tokens_per_second'],
+        'estimated_draft_seconds': best['estimated_draft_seconds'],
+        'tuned_at': datetime.now().isoformat(),
+        'trials': trials
+    }
+
+def save_autotune_result(result):
+    """Store the chosen parameters in settings; returns the new local_llm_settings"""
+    settings = config.load_settings()
+    llm_settings = dict(settings.get('local_llm_settings') or {})
+    llm_settings['tuned'] = result['params']
+    llm_settings['autotune'] = {name: value for name, value in result.items() if name != 'trials'}
+    settings['local_llm_settings'] = llm_settings
+    config.save_settings(settings)
+    return llm_settings
+
+def main():
+    """Parse command line arguments and run the auto-tuner"""
+    parser = argparse.ArgumentParser(description="Benchmark llama-cpp settings and store the fastest")
+    parser.add_argument('--model', type=str, default=None, help='Model file (default: local_llm_model_path from settings)')
+    parser.add_argument('--dry-run', action='store_true', help='Report the fastest settings without saving them')
+    args = parser.parse_args()
+
+    settings = config.load_settings()
+    model_path = args.model or settings.get('local_llm_model_path')
+    if not model_path or not os.path.exists(model_path):
+        print(f"Model file not found: {model_path}")
+        return
+
+    result = autotune(
+        model_path,
+        config.check_system_requirements(),
+        base_params=resolve_llama_params(settings.get('local_llm_settings'))
+    )
+    print(f"Fastest: {result['params']} - {result['tokens_per_second']} tokens/s, "
+          f"{result['prompt_tokens_per_second']} prompt tokens/s, ~{result['estimated_draft_seconds']}s per draft")
+
+    if args.dry_run:
+        print("Dry run, settings not changed.")
+        return
+
+    save_autotune_result(result)
+    print("Saved to local_llm_settings.tuned. Values under local_llm_settings.overrides still take precedence.")
+
+if __name__ == "__main__":
+    main()
@@ -5,73 +5,172 @@ and implementations for both OpenAI API and local Llama models.
 """
 
 import os
+import time
+import threading
 import openai
 from abc import ABC, abstractmethod
+from inference_queue import InferenceQueue, PRIORITY_INTERACTIVE
+from prefix_cache import PrefixStateCache
+from openai_client import OpenAIRequester, shared_http_client
+from prompt_builder import PromptBuilder, openai_token_counter
+
+# llama-cpp runtime parameters used when local_llm_settings doesn't set them
+LLAMA_PARAM_DEFAULTS = {
+    'context_size': 2048,
+    'threads': 4,
+    'batch_size': 64,
+    'use_mmap': True,
+    'use_mlock': False
+}
+
+def resolve_llama_params(llm_settings=None):
+    """Effective llama-cpp parameters from a local_llm_settings block.
+    
+    Values set directly in the block apply until auto-tuning stores its
+    choice under 'tuned'; values under 'overrides' always win.
+    """
+    llm_settings = llm_settings or {}
+    params = dict(LLAMA_PARAM_DEFAULTS)
+    for source in (llm_settings, llm_settings.get('tuned') or {}, llm_settings.get('overrides') or {}):
+        params.update({name: source[name] for name in LLAMA_PARAM_DEFAULTS if source.get(name) is not None})
+    return params
+
+def llama_kwargs(params):
+    """Llama constructor arguments for resolved parameters"""
+    return {
+        'n_ctx': int(params['context_size']),
+        'n_threads': int(params['threads']),
+        'n_batch': int(params['batch_size']),
+        'use_mmap': bool(params['use_mmap']),
+        'use_mlock': bool(params['use_mlock'])
+    }
 
 class BaseLLMService(ABC):
     """Base abstract class for LLM services"""
     
+    # Identify which model produced a draft (used to key cached drafts)
+    provider = None
+    model_name = None
+    
+    # 'loading', 'ready' or 'failed'; only services that load a model start out loading
+    state = 'ready'
+    
+    # System prompt for each email style; unknown styles use 'professional'
+    STYLE_PROMPTS = {
+        'professional': """
+            You are an email assistant drafting professional business replies.
+            Keep responses clear, concise, and formal.
+            Use professional language and maintain a respectful tone.
+            Ensure your response directly addresses the key points from the original email.
+            End with a professional closing.
+            Do not include any salutations - the system will add those automatically.
+        """,
+        
+        'casual': """
+            You are an email assistant drafting friendly, casual replies.
+            Keep the tone conversational and approachable, but still professional.
+            Use a more relaxed writing style while being clear and direct.
+            Address the key points from the original email in a friendly manner.
+            End with a warm, casual closing.
+            Do not include any salutations - the system will add those automatically.
+        """,
+        
+        'concise': """
+            You are an email assistant drafting extremely concise replies.
+            Keep responses brief and to the point - use as few words as possible.
+            Focus only on the essential information needed to respond effectively.
+            Use short sentences and minimal elaboration.
+            End with a brief, efficient closing.
+            Do not include any salutations - the system will add those automatically.
+        """,
+        
+        'detailed': """
+            You are an email assistant drafting comprehensive, detailed replies.
+            Provide thorough responses that address all points raised in the original email.
+            Be comprehensive but organized, using paragraphs to separate different points.
+            Maintain a professional tone while providing detailed information.
+            End with a thorough closing that summarizes key points if needed.
+            Do not include any salutations - the system will add those automatically.
+        """
+    }
+    
     @abstractmethod
     def is_configured(self):
         """Check if the LLM service is properly configured and ready to use"""
         pass
     
+    def wait_until_ready(self, timeout=None):
+        """Wait for the service to finish loading; True unless still loading after timeout"""
+        return True
+    
+    def load_status(self):
+        """Loading progress details, or None for services that don't load a model"""
+        return None
+    
     @abstractmethod
-    def generate_reply(self, sender, subject, body, style='professional', custom_instructions=''):
-        """Generate a reply to an email"""
+    def generate_reply(self, sender, subject, body, style='professional', custom_instructions='',
+                       priority=PRIORITY_INTERACTIVE):
+        """Generate a reply to an email.
+        
+        priority orders requests on providers that queue them (see
+        inference_queue); others ignore it.
+        """
+        pass
+    
+    def stream_reply(self, sender, subject, body, style='professional', custom_instructions='',
+                     priority=PRIORITY_INTERACTIVE):
+        """Generate a reply to an email, yielding text chunks as they are produced.
+        
+        Closing the generator stops generation. Providers without streaming
+        support yield the whole reply at once.
+        """
+        yield self.generate_reply(sender, subject, body, style=style, custom_instructions=custom_instructions,
+                                  priority=priority)
+    
+    def metrics(self):
+        """Provider-specific runtime metrics, or None"""
+        return None
+    
+    def close(self):
+        """Release the service's resources once it is no longer used"""
         pass
     
+    def _build_system_prompt(self, style, custom_instructions=''):
+        """Get the style prompt with any custom instructions appended"""
+        system_prompt = self._get_style_prompt(style)
+        
+        # Add custom instructions if provided
+        if custom_instructions:
+            system_prompt += f"\n\n{custom_instructions}"
+        
+        return system_prompt
+    
+    def _style_key(self, style):
+        """The known style a requested style maps to"""
+        return style if isinstance(style, str) and style in self.STYLE_PROMPTS else 'professional'
+    
     def _get_style_prompt(self, style):
         """Get the system prompt for the given email style"""
-        style_prompts = {
-            'professional': """
-                You are an email assistant drafting professional business replies.
-                Keep responses clear, concise, and formal.
-                Use professional language and maintain a respectful tone.
-                Ensure your response directly addresses the key points from the original email.
-                End with a professional closing.
-                Do not include any salutations - the system will add those automatically.
-            """,
-            
-            'casual': """
-                You are an email assistant drafting friendly, casual replies.
-                Keep the tone conversational and approachable, but still professional.
-                Use a more relaxed writing style while being clear and direct.
-                Address the key points from the original email in a friendly manner.
-                End with a warm, casual closing.
-                Do not include any salutations - the system will add those automatically.
-            """,
-            
-            'concise': """
-                You are an email assistant drafting extremely concise replies.
-                Keep responses brief and to the point - use as few words as possible.
-                Focus only on the essential information needed to respond effectively.
-                Use short sentences and minimal elaboration.
-                End with a brief, efficient closing.
-                Do not include any salutations - the system will add those automatically.
-            """,
-            
-            'detailed': """
-                You are an email assistant drafting comprehensive, detailed replies.
-                Provide thorough responses that address all points raised in the original email.
-                Be comprehensive but organized, using paragraphs to separate different points.
-                Maintain a professional tone while providing detailed information.
-                End with a thorough closing that summarizes key points if needed.
-                Do not include any salutations - the system will add those automatically.
-            """
-        }
-        
-        return style_prompts.get(style, style_prompts['professional']).strip()
+        return self.STYLE_PROMPTS[self._style_key(style)].strip()
 
 
 class OpenAIService(BaseLLMService):
     """OpenAI API implementation of the LLM service"""
     
+    provider = 'openai'
+    
+    # Most tokens of email body to send; quoted history is stripped first
+    BODY_TOKEN_BUDGET = 1500
+    
     def __init__(self, api_key):
         """Initialize the OpenAI service with the given API key"""
         self.api_key = api_key
+        self.model_name = "gpt-3.5-turbo"  # You can upgrade to gpt-4 for better responses
         openai.api_key = api_key
-        self.client = openai.OpenAI(api_key=api_key)
+        # Retries are handled by the requester, which also paces and counts calls
+        self.client = openai.OpenAI(api_key=api_key, http_client=shared_http_client(), max_retries=0)
+        self.requester = OpenAIRequester(self.client)
+        self.prompt_builder = PromptBuilder(openai_token_counter(self.model_name))
     
     def is_configured(self):
         """Check if the OpenAI API key is valid"""
@@ -83,28 +182,21 @@ class OpenAIService(BaseLLMService):
             print(f"Error validating OpenAI API key: {str(e)}")
             return False
     
-    def generate_reply(self, sender, subject, body, style='professional', custom_instructions=''):
+    def _build_messages(self, sender, subject, body, style, custom_instructions):
+        """Build the chat messages for a reply"""
+        body = self.prompt_builder.prepare_body(body, self.BODY_TOKEN_BUDGET)
+        return [
+            {"role": "system", "content": self._build_system_prompt(style, custom_instructions)},
+            {"role": "user", "content": f"Please draft a reply to this email:\n\nFrom: {sender}\nSubject: {subject}\n\n{body}"}
+        ]
+    
+    def generate_reply(self, sender, subject, body, style='professional', custom_instructions='',
+                       priority=PRIORITY_INTERACTIVE):
         """Generate a reply to an email using OpenAI's API"""
-        # Extract sender name (if available)
-        sender_name = sender.split('<')[0].strip()
-        if not sender_name or sender_name == sender:
-            # If no name is available, try to extract from email
-            sender_name = sender.split('@')[0].split('.')[0].capitalize()
-        
-        # Prepare the system prompt based on the selected style
-        system_prompt = self._get_style_prompt(style)
-        
-        # Add custom instructions if provided
-        if custom_instructions:
-            system_prompt += f"\n\n{custom_instructions}"
-        
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",  # You can upgrade to gpt-4 for better responses
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Please draft a reply to this email:\n\nFrom: {sender}\nSubject: {subject}\n\n{body}"}
-                ],
+            response = self.requester.chat(
+                model=self.model_name,
+                messages=self._build_messages(sender, subject, body, style, custom_instructions),
                 temperature=0.7,
                 max_tokens=500
             )
@@ -115,16 +207,129 @@ class OpenAIService(BaseLLMService):
         except Exception as e:
             print(f"Error generating reply with OpenAI: {str(e)}")
             raise e
+    
+    def stream_reply(self, sender, subject, body, style='professional', custom_instructions='',
+                     priority=PRIORITY_INTERACTIVE):
+        """Stream a reply to an email from OpenAI's API as it is generated"""
+        stream = self.requester.chat_stream(
+            model=self.model_name,
+            messages=self._build_messages(sender, subject, body, style, custom_instructions),
+            temperature=0.7,
+            max_tokens=500
+        )
+        
+        started = False
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                # Match generate_reply, which strips leading whitespace
+                if not started:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    started = True
+                yield text
+        except Exception as e:
+            print(f"Error generating reply with OpenAI: {str(e)}")
+            raise e
+        finally:
+            # Closing the HTTP response makes OpenAI stop generating
+            stream.close()
+    
+    def metrics(self):
+        """Request counts, latency percentiles, token usage and tokens saved on prompts"""
+        return dict(self.requester.metrics(), prompt=self.prompt_builder.metrics())
 
 
 class LocalLLMService(BaseLLMService):
     """Local LLM implementation using llama-cpp-python"""
     
-    def __init__(self, model_path=None):
-        """Initialize the local LLM service with the path to the model"""
+    provider = 'local'
+    
+    # Longest a request may wait for and run on the model
+    REQUEST_TIMEOUT_SECONDS = 300
+    
+    # Tokens generated per reply; the prompt must leave room for them in the context
+    MAX_REPLY_TOKENS = 256
+    # Fewest body tokens worth drafting a reply from
+    MIN_BODY_TOKENS = 64
+    
+    # Seconds the last load of each model file took, to estimate progress on reloads
+    _load_durations = {}
+    
+    def __init__(self, model_path=None, llm_settings=None, load_async=True):
+        """Initialize the local LLM service with the path to the model.
+        
+        llm_settings is the local_llm_settings block from the settings. The
+        model loads on a background thread unless load_async is False; until
+        it is ready, state is 'loading' and is_configured() is False.
+        """
         self.model_path = model_path
+        self.params = resolve_llama_params(llm_settings)
+        self.model_name = os.path.basename(model_path) if model_path else None
         self.model = None
-        self._load_model()
+        self.prefix_cache = None
+        self.state = 'loading'
+        self.load_error = None
+        self._load_started = time.time()
+        self._load_finished = None
+        self._loaded = threading.Event()
+        self._closed = False
+        self.prompt_builder = PromptBuilder(self._count_tokens)
+        # A llama-cpp model can only run one completion at a time, so all
+        # requests go through a single prioritized worker
+        self._queue = InferenceQueue()
+        
+        if load_async:
+            threading.Thread(target=self._load_in_background, name='llm-load', daemon=True).start()
+        else:
+            self._load_in_background()
+    
+    def _load_in_background(self):
+        """Load the model and record the outcome"""
+        loaded = self._load_model()
+        if loaded and self._closed:
+            # Replaced while it was still loading
+            self.model = None
+            self.prefix_cache = None
+            loaded = False
+            self.load_error = "Service was closed while loading"
+        self._load_finished = time.time()
+        if loaded:
+            LocalLLMService._load_durations[self.model_path] = self._load_finished - self._load_started
+        self.state = 'ready' if loaded else 'failed'
+        self._loaded.set()
+    
+    def wait_until_ready(self, timeout=None):
+        """Wait for the model to finish loading (successfully or not)"""
+        return self._loaded.wait(timeout)
+    
+    def load_status(self):
+        """Loading state, elapsed time and, on a reload, estimated progress"""
+        finished = self._load_finished or time.time()
+        elapsed = finished - self._load_started
+        progress = None
+        if self.state != 'loading':
+            progress = 1.0
+        elif self.model_path in LocalLLMService._load_durations:
+            progress = round(min(0.99, elapsed / max(LocalLLMService._load_durations[self.model_path], 1e-6)), 2)
+        
+        model_size_mb = None
+        if self.model_path and os.path.exists(self.model_path):
+            model_size_mb = round(os.path.getsize(self.model_path) / (1024 * 1024))
+        
+        return {
+            'state': self.state,
+            'model': self.model_name,
+            'model_size_mb': model_size_mb,
+            'elapsed_seconds': round(elapsed, 1),
+            'progress': progress,
+            'error': self.load_error
+        }
     
     def _load_model(self):
         """Load the local LLM model"""
@@ -134,71 +339,150 @@ class LocalLLMService(BaseLLMService):
             
             if not os.path.exists(self.model_path):
                 print(f"Model file not found: {self.model_path}")
+                self.load_error = f"Model file not found: {self.model_path}"
                 return False
             
-            # Load the model with safer parameters
-            print(f"Loading model from: {self.model_path}")
-            self.model = Llama(
-                model_path=self.model_path,
-                n_ctx=512,        # Reduced context window
-                n_threads=2,      # Fewer threads
-                n_batch=8         # Smaller batch size
-            )
+            print(f"Loading model from: {self.model_path} with {self.params}")
+            self.model = Llama(model_path=self.model_path, **llama_kwargs(self.params))
             
             print(f"Successfully loaded model: {self.model_path}")
+            
+            # Reuse the evaluated preamble and style prompt across drafts
+            try:
+                self.prefix_cache = PrefixStateCache(self.model, self.model_path)
+            except Exception as e:
+                print(f"Prompt prefix caching unavailable: {str(e)}")
             return True
         except ImportError as e:
             print(f"llama-cpp-python package error: {str(e)}")
+            self.load_error = "Required package llama-cpp-python not installed. Run: pip install llama-cpp-python"
             return False
         except Exception as e:
             print(f"Error loading local LLM model: {str(e)}")
+            self.load_error = str(e)
             return False
     
     def is_configured(self):
         """Check if the local LLM model is loaded and ready"""
         return self.model is not None
     
-    def generate_reply(self, sender, subject, body, style='professional', custom_instructions=''):
-        """Generate a reply to an email using the local LLM model"""
+    def close(self):
+        """Stop the inference worker and drop the model so its memory can be freed"""
+        self._closed = True
+        self._queue.shutdown()
+        self.prefix_cache = None
+        self.model = None
+    
+    def _prompt_prefix(self, style):
+        """The fixed start of every prompt in a style"""
+        return f"You are an email assistant. {self._get_style_prompt(style)}"
+    
+    def _count_tokens(self, text):
+        """Tokens in text for the loaded model"""
+        return len(self.model.tokenize(text.encode('utf-8'), add_bos=False))
+    
+    def _build_prompt(self, sender, subject, body, style, custom_instructions):
+        """Build the completion prompt for a reply, fitting the body into the context"""
+        system_prompt = self._build_system_prompt(style, custom_instructions)
+        head = f"You are an email assistant. {system_prompt}\n\nEmail from: {sender}\nSubject: {subject}\n\nBody: "
+        tail = "\n\nPlease write a reply:"
+        # A few tokens of slack for tokenization differences at the joins
+        budget = int(self.params['context_size']) - self.MAX_REPLY_TOKENS - self._count_tokens(head + tail) - 8
+        if budget < self.MIN_BODY_TOKENS:
+            raise ValueError(
+                f"The custom instructions leave no room for the email in the model's "
+                f"{self.params['context_size']}-token context; shorten them or raise the context size"
+            )
+        return head + self.prompt_builder.prepare_body(body, budget) + tail
+    
+    def _complete(self, prompt, task, style=None):
+        """Run a completion on the inference worker, emitting each token.
+        
+        Streams internally even for blocking callers, so a cancelled or
+        timed-out request stops at the next token. With a style, the cached
+        state for its prompt prefix is restored first.
+        """
+        if style is not None and self.prefix_cache is not None:
+            # Keyed by the known style, so arbitrary request values can't add
+            # cache entries or choose the state file's name
+            key = self._style_key(style)
+            self.prefix_cache.restore(key, self._prompt_prefix(key))
+        
+        completion = self.model(
+            prompt,
+            max_tokens=self.MAX_REPLY_TOKENS,
+            temperature=0.7,
+            echo=False,
+            stream=True
+        )
+        
+        parts = []
+        try:
+            for chunk in completion:
+                if task.cancelled:
+                    break
+                text = chunk['choices'][0]['text']
+                parts.append(text)
+                task.emit(text)
+        finally:
+            # Closing llama-cpp's generator stops token generation
+            completion.close()
+        return ''.join(parts)
+    
+    def _submit(self, sender, subject, body, style, custom_instructions, priority, timeout):
+        """Queue a reply completion on the inference worker"""
         if not self.is_configured():
             raise RuntimeError("Local LLM model is not configured properly")
-            
-        # Extract sender name (if available)
-        sender_name = sender.split('<')[0].strip()
-        if not sender_name or sender_name == sender:
-            # If no name is available, try to extract from email
-            sender_name = sender.split('@')[0].split('.')[0].capitalize()
-        
-        # Prepare the system prompt based on the selected style
-        system_prompt = self._get_style_prompt(style)
         
-        # Add custom instructions if provided
-        if custom_instructions:
-            system_prompt += f"\n\n{custom_instructions}"
+        # Built on the worker, which owns the model and its tokenizer
+        return self._queue.submit(
+            lambda task: self._complete(
+                self._build_prompt(sender, subject, body, style, custom_instructions), task, style
+            ),
+            priority=priority,
+            timeout=timeout or self.REQUEST_TIMEOUT_SECONDS
+        )
+    
+    def generate_reply(self, sender, subject, body, style='professional', custom_instructions='',
+                       priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Generate a reply to an email using the local LLM model"""
+        task = self._submit(sender, subject, body, style, custom_instructions, priority, timeout)
+        try:
+            return task.result().strip()
+        except Exception as e:
+            print(f"Error generating reply with local LLM: {str(e)}")
+            raise e
+    
+    def stream_reply(self, sender, subject, body, style='professional', custom_instructions='',
+                     priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Stream a reply to an email from the local LLM model token by token"""
+        task = self._submit(sender, subject, body, style, custom_instructions, priority, timeout)
+        tokens = task.stream()
         
+        started = False
         try:
-            # Format a simpler prompt
-            prompt = f"You are an email assistant. {system_prompt}\n\nEmail from: {sender}\nSubject: {subject}\n\nBody: {body}\n\nPlease write a reply:"
-
-            # Generate response with simpler parameters
-            response = self.model(
-                prompt,
-                max_tokens=256,
-                temperature=0.7,
-                echo=False
-            )
-            
-            # Extract the generated text
-            if isinstance(response, dict) and 'choices' in response:
-                reply_content = response['choices'][0]['text'].strip()
-            else:
-                reply_content = str(response).strip()
-                
-            return reply_content
-            
+            for text in tokens:
+                # Match generate_reply, which strips leading whitespace
+                if not started:
+                    text = text.lstrip()
+                    if not text:
+                        continue
+                    started = True
+                yield text
         except Exception as e:
             print(f"Error generating reply with local LLM: {str(e)}")
             raise e
+        finally:
+            # Cancels the request if it has not finished
+            tokens.close()
+    
+    def metrics(self):
+        """Inference queue depth, wait times and outcomes, prefix cache use and prompt tokens saved"""
+        metrics = self._queue.metrics()
+        metrics['prompt'] = self.prompt_builder.metrics()
+        if self.prefix_cache is not None:
+            metrics['prefix_cache'] = self.prefix_cache.metrics()
+        return metrics
     
 
 def create_llm_service(provider_type, config):
@@ -206,6 +490,6 @@ def create_llm_service(provider_type, config):
     if provider_type == 'openai':
         return OpenAIService(config.get('api_key', ''))
     elif provider_type == 'local':
-        return LocalLLMService(config.get('model_path', ''))
+        return LocalLLMService(config.get('model_path', ''), config.get('llm_settings'))
     else:
         raise ValueError(f"Unsupported LLM provider type: {provider_type}")
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Disk-backed cache of full Gmail messages.
+Messages are stored zlib-compressed in a small SQLite database and evicted
+least-recently-used first once the cache grows past its size limit.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+class MessageCache:
+    """Size-bounded LRU cache of parsed messages keyed by message ID"""
+
+    def __init__(self, db_path='message_cache.db', max_bytes=256 * 1024 * 1024):
+        """Open (or create) the cache database at db_path"""
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                history_id INTEGER,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_last_access ON messages (last_access)')
+        self._conn.commit()
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM messages').fetchone()[0]
+
+    def get(self, message_id, min_history_id=None):
+        """Get a cached message, or None on a miss.
+
+        If min_history_id is given, entries older than it count as misses.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT history_id, data FROM messages WHERE id = ?', (message_id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            history_id, data = row
+            if min_history_id is not None and (history_id is None or history_id < int(min_history_id)):
+                return None
+
+            self._conn.execute('UPDATE messages SET last_access = ? WHERE id = ?', (time.time(), message_id))
+            self._conn.commit()
+
+        return json.loads(zlib.decompress(data))
+
+    def get_many(self, message_ids):
+        """Get several cached messages at once; returns a dict of the hits"""
+        hits = {}
+        ids = list(message_ids)
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT id, data FROM messages WHERE id IN ({placeholders})', chunk
+                ).fetchall()
+                for message_id, data in rows:
+                    hits[message_id] = data
+
+            if hits:
+                now = time.time()
+                self._conn.executemany(
+                    'UPDATE messages SET last_access = ? WHERE id = ?',
+                    [(now, message_id) for message_id in hits]
+                )
+                self._conn.commit()
+
+        return {message_id: json.loads(zlib.decompress(data)) for message_id, data in hits.items()}
+
+    def put(self, message):
+        """Store a parsed message, evicting old entries if over the size limit"""
+        data = zlib.compress(json.dumps(message).encode('utf-8'))
+        history_id = message.get('historyId')
+
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM messages WHERE id = ?', (message['id'],)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO messages (id, history_id, data, size, last_access) VALUES (?, ?, ?, ?, ?)',
+                (message['id'], int(history_id) if history_id else None, data, len(data), time.time())
+            )
+            self._total_bytes += len(data) - (old[0] if old else 0)
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def invalidate(self, message_id):
+        """Remove a message from the cache"""
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM messages WHERE id = ?', (message_id,)).fetchone()
+            if old:
+                self._conn.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+                self._conn.commit()
+                self._total_bytes -= old[0]
+
+    def _evict(self):
+        """Drop least recently used entries until back under 90% of the limit"""
+        target = self.max_bytes * 0.9
+        cursor = self._conn.execute('SELECT id, size FROM messages ORDER BY last_access')
+        evicted = []
+        for message_id, size in cursor:
+            if self._total_bytes <= target:
+                break
+            evicted.append((message_id,))
+            self._total_bytes -= size
+        cursor.close()
+        self._conn.executemany('DELETE FROM messages WHERE id = ?', evicted)
@@ -0,0 +1,156 @@
+"""
+Hot swapping between LLM services.
+A new model or provider is loaded alongside the one serving requests and
+checked with a short smoke generation. Only then is it switched in. The
+old service keeps serving the requests it already started, and once they
+have drained it is closed so its memory is released. If the new service
+fails to load or fails the smoke test, the old one stays in place.
+"""
+
+import gc
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+class ModelManager:
+    """Holds the active LLM service and swaps it without downtime"""
+
+    # Longest to wait for a new model to load, and for old requests to finish
+    LOAD_TIMEOUT_SECONDS = 600
+    DRAIN_TIMEOUT_SECONDS = 300
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._current = None
+        self._in_use = {}
+        # One swap at a time; a later one waits for the earlier to finish
+        self._swap_lock = threading.Lock()
+        self._pending = None
+        self._pending_since = None
+        self.last_swap = None
+
+    @property
+    def current(self):
+        """The service currently serving requests, or None"""
+        with self._condition:
+            return self._current
+
+    def acquire(self):
+        """Borrow the current service; every acquire must be matched by release()"""
+        with self._condition:
+            service = self._current
+            if service is not None:
+                self._in_use[service] = self._in_use.get(service, 0) + 1
+            return service
+
+    def release(self, service):
+        """Return a service borrowed with acquire()"""
+        if service is None:
+            return
+        with self._condition:
+            self._in_use[service] -= 1
+            if not self._in_use[service]:
+                del self._in_use[service]
+            self._condition.notify_all()
+
+    @contextmanager
+    def use(self):
+        """Borrow the current service for one request.
+
+        A service that is swapped out is not closed until every request
+        that borrowed it has finished.
+        """
+        service = self.acquire()
+        try:
+            yield service
+        finally:
+            self.release(service)
+
+    def swap(self, service, smoke_test=True):
+        """Switch to service once it is loaded and (optionally) passes a smoke test.
+
+        If nothing usable is being served (no service yet, or the current one
+        is still loading or failed), service is switched in straight away.
+        Returns True if service is now current.
+        """
+        with self._swap_lock:
+            if service is self.current:
+                return True
+            description = self.describe(service)
+            self._pending = service
+            self._pending_since = datetime.now().isoformat()
+            try:
+                old = self.current
+                if old is None or old.state != 'ready':
+                    self._switch(service, old)
+                    self._finish_swap(description, 'switched')
+                    return True
+
+                if not service.wait_until_ready(self.LOAD_TIMEOUT_SECONDS) or not service.is_configured():
+                    error = (service.load_status() or {}).get('error') or 'Service did not become ready'
+                    return self._reject(service, description, error)
+
+                if smoke_test:
+                    try:
+                        reply = service.generate_reply(
+                            sender="Model Check <check@example.com>",
+                            subject="Quick check",
+                            body="Please confirm you received this message.",
+                            style='concise'
+                        )
+                    except Exception as e:
+                        return self._reject(service, description, f"Smoke test failed: {str(e)}")
+                    if not reply or not reply.strip():
+                        return self._reject(service, description, "Smoke test returned an empty reply")
+
+                self._switch(service, old)
+                self._finish_swap(description, 'switched')
+                return True
+            finally:
+                self._pending = None
+
+    def _switch(self, service, old):
+        """Make service current, then drain and close old"""
+        with self._condition:
+            self._current = service
+        print(f"Switched LLM service to {self.describe(service)}")
+
+        if old is None or old is service:
+            return
+        with self._condition:
+            drained = self._condition.wait_for(lambda: old not in self._in_use, timeout=self.DRAIN_TIMEOUT_SECONDS)
+        if not drained:
+            print("Closing previous LLM service with requests still in flight")
+        old.close()
+        gc.collect()
+
+    def _reject(self, service, description, error):
+        """Discard a service that failed to come up, keeping the current one"""
+        print(f"Not switching to {description}: {error}")
+        service.close()
+        gc.collect()
+        self._finish_swap(description, 'rejected', error)
+        return False
+
+    def _finish_swap(self, description, outcome, error=None):
+        self.last_swap = dict(description, outcome=outcome, error=error, finished_at=datetime.now().isoformat())
+
+    @staticmethod
+    def describe(service):
+        """Which provider and model a service runs"""
+        if service is None:
+            return {'provider': None, 'model': None}
+        return {'provider': service.provider, 'model': service.model_name}
+
+    def status(self):
+        """The active model, any swap in progress and the last swap's outcome"""
+        pending = self._pending
+        return {
+            'active': self.describe(self.current),
+            'pending': dict(
+                self.describe(pending),
+                started_at=self._pending_since,
+                loading=pending.load_status()
+            ) if pending is not None else None,
+            'last_swap': self.last_swap
+        }
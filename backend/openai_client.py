@@ -0,0 +1,286 @@
+"""
+Request layer for the OpenAI API.
+All OpenAI services share one HTTP connection pool. Each service caps the
+number of calls in flight and paces them with token buckets that follow the
+x-ratelimit-* response headers, so bursts of drafts queue locally instead of
+tripping the provider's limits. Rate-limited, timed-out and 5xx calls are
+retried with exponential backoff and jitter within an overall deadline, and
+every call's latency and token usage is recorded.
+"""
+
+import re
+import time
+import random
+import threading
+from collections import deque
+import httpx
+import openai
+
+# One pool for every OpenAI service, so swapping services keeps warm connections
+_http_client = None
+_http_client_lock = threading.Lock()
+
+def shared_http_client():
+    """The process-wide HTTP client used for OpenAI calls"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+        return _http_client
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+def parse_reset(value):
+    """Seconds in a rate-limit reset header such as '1s', '6m0s' or '20ms', or None"""
+    if not value:
+        return None
+    seconds = 0.0
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    for amount, unit in parts:
+        seconds += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return seconds
+
+class TokenBucket:
+    """Token bucket whose size and refill rate follow the provider's reported limits"""
+
+    def __init__(self, capacity, period=60.0):
+        """Allow capacity units per period seconds until the headers say otherwise"""
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount, deadline):
+        """Wait for amount units; False if that would take past deadline"""
+        # A single call larger than the whole bucket must still be able to run
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self.blocked_until - now, 0.0)
+                if not wait and self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                if not wait:
+                    wait = (amount - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    def update(self, limit, remaining, reset_seconds):
+        """Adopt the limit, remaining count and reset time from response headers"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = float(limit)
+                # Limits are per minute; the reset time says how fast they come back
+                self.rate = self.capacity / 60.0
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+                if remaining <= 0 and reset_seconds:
+                    self.blocked_until = max(self.blocked_until, now + reset_seconds)
+
+    def block(self, seconds):
+        """Stop handing out units for seconds (after a 429)"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class OpenAIRequester:
+    """Runs OpenAI calls with bounded concurrency, pacing, retries and accounting"""
+
+    # Starting guesses until the first response reports the real limits
+    DEFAULT_REQUESTS_PER_MINUTE = 500
+    DEFAULT_TOKENS_PER_MINUTE = 60000
+
+    def __init__(self, client, max_concurrency=4, max_retries=4, deadline_seconds=90,
+                 base_backoff=0.5, max_backoff=20):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.deadline_seconds = deadline_seconds
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._requests = TokenBucket(self.DEFAULT_REQUESTS_PER_MINUTE)
+        self._tokens = TokenBucket(self.DEFAULT_TOKENS_PER_MINUTE)
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=500)
+        self._stats = {
+            'calls': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'in_flight': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0
+        }
+
+    @staticmethod
+    def estimate_tokens(messages, max_tokens):
+        """Rough token cost of a chat call, for pacing before the real usage is known"""
+        characters = sum(len(message.get('content') or '') for message in messages)
+        return characters // 4 + max_tokens
+
+    def chat(self, **kwargs):
+        """Create a chat completion; returns the parsed response"""
+        response = self._call(kwargs)
+        try:
+            usage = response.usage
+            if usage:
+                self._count(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+            return response
+        finally:
+            self._release()
+
+    def chat_stream(self, **kwargs):
+        """Create a streaming chat completion; yields chunks.
+
+        The concurrency slot is held until the generator is exhausted or
+        closed; closing it also closes the HTTP response.
+        """
+        stream = self._call(dict(kwargs, stream=True))
+        completion_chunks = 0
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    completion_chunks += 1
+                yield chunk
+        finally:
+            stream.response.close()
+            # Streams don't report usage; each content chunk is about one token
+            self._count(
+                prompt_tokens=self.estimate_tokens(kwargs['messages'], 0),
+                completion_tokens=completion_chunks
+            )
+            self._release()
+
+    def _call(self, kwargs):
+        """Make the call, retrying transient failures; holds a slot on success"""
+        start = time.monotonic()
+        deadline = start + self.deadline_seconds
+        cost = self.estimate_tokens(kwargs['messages'], kwargs.get('max_tokens') or 0)
+
+        with self._stats_lock:
+            self._stats['calls'] += 1
+
+        attempt = 0
+        while True:
+            if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                self._fail(start)
+                raise TimeoutError("Timed out waiting for a free OpenAI request slot")
+            try:
+                if not (self._requests.acquire(1, deadline) and self._tokens.acquire(cost, deadline)):
+                    raise TimeoutError("OpenAI rate limit would be exceeded before the request deadline")
+
+                raw = self.client.chat.completions.with_raw_response.create(**kwargs)
+                self._update_limits(raw.headers)
+                response = raw.parse()
+            except Exception as e:
+                self._slots.release()
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                    self._fail(start)
+                    raise e
+                attempt += 1
+                with self._stats_lock:
+                    self._stats['retries'] += 1
+                print(f"OpenAI call failed ({str(e)}), retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            with self._stats_lock:
+                self._stats['succeeded'] += 1
+                self._stats['in_flight'] += 1
+                self._latencies.append(time.monotonic() - start)
+            return response
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying after error, or None if it shouldn't be retried"""
+        retry_after = None
+        if isinstance(error, openai.APIStatusError):
+            self._update_limits(error.response.headers)
+            retry_after = parse_reset(error.response.headers.get('retry-after'))
+            if isinstance(error, openai.RateLimitError):
+                with self._stats_lock:
+                    self._stats['rate_limited'] += 1
+                # An exhausted quota won't come back by retrying
+                if getattr(error, 'code', None) == 'insufficient_quota':
+                    return None
+            elif error.status_code < 500 and error.status_code not in (408, 409):
+                return None
+        elif not isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return None
+
+        # Exponential backoff with full jitter, but never sooner than the server asked
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, retry_after)
+            self._requests.block(retry_after)
+        return delay
+
+    def _update_limits(self, headers):
+        """Follow the rate limits reported in response headers"""
+        for bucket, kind in ((self._requests, 'requests'), (self._tokens, 'tokens')):
+            try:
+                limit = headers.get(f'x-ratelimit-limit-{kind}')
+                remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+                bucket.update(
+                    int(limit) if limit else None,
+                    int(remaining) if remaining is not None else None,
+                    parse_reset(headers.get(f'x-ratelimit-reset-{kind}'))
+                )
+            except ValueError:
+                continue
+
+    def _release(self):
+        with self._stats_lock:
+            self._stats['in_flight'] -= 1
+        self._slots.release()
+
+    def _fail(self, start):
+        with self._stats_lock:
+            self._stats['failed'] += 1
+            self._latencies.append(time.monotonic() - start)
+
+    def _count(self, prompt_tokens=0, completion_tokens=0):
+        with self._stats_lock:
+            self._stats['prompt_tokens'] += prompt_tokens or 0
+            self._stats['completion_tokens'] += completion_tokens or 0
+
+    def metrics(self):
+        """Call counts, latency percentiles (time to response) and token usage"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3)
+
+        return dict(
+            stats,
+            max_concurrency=self.max_concurrency,
+            latency_p50_seconds=percentile(0.50),
+            latency_p95_seconds=percentile(0.95),
+            latency_p99_seconds=percentile(0.99),
+            rate_limit_requests_remaining=int(self._requests.tokens),
+            rate_limit_tokens_remaining=int(self._tokens.tokens)
+        )
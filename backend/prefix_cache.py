@@ -0,0 +1,109 @@
+"""
+Cached llama-cpp KV state for fixed prompt prefixes.
+Every local draft starts with the same preamble and style prompt. The model
+state after evaluating that prefix is saved once per style, kept in memory
+and persisted next to the model file, then restored before each completion.
+llama-cpp reuses the longest matching run of already-evaluated tokens, so
+only the email-specific rest of the prompt has to be evaluated.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+
+class PrefixStateCache:
+    """Saves and restores a llama-cpp model's state after a prompt prefix"""
+
+    def __init__(self, model, model_path, state_dir=None):
+        """Cache states for model; files go in state_dir (default: next to the model)"""
+        self.model = model
+        self.state_dir = state_dir or model_path + '.prefix_states'
+        self._states = {}
+        self.hits = 0
+        self.misses = 0
+
+        # Saved states are only valid for this exact model file and context size
+        stat = os.stat(model_path)
+        self._model_fingerprint = f"{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}:{model.n_ctx()}"
+
+    def _state_path(self, name, prefix):
+        digest = hashlib.sha1(f"{self._model_fingerprint}\n{prefix}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.state_dir, f"{name}-{digest}.state")
+
+    def restore(self, name, prefix):
+        """Load the model state for prefix, building and saving it if needed.
+
+        Must run on the thread that owns the model. Returns True if a cached
+        state was restored.
+        """
+        key = (name, prefix)
+        state = self._states.get(key)
+        if state is None:
+            state = self._load(name, prefix)
+            if state is None:
+                state = self._build(name, prefix)
+            self._states[key] = state
+
+        if state is False:
+            # Building it failed before; don't retry on every request
+            return False
+
+        self.model.load_state(state)
+        self.hits += 1
+        return True
+
+    def _load(self, name, prefix):
+        """Read a persisted state, or None"""
+        path = self._state_path(name, prefix)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+        except Exception as e:
+            print(f"Ignoring unreadable prefix state {path}: {str(e)}")
+            return None
+
+    def _build(self, name, prefix):
+        """Evaluate prefix from a clean state and save the result"""
+        self.misses += 1
+        try:
+            start = time.time()
+            self.model.reset()
+            # Evaluating through a completion tokenizes the prefix exactly as
+            # a full prompt is tokenized; the one sampled token is discarded
+            # when the state is reused, as it won't match the real prompt
+            self.model(prefix, max_tokens=1, temperature=0.0)
+            state = self.model.save_state()
+            print(f"Cached prompt prefix '{name}' ({state.n_tokens} tokens) in {time.time() - start:.1f}s")
+        except Exception as e:
+            print(f"Error caching prompt prefix '{name}': {str(e)}")
+            return False
+
+        self._save(name, prefix, state)
+        return state
+
+    def _save(self, name, prefix, state):
+        """Persist a state, replacing older ones for the same name"""
+        path = self._state_path(name, prefix)
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            for filename in os.listdir(self.state_dir):
+                if filename.startswith(f"{name}-") and filename.endswith('.state'):
+                    os.remove(os.path.join(self.state_dir, filename))
+
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as file:
+                pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Error saving prompt prefix state: {str(e)}")
+
+    def metrics(self):
+        """Prefix states held and how often they were used"""
+        return {
+            'cached_prefixes': sorted(name for (name, _), state in self._states.items() if state is not False),
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -0,0 +1,228 @@
+"""
+Email body preparation for reply prompts.
+Replies usually carry the whole thread below them as quoted text, plus
+signatures and legal disclaimers, none of which helps draft a reply. The
+body is cut down to the newest message before it goes into a prompt, and if
+that is still over the token budget, the start of the message and its
+questions are kept and the rest is elided.
+"""
+
+import re
+import threading
+
+# A line that starts the quoted previous message in a reply
+_REPLY_HEADERS = [
+    re.compile(r'^\s*On\b.{0,200}\bwrote:\s*$', re.IGNORECASE),
+    re.compile(r'^\s*-{2,}\s*Original Message\s*-{2,}\s*$', re.IGNORECASE),
+    re.compile(r'^\s*_{10,}\s*$'),
+    re.compile(r'^\s*Le\b.{0,200}\ba écrit\s*:\s*$', re.IGNORECASE),
+    re.compile(r'^\s*Am\b.{0,200}\bschrieb\b.{0,100}:\s*$', re.IGNORECASE)
+]
+
+# An Outlook-style quoted header: From: followed by Sent:/Date: within a few lines
+_HEADER_FIELD = re.compile(r'^\s*\*?(From|Sent|Date|To|Cc|Subject)\s*:\*?\s', re.IGNORECASE)
+
+# The start of a forwarded message; its header lines are dropped, its text kept
+_FORWARD_MARKERS = re.compile(
+    r'^\s*(-{2,}\s*Forwarded message\s*-{2,}|Begin forwarded message:)\s*$', re.IGNORECASE
+)
+
+# Lines that end the message proper. Device signatures must be the whole
+# line and name a device within a few words, so a sentence that merely
+# starts "Sent from my" is kept
+_DEVICE = r'(iPhone|iPad|Android|BlackBerry|phone|smartphone|mobile|mobile device|device|tablet)'
+_SIGNATURE_MARKERS = re.compile(
+    r'^\s*(--|__|Sent from my ([\w-]+,? ){0,3}' + _DEVICE + r'[.!]?|Sent from Mail for Windows( \d+)?|'
+    r'Get Outlook for \w+)\s*$', re.IGNORECASE
+)
+_SIGN_OFFS = re.compile(
+    r'^\s*(thanks|thank you|many thanks|best|best regards|kind regards|regards|warm regards|cheers|'
+    r'sincerely|all the best|talk soon)\s*[,.!]?\s*$', re.IGNORECASE
+)
+# A signature block after a sign-off is at most this many lines
+_MAX_SIGNATURE_LINES = 8
+
+_DISCLAIMER = re.compile(
+    r'(confidential|privileged).{0,300}(intended recipient|intended solely|addressee)'
+    r'|(intended recipient|intended solely).{0,300}(confidential|privileged)'
+    r'|please consider the environment before printing'
+    r'|this (e-?mail|message) (and any attachments )?(is|may be) (confidential|privileged)',
+    re.IGNORECASE | re.DOTALL
+)
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=\S)')
+
+ELISION = '[...]'
+
+def estimate_tokens(text):
+    """Rough token count for when no tokenizer is available (~4 characters a token)"""
+    return (len(text) + 3) // 4
+
+def openai_token_counter(model_name):
+    """Token counter for an OpenAI model, using the model's tiktoken encoding.
+
+    Models tiktoken doesn't know yet use cl100k_base; if tiktoken is missing
+    or can't load an encoding, token counts are estimated.
+    """
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        print(f"Estimating OpenAI token counts, tiktoken is unavailable: {str(e)}")
+        return estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+def _is_reply_header(lines, index):
+    """Whether lines[index] starts the quoted previous message"""
+    line = lines[index]
+    if any(pattern.match(line) for pattern in _REPLY_HEADERS):
+        return True
+    # "On <date>, <name> <address>" is often wrapped before "wrote:"
+    if index + 1 < len(lines) and re.match(r'^\s*On\b', line, re.IGNORECASE) and \
+            re.match(r'^.{0,100}\bwrote:\s*$', lines[index + 1], re.IGNORECASE):
+        return True
+    if re.match(r'^\s*\*?From\s*:', line, re.IGNORECASE):
+        following = lines[index + 1:index + 5]
+        return any(re.match(r'^\s*\*?(Sent|Date)\s*:', other, re.IGNORECASE) for other in following)
+    return False
+
+def _has_more_text(lines, start):
+    """Whether lines from start hold more of the message, beyond disclaimers and quotes"""
+    tail = []
+    for index in range(start, len(lines)):
+        if _FORWARD_MARKERS.match(lines[index]):
+            return True
+        if _is_reply_header(lines, index) or _SIGNATURE_MARKERS.match(lines[index]):
+            break
+        if not lines[index].lstrip().startswith('>'):
+            tail.append(lines[index])
+    paragraphs = re.split(r'\n\s*\n', '\n'.join(tail))
+    return any(paragraph.strip() and not _DISCLAIMER.search(paragraph) for paragraph in paragraphs)
+
+def strip_quoted(body):
+    """Remove quoted history, forwarded headers, signatures and disclaimers"""
+    lines = body.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    kept = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+
+        if _FORWARD_MARKERS.match(line):
+            # Skip the forwarded message's header block but keep its text
+            index += 1
+            while index < len(lines) and (_HEADER_FIELD.match(lines[index]) or not lines[index].strip()):
+                index += 1
+            continue
+
+        if _is_reply_header(lines, index) and any(text.strip() for text in kept):
+            break
+        if _SIGNATURE_MARKERS.match(line):
+            break
+        if line.lstrip().startswith('>'):
+            index += 1
+            continue
+
+        kept.append(line)
+        if _SIGN_OFFS.match(line):
+            # Keep the sign-off and the name under it, drop a short signature block.
+            # The block starts right under the sign-off; after a blank line it's new text
+            block = []
+            for other in lines[index + 1:]:
+                if not other.strip():
+                    break
+                block.append(other)
+            name = [other for other in block if other.strip()][:1]
+            if len(block) <= _MAX_SIGNATURE_LINES and not _has_more_text(lines, index + 1 + len(block)):
+                kept.extend(name)
+                break
+        index += 1
+
+    paragraphs = re.split(r'\n\s*\n', '\n'.join(kept))
+    paragraphs = [paragraph.strip() for paragraph in paragraphs if paragraph.strip()]
+    paragraphs = [paragraph for paragraph in paragraphs if not _DISCLAIMER.search(paragraph)]
+    return '\n\n'.join(paragraphs)
+
+def fit_to_budget(text, budget, count_tokens):
+    """Shorten text to about budget tokens.
+
+    Keeps the opening of the message (the newest content once quoted history
+    is gone) and every question that fits, marking gaps with [...].
+    """
+    if count_tokens(text) <= budget:
+        return text
+
+    # Sentences, keeping paragraph breaks attached so they survive the join
+    sentences = []
+    for paragraph in text.split('\n\n'):
+        parts = _SENTENCE_END.split(paragraph.strip())
+        sentences.extend(parts[:-1])
+        sentences.append(parts[-1] + '\n\n')
+    costs = [count_tokens(sentence) + 1 for sentence in sentences]
+    marker_cost = count_tokens(ELISION) + 1
+
+    keep = set()
+    used = 0
+    # Questions first, since those are what the reply has to answer
+    for index, sentence in enumerate(sentences):
+        if sentence.rstrip().endswith('?') and used + costs[index] + marker_cost <= budget:
+            keep.add(index)
+            used += costs[index] + marker_cost
+    # Then the opening, in order, until the budget runs out
+    for index in range(len(sentences)):
+        if index in keep:
+            continue
+        if used + costs[index] > budget:
+            break
+        keep.add(index)
+        used += costs[index]
+
+    if not keep:
+        # One enormous sentence; cut it proportionally
+        return text[:max(1, len(text) * budget // max(count_tokens(text), 1))].rstrip() + ' ' + ELISION
+
+    result = []
+    for index, sentence in enumerate(sentences):
+        if index in keep:
+            result.append(sentence)
+        elif not result or result[-1] != ELISION + ' ':
+            result.append(ELISION + ' ')
+    return re.sub(r'[ \t]*\n[ \t]*', '\n', ' '.join(part.strip(' ') for part in result)).strip()
+
+class PromptBuilder:
+    """Prepares email bodies for prompts and counts the tokens it saves"""
+
+    def __init__(self, count_tokens=None):
+        """count_tokens(text) returns the active model's token count"""
+        self.count_tokens = count_tokens or estimate_tokens
+        self._lock = threading.Lock()
+        self._stats = {'bodies': 0, 'trimmed': 0, 'tokens_in': 0, 'tokens_out': 0}
+
+    def prepare_body(self, body, budget):
+        """The body with quoted history and boilerplate removed, within budget tokens"""
+        body = body or ''
+        before = self.count_tokens(body)
+        text = strip_quoted(body)
+        trimmed = self.count_tokens(text) > budget
+        if trimmed:
+            text = fit_to_budget(text, max(budget, 1), self.count_tokens)
+        after = self.count_tokens(text)
+
+        with self._lock:
+            self._stats['bodies'] += 1
+            self._stats['trimmed'] += int(trimmed)
+            self._stats['tokens_in'] += before
+            self._stats['tokens_out'] += after
+        if before > after:
+            print(f"Email body cut from {before} to {after} tokens ({before - after} saved"
+                  f"{', trimmed to budget' if trimmed else ''})")
+        return text
+
+    def metrics(self):
+        """Bodies prepared and tokens saved"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['tokens_saved'] = stats['tokens_in'] - stats['tokens_out']
+        return stats
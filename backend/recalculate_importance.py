@@ -1,35 +1,91 @@
+"""
+Bulk importance rescoring tool.
+Re-extracts scoring features for stored emails whose keyword or sender
+criteria are out of date, fetching missing bodies with bounded concurrency
+and extracting features across a process pool, then rescores every email
+with the current weights. Progress is checkpointed so an interrupted run
+resumes where it stopped.
+
+Usage: python recalculate_importance.py [--dry-run] [--all] [--workers N]
+"""
+
 import os
 import json
-import re
-from datetime import datetime
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import config
 from gmail_service import GmailService
-from email_processor import EmailProcessor
+from email_processor import EmailProcessor, as_score
+from importance_scorer import ImportanceScorer
+
+CHECKPOINT_FILE = 'recalculate_checkpoint.json'
+
+# Scorer used inside each worker process
+_worker_scorer = None
+
+def _init_worker(settings):
+    """Build the scorer once per worker process"""
+    global _worker_scorer
+    _worker_scorer = ImportanceScorer.from_settings(settings)
+
+def _extract_features(emails):
+    """Extract features for a list of emails (runs in a worker process)"""
+    return {email['id']: _worker_scorer.extract_features(email) for email in emails}
+
+def _load_checkpoint(path, signature):
+    """Get the IDs already featurized by an interrupted run with the same criteria"""
+    if not os.path.exists(path):
+        return set()
+    try:
+        with open(path, 'r') as file:
+            checkpoint = json.load(file)
+    except Exception as e:
+        print(f"Ignoring unreadable checkpoint: {str(e)}")
+        return set()
+    if checkpoint.get('signature') != signature:
+        print("Checkpoint was written for different criteria, starting over")
+        return set()
+    return set(checkpoint.get('done', []))
+
+def _save_checkpoint(path, signature, done_ids):
+    """Record progress, replacing the file atomically"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump({'signature': signature, 'done': sorted(done_ids)}, file)
+    os.replace(temp_path, path)
 
-def recalculate_importance_scores():
+class _BodyFetcher:
+    """Fetches full emails with bounded concurrency"""
+
+    def __init__(self, email_processor, batch_size):
+        self.email_processor = email_processor
+        self.batch_size = batch_size
+
+    def fetch(self, email_ids, executor):
+        """Fetch a chunk of emails; returns a dict of ID -> email (None on failure).
+
+        Emails are fetched the way the app scores them, so in thread mode a
+        thread's row gets the whole thread's text (GmailService gives each
+        fetch thread its own API client).
+        """
+        batches = [email_ids[i:i + self.batch_size] for i in range(0, len(email_ids), self.batch_size)]
+        emails = {}
+        for result in executor.map(self.email_processor.fetch_for_scoring, batches):
+            emails.update(result)
+        return emails
+
+def recalculate_importance_scores(dry_run=False, refeaturize_all=False, workers=None,
+                                  fetch_concurrency=4, chunk_size=500, checkpoint_file=CHECKPOINT_FILE,
+                                  show_changes=20):
     """
     Recalculate importance scores for all emails based on current settings.
     This is useful after changing importance criteria or weights.
     """
     print("Starting importance score recalculation...")
-    
+
     # Load settings
     settings = config.load_settings()
-    
-    # Check if data file exists
-    data_file = 'email_data.json'
-    if not os.path.exists(data_file):
-        print("Email data file not found. No scores to recalculate.")
-        return
-    
-    # Load email data
-    try:
-        with open(data_file, 'r') as file:
-            email_data = json.load(file)
-    except Exception as e:
-        print(f"Error loading email data: {str(e)}")
-        return
-    
+
     # Initialize Gmail service
     try:
         gmail_service = GmailService()
@@ -37,95 +93,110 @@ def recalculate_importance_scores():
     except Exception as e:
         print(f"Error authenticating with Gmail: {str(e)}")
         return
-    
-    # Create email processor
+
+    # Create email processor; its store and scorer are reused as-is
     email_processor = EmailProcessor(gmail_service)
-    
-    # Get keywords and important senders
-    keywords = settings.get('important_keywords', [])
-    important_senders = settings.get('important_senders', [])
-    
-    # Get weights
-    weights = settings.get('importance_weights', {
-        'subject_keyword': 3,
-        'body_keyword': 1,
-        'important_sender': 5,
-        'question_mark': 1,
-        'direct_message': 2,
-        'email_length': 1
-    })
-    
-    print(f"Using criteria: {len(keywords)} keywords, {len(important_senders)} important senders")
-    print(f"Weights: {weights}")
-    
-    # Counter for processed emails
-    processed_count = 0
-    updated_count = 0
-    
-    # Process each email
-    for email in email_data['important_emails']:
-        processed_count += 1
-        
-        # Get full email content from Gmail
-        try:
-            full_email = gmail_service.get_email(email['id'])
-            
-            if full_email:
-                # Calculate new importance score
-                old_score = email['importance_score']
-                
-                # Calculate score using the same logic as in EmailProcessor
-                score = 0
-                
-                # Keyword matches in subject
-                for keyword in keywords:
-                    if keyword.lower() in full_email['subject'].lower():
-                        score += weights.get('subject_keyword', 3)
-                
-                # Keyword matches in body
-                for keyword in keywords:
-                    if keyword.lower() in full_email['body'].lower():
-                        score += weights.get('body_keyword', 1)
-                
-                # Important sender
-                for sender in important_senders:
-                    if sender.lower() in full_email['sender'].lower():
-                        score += weights.get('important_sender', 5)
-                        break
-                
-                # Contains questions
-                question_count = full_email['body'].count('?')
-                score += min(question_count, 3) * weights.get('question_mark', 1)
-                
-                # Contains direct addressing ("you", "your")
-                you_count = len(re.findall(r'\byou\b|\byour\b', full_email['body'].lower()))
-                if you_count >= 2:
-                    score += 1
-                
-                # Length of email
-                body_length = len(full_email['body'])
-                if 100 <= body_length <= 1000:
-                    score += weights.get('email_length', 1)
-                
-                # Email is a direct message (not CC'd)
-                if not full_email['cc']:
-                    score += weights.get('direct_message', 2)
-                
-                # Update score if changed
-                if score != old_score:
-                    email['importance_score'] = score
-                    updated_count += 1
-                    print(f"Updated email '{full_email['subject']}': {old_score} -> {score}")
-        except Exception as e:
-            print(f"Error processing email {email['id']}: {str(e)}")
-    
+    scorer = email_processor.scorer
+    signature = ImportanceScorer.feature_signature(settings)
+
+    print(f"Using criteria: {len(scorer.keywords)} keywords, {len(scorer.important_senders)} important senders")
+    print(f"Weights: {scorer.weights}")
+
+    # Work out which emails need their features (re)extracted
+    if refeaturize_all:
+        stale_ids = [email['id'] for email in email_processor.store.get_all_emails()]
+    else:
+        stale_ids = email_processor.store.get_stale_feature_ids(signature)
+
+    done_ids = set() if dry_run else _load_checkpoint(checkpoint_file, signature)
+    todo_ids = [email_id for email_id in stale_ids if email_id not in done_ids]
+    if done_ids:
+        print(f"Resuming from checkpoint: {len(stale_ids) - len(todo_ids)} emails already done")
+    print(f"{len(todo_ids)} emails need features extracted")
+
+    # Features extracted in a dry run are kept in memory instead of saved
+    new_features = {}
+    failed_count = 0
+
+    fetcher = _BodyFetcher(email_processor, settings.get('gmail_batch_size', 50))
+    with ThreadPoolExecutor(max_workers=fetch_concurrency) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings,)) as score_pool:
+        worker_count = workers or os.cpu_count() or 1
+
+        for start in range(0, len(todo_ids), chunk_size):
+            chunk = todo_ids[start:start + chunk_size]
+            emails = fetcher.fetch(chunk, fetch_pool)
+            fetched = [email for email in emails.values() if email]
+            failed_count += len(chunk) - len(fetched)
+
+            # Split the chunk across the worker processes
+            slice_size = max(1, -(-len(fetched) // worker_count))
+            slices = [fetched[i:i + slice_size] for i in range(0, len(fetched), slice_size)]
+            chunk_features = {}
+            for result in score_pool.map(_extract_features, slices):
+                chunk_features.update(result)
+
+            if dry_run:
+                new_features.update(chunk_features)
+            else:
+                email_processor.store.upsert_features(chunk_features, signature)
+                done_ids.update(chunk_features)
+                _save_checkpoint(checkpoint_file, signature, done_ids)
+
+            print(f"Extracted features for {min(start + chunk_size, len(todo_ids))}/{len(todo_ids)} emails")
+
+    # Score everything with the current weights
+    ids, new_scores, changed = email_processor.compute_score_changes(override_features=new_features)
+
+    for i in changed[:show_changes]:
+        email = email_processor.store.get_email(ids[i])
+        print(f"{'Would update' if dry_run else 'Updated'} email '{email['subject']}': "
+              f"{email['importance_score']} -> {as_score(new_scores[i])}")
+    if len(changed) > show_changes:
+        print(f"... and {len(changed) - show_changes} more")
+
+    if failed_count:
+        print(f"Warning: {failed_count} emails could not be fetched and keep their old features")
+
+    if dry_run:
+        print(f"Dry run complete. {len(ids)} emails scored, {len(changed)} scores would change. Nothing was saved.")
+        return
+
     # Save updated email data
     try:
-        with open(data_file, 'w') as file:
-            json.dump(email_data, file)
-        print(f"Recalculation complete. Processed {processed_count} emails, updated {updated_count} scores.")
+        email_processor.save_scores(ids, new_scores, changed)
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        print(f"Recalculation complete. Processed {len(ids)} emails, updated {len(changed)} scores.")
     except Exception as e:
         print(f"Error saving updated email data: {str(e)}")
 
+def main():
+    """Parse command line arguments and run the recalculation"""
+    parser = argparse.ArgumentParser(description="Recalculate importance scores for stored emails")
+    parser.add_argument('--dry-run', action='store_true', help='Report score changes without saving anything')
+    parser.add_argument('--all', action='store_true', help='Re-extract features for every email, not just stale ones')
+    parser.add_argument('--workers', type=int, default=None, help='Scoring processes (default: one per CPU)')
+    parser.add_argument('--fetch-concurrency', type=int, default=4, help='Concurrent Gmail batch requests (default: 4)')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Emails per checkpointed chunk (default: 500)')
+    parser.add_argument('--checkpoint', type=str, default=CHECKPOINT_FILE, help=f'Checkpoint file (default: {CHECKPOINT_FILE})')
+    parser.add_argument('--restart', action='store_true', help='Ignore any existing checkpoint')
+    parser.add_argument('--show', type=int, default=20, help='Number of score changes to print (default: 20)')
+
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    recalculate_importance_scores(
+        dry_run=args.dry_run,
+        refeaturize_all=args.all,
+        workers=args.workers,
+        fetch_concurrency=max(1, args.fetch_concurrency),
+        chunk_size=max(1, args.chunk_size),
+        checkpoint_file=args.checkpoint,
+        show_changes=args.show
+    )
+
 if __name__ == "__main__":
-    recalculate_importance_scores()
+    main()
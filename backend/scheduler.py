@@ -0,0 +1,128 @@
+"""
+Scheduled background mail polling.
+Runs an incremental refresh every email_check_frequency, with jitter, so
+the dashboard reads from an already warm local store. A tick is skipped if
+the previous refresh is still running.
+"""
+
+import time
+import random
+import threading
+from datetime import datetime
+import config
+
+# email_check_frequency values, in seconds; None disables polling
+CHECK_INTERVALS = {
+    'manual': None,
+    'every_5_minutes': 5 * 60,
+    'every_15_minutes': 15 * 60,
+    'every_30_minutes': 30 * 60,
+    'hourly': 3600,
+    'every_6_hours': 6 * 3600,
+    'daily': 24 * 3600
+}
+
+def check_interval(settings):
+    """Polling interval in seconds from the settings, or None if disabled.
+
+    email_check_frequency is one of CHECK_INTERVALS or a number of minutes.
+    """
+    frequency = settings.get('email_check_frequency', 'daily')
+    if isinstance(frequency, (int, float)) and not isinstance(frequency, bool):
+        return frequency * 60 if frequency > 0 else None
+    if frequency not in CHECK_INTERVALS:
+        print(f"Unknown email_check_frequency '{frequency}', polling daily")
+        frequency = 'daily'
+    return CHECK_INTERVALS[frequency]
+
+class EmailPoller:
+    """Background thread that periodically starts refresh jobs"""
+
+    def __init__(self, submit_refresh, jitter=0.1, initial_delay=10):
+        """submit_refresh starts a refresh and returns its Job (or None if
+        Gmail is not set up). jitter is the fraction by which each interval
+        is randomly stretched or shortened."""
+        self.submit_refresh = submit_refresh
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._interval = None
+        self._last_run = None
+        self._next_run = None
+        self._last_job = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start polling in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='email-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop polling"""
+        self._stopping = True
+        self._wake.set()
+
+    def reschedule(self):
+        """Re-read the check frequency, e.g. after the settings change"""
+        self._wake.set()
+
+    def status(self):
+        """When the poller last ran and will next run"""
+        with self._lock:
+            return {
+                'interval_seconds': self._interval,
+                'last_run_at': datetime.fromtimestamp(self._last_run).isoformat() if self._last_run else None,
+                'next_run_at': datetime.fromtimestamp(self._next_run).isoformat() if self._next_run else None,
+                'last_job_id': self._last_job.id if self._last_job else None
+            }
+
+    def _schedule(self):
+        """Work out when the next tick is due from the current settings"""
+        interval = check_interval(config.settings_snapshot())
+        with self._lock:
+            self._interval = interval
+            if interval is None:
+                self._next_run = None
+            elif self._last_run is None:
+                self._next_run = time.time() + self.initial_delay
+            else:
+                spread = interval * self.jitter
+                self._next_run = self._last_run + interval + random.uniform(-spread, spread)
+            return self._next_run
+
+    def _run(self):
+        next_run = self._schedule()
+        while True:
+            timeout = None if next_run is None else max(0, next_run - time.time())
+            woken = self._wake.wait(timeout)
+            self._wake.clear()
+            if self._stopping:
+                return
+            if woken:
+                next_run = self._schedule()
+                continue
+
+            self._tick()
+            next_run = self._schedule()
+
+    def _tick(self):
+        """Start a refresh unless the previous one is still going"""
+        with self._lock:
+            self._last_run = time.time()
+            last_job = self._last_job
+
+        if last_job is not None and last_job.active:
+            print("Previous scheduled refresh is still running, skipping this one")
+            return
+
+        try:
+            job = self.submit_refresh()
+        except Exception as e:
+            print(f"Error starting scheduled refresh: {str(e)}")
+            return
+
+        with self._lock:
+            self._last_job = job
@@ -0,0 +1,11 @@
+"""
+Shared test fixtures.
+The backend keeps its data files in the working directory, so every test
+runs in a fresh temporary one.
+"""
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def _isolated_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,90 @@
+"""
+Settings snapshots, saving and change notifications.
+"""
+
+import os
+import json
+import time
+import pytest
+import config
+
+@pytest.fixture(autouse=True)
+def fresh_settings(monkeypatch):
+    """Forget any snapshot and subscribers left by other tests"""
+    monkeypatch.setattr(config, '_snapshot', None)
+    monkeypatch.setattr(config, '_snapshot_version', None)
+    monkeypatch.setattr(config, '_subscribers', [])
+
+def _subscribe():
+    changes = []
+    config.subscribe_settings(lambda settings, changed: changes.append((settings, changed)))
+    return changes
+
+def test_defaults_when_there_is_no_settings_file():
+    assert config.settings_snapshot() == config._get_default_settings()
+
+def test_snapshot_is_shared_and_read_only():
+    snapshot = config.settings_snapshot()
+
+    assert config.settings_snapshot() is snapshot
+    with pytest.raises(TypeError):
+        snapshot['llm_provider'] = 'local'
+    with pytest.raises(TypeError):
+        snapshot['important_keywords'].append('payroll')
+
+def test_load_settings_returns_an_editable_copy():
+    settings = config.load_settings()
+    settings['important_keywords'].append('payroll')
+
+    assert 'payroll' not in config.settings_snapshot()['important_keywords']
+
+def test_save_writes_the_file_and_notifies_changed_keys():
+    changes = _subscribe()
+    settings = config.load_settings()
+    settings['email_check_frequency'] = 5
+    settings['important_keywords'] = ['payroll']
+
+    config.save_settings(settings)
+
+    with open(config.SETTINGS_FILE) as file:
+        assert json.load(file) == settings
+    assert config.settings_snapshot() == settings
+    assert len(changes) == 1
+    assert changes[0][1] == {'email_check_frequency', 'important_keywords'}
+    # No temporary files are left behind
+    assert os.listdir('.') == [config.SETTINGS_FILE]
+
+def test_saving_unchanged_settings_notifies_nobody():
+    config.save_settings(config.load_settings())
+    changes = _subscribe()
+
+    config.save_settings(config.load_settings())
+
+    assert changes == []
+
+def test_external_edits_are_picked_up_and_notified():
+    config.save_settings(config.load_settings())
+    changes = _subscribe()
+
+    settings = config.load_settings()
+    settings['response_style'] = 'casual'
+    # Make sure the file's version changes even on coarse timestamps
+    time.sleep(0.01)
+    with open(config.SETTINGS_FILE, 'w') as file:
+        json.dump(settings, file, indent=4)
+
+    assert config.settings_snapshot()['response_style'] == 'casual'
+    assert [changed for _, changed in changes] == [{'response_style'}]
+
+def test_a_failing_subscriber_does_not_stop_the_others():
+    def broken(settings, changed):
+        raise RuntimeError('boom')
+
+    config.subscribe_settings(broken)
+    changes = _subscribe()
+    settings = config.load_settings()
+    settings['response_style'] = 'casual'
+
+    config.save_settings(settings)
+
+    assert len(changes) == 1
@@ -0,0 +1,219 @@
+"""
+EmailStore paging, filtering and aggregates.
+"""
+
+import pytest
+import email_store
+from email_store import EmailStore, AGGREGATE_GROUPINGS
+
+def _email(email_id, sender='Alice <alice@example.com>', score=5, date='Mon, 01 Jan 2024 10:00:00 +0000',
+           processed=False, identified_at='2024-01-01T10:00:00', subject='Hello'):
+    return {
+        'id': email_id,
+        'threadId': 't-' + email_id,
+        'sender': sender,
+        'subject': subject,
+        'date': date,
+        'snippet': '',
+        'processed': processed,
+        'importance_score': score,
+        'identified_at': identified_at
+    }
+
+@pytest.fixture
+def store():
+    return EmailStore('email_store.db', legacy_json_path=None)
+
+def _all_pages(store, limit, **query):
+    """IDs of every page, following the cursors"""
+    ids = []
+    cursor = None
+    while True:
+        emails, cursor, total = store.query_emails(limit=limit, cursor=cursor, **query)
+        ids.extend(email['id'] for email in emails)
+        if cursor is None:
+            return ids, total
+
+@pytest.mark.parametrize('sort', ['importance_score', 'date', 'sender', 'subject', 'identified_at'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_paging_returns_every_email_once_in_order(store, sort, order):
+    emails = [
+        _email(f'm{i:02d}', sender=f'Sender {i % 4} <s{i % 4}@example.com>', score=i % 5,
+               date=f'Mon, {1 + i % 3:02d} Jan 2024 10:00:00 +0000', subject=f'Subject {i % 6}',
+               identified_at=f'2024-01-{1 + i % 7:02d}T00:00:00')
+        for i in range(23)
+    ]
+    store.upsert_emails(emails)
+
+    ids, total = _all_pages(store, limit=4, sort=sort, order=order)
+    unpaged, _, _ = store.query_emails(sort=sort, order=order)
+
+    assert total == 23
+    assert ids == [email['id'] for email in unpaged]
+    assert sorted(ids) == sorted(email['id'] for email in emails)
+
+def test_paging_continues_past_null_sort_values(store):
+    # Rows migrated from before identified_at was recorded have none
+    store.upsert_emails(
+        [_email(f'old{i}', identified_at=None) for i in range(5)] +
+        [_email(f'new{i}', identified_at=f'2024-02-0{i + 1}T00:00:00') for i in range(5)]
+    )
+
+    for order in ('asc', 'desc'):
+        ids, _ = _all_pages(store, limit=3, sort='identified_at', order=order)
+        assert len(ids) == 10 and len(set(ids)) == 10
+
+def test_filters(store):
+    store.upsert_emails([
+        _email('a', sender='Alice <alice@example.com>', score=9, date='Mon, 01 Jan 2024 10:00:00 +0000'),
+        _email('b', sender='Bob <bob@other.org>', score=3, processed=True,
+               date='Wed, 03 Jan 2024 10:00:00 +0000'),
+        _email('c', sender='Carol_x <carol@example.com>', score=6, date='Fri, 05 Jan 2024 10:00:00 +0000')
+    ])
+
+    def ids(**query):
+        return sorted(email['id'] for email in store.query_emails(**query)[0])
+
+    assert ids(min_score=5) == ['a', 'c']
+    assert ids(max_score=6) == ['b', 'c']
+    assert ids(processed=True) == ['b']
+    assert ids(processed=False) == ['a', 'c']
+    assert ids(domain='EXAMPLE.com') == ['a', 'c']
+    # LIKE wildcards in the search text are matched literally
+    assert ids(sender='l_x') == ['c']
+    assert ids(sender='bob') == ['b']
+
+def test_group_filters_select_exactly_the_aggregated_rows(store):
+    store.upsert_emails([
+        _email('high', score=10),
+        # Fractional scores between the old x.999 bounds
+        _email('medium', score=9.9995),
+        _email('low', score=6.9995, sender='<nobody@example.com>'),
+        _email('very-low', score=3.5, sender='no-domain', date='not a date')
+    ])
+
+    for grouping in ('domain', 'sender', 'priority', 'day', 'status'):
+        groups = store.get_aggregates(grouping)
+        assert sum(group['count'] for group in groups) == 4
+        for group in groups:
+            emails, _, total = store.query_emails(group=(grouping, group['name']))
+            assert total == group['count'], (grouping, group['name'])
+
+    def ids(grouping, key):
+        return sorted(email['id'] for email in store.query_emails(group=(grouping, key))[0])
+
+    assert ids('priority', 'Medium Priority') == ['medium']
+    assert ids('priority', 'Low Priority') == ['low']
+    assert ids('sender', 'Unknown') == ['low']
+    assert ids('domain', 'Unknown') == ['very-low']
+    assert ids('day', 'Unknown Date') == ['very-low']
+
+def test_invalid_queries_raise_value_error(store):
+    with pytest.raises(ValueError):
+        store.query_emails(sort='snippet')
+    with pytest.raises(ValueError):
+        store.query_emails(order='sideways')
+    with pytest.raises(ValueError):
+        store.query_emails(limit=5, cursor='not a cursor')
+    with pytest.raises(ValueError):
+        store.query_emails(group=('priority', 'Urgent'))
+
+def _expected_aggregates(store, grouping):
+    """Aggregates recomputed from scratch from the emails table"""
+    totals = {}
+    for row in store._conn.execute('SELECT * FROM emails'):
+        entry = totals.setdefault(AGGREGATE_GROUPINGS[grouping](row), [0, 0])
+        entry[0] += 1
+        entry[1] += row['importance_score']
+    return {key: (count, pytest.approx(total)) for key, (count, total) in totals.items()}
+
+def _actual_aggregates(store, grouping):
+    return {group['name']: (group['count'], group['total_importance']) for group in store.get_aggregates(grouping)}
+
+def _assert_aggregates_consistent(store):
+    for grouping in AGGREGATE_GROUPINGS:
+        assert _actual_aggregates(store, grouping) == _expected_aggregates(store, grouping), grouping
+
+@pytest.mark.parametrize('rebuild_threshold', [2000, 3])
+def test_aggregates_follow_every_kind_of_change(store, monkeypatch, rebuild_threshold):
+    # A low threshold sends bulk score updates through a full rebuild instead of deltas
+    monkeypatch.setattr(email_store, '_AGGREGATE_REBUILD_THRESHOLD', rebuild_threshold)
+    store.upsert_emails([
+        _email(f'm{i}', sender=f'Sender {i % 3} <s@domain{i % 2}.com>', score=i,
+               date=f'Mon, {1 + i % 4:02d} Jan 2024 10:00:00 +0000')
+        for i in range(12)
+    ])
+    _assert_aggregates_consistent(store)
+
+    # Re-upserting a changed email moves it between groups
+    store.upsert_email(_email('m1', sender='New <new@elsewhere.com>', score=11))
+    store.mark_processed('m2')
+    store.mark_processed('m3')
+    store.mark_processed('m3', processed=False)
+    store.update_scores([('m4', 0.5), ('m5', 7.25), ('m6', 10), ('m7', 3)])
+    store.remove_emails(['m8', 'm9', 'missing'])
+    _assert_aggregates_consistent(store)
+
+    store.remove_emails([f'm{i}' for i in range(12)])
+    for grouping in AGGREGATE_GROUPINGS:
+        assert store.get_aggregates(grouping) == []
+
+def test_summary(store):
+    store.upsert_emails([
+        _email('a', sender='Alice <alice@example.com>', score=4),
+        _email('b', sender='Alice <alice@example.com>', score=8, processed=True),
+        _email('c', sender='Bob <bob@example.com>', score=6)
+    ])
+
+    assert store.get_summary() == {
+        'total_emails': 3,
+        'avg_importance': 6,
+        'unprocessed_emails': 2,
+        'unique_senders': 2
+    }
+
+def test_aggregates_are_built_for_stores_that_predate_them(store):
+    store.upsert_emails([_email('a', score=5), _email('b', sender='Bob <bob@other.org>', score=8)])
+    # What a store created before the aggregates table looks like
+    store._conn.execute('DELETE FROM aggregates')
+    store._conn.execute("DELETE FROM meta WHERE key = 'aggregates_built'")
+    store._conn.commit()
+
+    reopened = EmailStore('email_store.db', legacy_json_path=None)
+    reopened.mark_processed('a')
+
+    _assert_aggregates_consistent(reopened)
+    assert reopened.get_summary()['total_emails'] == 2
+    assert reopened.get_summary()['unique_senders'] == 2
+
+def _indexed(store, *emails):
+    store.upsert_emails([_email(email['id'], subject=email.get('subject', '')) for email in emails])
+    store.index_for_search([dict(_email(email['id']), **email) for email in emails])
+
+def test_search_matches_word_prefixes_in_every_field(store):
+    _indexed(
+        store,
+        {'id': 'subject', 'subject': 'Quarterly budget review'},
+        {'id': 'body', 'subject': 'Hi', 'body': 'Could you review the budgets before Friday?'},
+        {'id': 'other', 'subject': 'Lunch', 'body': 'Pizza or salad?'}
+    )
+
+    results, total = store.search_emails('budg revi')
+    assert total == 2
+    # Subject matches are weighted above body matches
+    assert [email['id'] for email in results] == ['subject', 'body']
+    assert '[' in results[0]['match']
+
+    assert store.search_emails('pizza')[0][0]['id'] == 'other'
+    assert store.search_emails('') == ([], 0)
+    # FTS syntax in the query is treated as plain words
+    assert store.search_emails('"budget*')[1] == 2
+
+def test_search_index_follows_removed_and_unindexed_emails(store):
+    _indexed(store, {'id': 'a', 'body': 'invoice attached'}, {'id': 'b', 'body': 'invoice overdue'})
+    store.upsert_email(_email('c'))
+
+    assert store.get_unindexed_ids() == ['c']
+    store.remove_emails(['a'])
+    results, total = store.search_emails('invoice')
+    assert total == 1 and results[0]['id'] == 'b'
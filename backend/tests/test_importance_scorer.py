@@ -0,0 +1,69 @@
+"""
+The compiled ImportanceScorer must score exactly like the per-keyword
+reference implementation it replaced.
+"""
+
+import random
+from types import SimpleNamespace
+import numpy as np
+from email_processor import EmailProcessor
+from importance_scorer import ImportanceScorer, FEATURE_NAMES
+
+# Overlapping words, so keywords hide inside longer keywords and words
+WORDS = ['urgent', 'urgently', 'important', 'import', 'port', 'asap', 'deadline', 'dead', 'line',
+         'required', 'require', 'you', 'your', 'yours', 'youth', 'boss', 'meeting', 'hello', '?', 'URGENT']
+SENDERS = ['Boss <boss@company.com>', 'Alice <alice@example.com>', 'noreply@news.example.org', '']
+
+def _reference_score(settings, email):
+    return EmailProcessor._calculate_importance_reference(SimpleNamespace(settings=settings), email)
+
+def _random_text(rng, max_words):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, max_words)))
+
+def _random_settings(rng):
+    keywords = rng.sample(WORDS[:11], rng.randint(0, 6))
+    # Duplicates and an empty keyword each count, as they always have
+    if rng.random() < 0.2 and keywords:
+        keywords.append(keywords[0])
+    if rng.random() < 0.1:
+        keywords.append('')
+    return {
+        'important_keywords': keywords,
+        'important_senders': rng.sample(['boss@company.com', 'example', 'news', 'Alice'], rng.randint(0, 2)),
+        'importance_weights': {name: rng.randint(0, 6) for name in
+                               ['subject_keyword', 'body_keyword', 'important_sender',
+                                'question_mark', 'direct_message', 'email_length']}
+    }
+
+def _random_email(rng):
+    return {
+        'subject': _random_text(rng, 6),
+        'body': _random_text(rng, 250),
+        'sender': rng.choice(SENDERS),
+        'cc': rng.choice(['', 'someone@example.com'])
+    }
+
+def test_scores_match_reference_implementation():
+    rng = random.Random(1234)
+    for _ in range(200):
+        settings = _random_settings(rng)
+        scorer = ImportanceScorer.from_settings(settings)
+        for _ in range(20):
+            email = _random_email(rng)
+            assert scorer.score(email) == _reference_score(settings, email), (settings, email)
+
+def test_default_settings_match_reference_implementation():
+    rng = random.Random(99)
+    scorer = ImportanceScorer.from_settings({})
+    for _ in range(500):
+        email = _random_email(rng)
+        assert scorer.score(email) == _reference_score({}, email)
+
+def test_score_matrix_matches_per_email_scores():
+    rng = random.Random(7)
+    settings = _random_settings(rng)
+    scorer = ImportanceScorer.from_settings(settings)
+    features = [scorer.extract_features(_random_email(rng)) for _ in range(50)]
+    matrix = np.array([[row[name] for name in FEATURE_NAMES] for row in features], dtype=np.float64)
+
+    assert list(scorer.score_matrix(matrix)) == [scorer.score_features(row) for row in features]
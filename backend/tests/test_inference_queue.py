@@ -0,0 +1,125 @@
+"""
+InferenceQueue ordering, cancellation and timeouts.
+"""
+
+import time
+import threading
+import pytest
+from inference_queue import InferenceQueue, InferenceCancelled, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+@pytest.fixture
+def inference_queue():
+    inference_queue = InferenceQueue()
+    yield inference_queue
+    inference_queue.shutdown()
+
+def _blocker(inference_queue):
+    """Occupy the worker until the returned event is set"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def work(task):
+        started.set()
+        release.wait(5)
+        return 'blocker'
+
+    task = inference_queue.submit(work)
+    assert started.wait(5)
+    return task, release
+
+def test_runs_by_priority_then_submission_order(inference_queue):
+    blocker, release = _blocker(inference_queue)
+    order = []
+
+    def record(name):
+        return lambda task: order.append(name) or name
+
+    tasks = [
+        inference_queue.submit(record('background 1'), priority=PRIORITY_BACKGROUND),
+        inference_queue.submit(record('interactive 1'), priority=PRIORITY_INTERACTIVE),
+        inference_queue.submit(record('background 2'), priority=PRIORITY_BACKGROUND),
+        inference_queue.submit(record('interactive 2'), priority=PRIORITY_INTERACTIVE)
+    ]
+    release.set()
+
+    assert blocker.result() == 'blocker'
+    assert [task.result() for task in tasks] == ['background 1', 'interactive 1', 'background 2', 'interactive 2']
+    assert order == ['interactive 1', 'interactive 2', 'background 1', 'background 2']
+
+def test_cancelled_queued_task_never_runs(inference_queue):
+    blocker, release = _blocker(inference_queue)
+    ran = []
+    task = inference_queue.submit(lambda task: ran.append(True))
+    task.cancel()
+    release.set()
+
+    with pytest.raises(InferenceCancelled):
+        task.result()
+    assert not ran
+    blocker.result()
+    assert inference_queue.metrics()['cancelled'] == 1
+
+def test_closing_a_stream_stops_the_running_task(inference_queue):
+    produced = []
+
+    def work(task):
+        for index in range(1000):
+            if task.cancelled:
+                break
+            produced.append(index)
+            task.emit(str(index))
+            time.sleep(0.01)
+        return 'finished'
+
+    task = inference_queue.submit(work)
+    stream = task.stream()
+    assert next(stream) == '0'
+    stream.close()
+
+    with pytest.raises(InferenceCancelled):
+        task.result()
+    assert len(produced) < 1000
+
+def test_stream_yields_tokens_then_raises_work_errors(inference_queue):
+    def work(task):
+        task.emit('a')
+        task.emit('b')
+        raise RuntimeError('model failed')
+
+    task = inference_queue.submit(work)
+    tokens = []
+    with pytest.raises(RuntimeError, match='model failed'):
+        for token in task.stream():
+            tokens.append(token)
+
+    assert tokens == ['a', 'b']
+    assert inference_queue.metrics()['failed'] == 1
+
+def test_task_times_out_while_queued(inference_queue):
+    blocker, release = _blocker(inference_queue)
+    task = inference_queue.submit(lambda task: 'late', timeout=0.05)
+
+    with pytest.raises(InferenceCancelled, match='timed out'):
+        task.result()
+    release.set()
+    blocker.result()
+
+    # The worker drops it instead of running it
+    follow_up = inference_queue.submit(lambda task: 'next')
+    assert follow_up.result() == 'next'
+    metrics = inference_queue.metrics()
+    assert metrics['timed_out'] == 1
+    assert metrics['completed'] == 2
+
+def test_shutdown_cancels_queued_tasks():
+    inference_queue = InferenceQueue()
+    blocker, release = _blocker(inference_queue)
+    queued = inference_queue.submit(lambda task: 'never')
+    inference_queue.shutdown()
+    release.set()
+
+    with pytest.raises(InferenceCancelled):
+        queued.result()
+    assert blocker.result() == 'blocker'
+    with pytest.raises(RuntimeError):
+        inference_queue.submit(lambda task: 'too late')
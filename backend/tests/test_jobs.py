@@ -0,0 +1,70 @@
+"""
+JobManager deduplication, outcomes and progress.
+"""
+
+import time
+import threading
+from jobs import JobManager
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.active and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+def test_job_reports_result_and_progress():
+    def run(job):
+        job.add_progress(total=3)
+        job.add_progress(fetched=2)
+        job.add_progress(fetched=1)
+        return {'new': 3}
+
+    job = _wait(JobManager().submit('refresh', run))
+    snapshot = job.to_dict()
+
+    assert snapshot['status'] == 'succeeded'
+    assert snapshot['result'] == {'new': 3}
+    assert snapshot['progress'] == {'total': 3, 'fetched': 3}
+    assert snapshot['started_at'] and snapshot['finished_at']
+
+def test_failed_job_records_its_error():
+    def run(job):
+        raise RuntimeError('Gmail unavailable')
+
+    job = _wait(JobManager().submit('refresh', run))
+
+    assert job.status == 'failed'
+    assert job.error == 'Gmail unavailable'
+
+def test_same_key_returns_the_active_job():
+    job_manager = JobManager()
+    release = threading.Event()
+    calls = []
+
+    def run(job):
+        calls.append(job.id)
+        release.wait(5)
+
+    first = job_manager.submit('refresh', run, key='refresh')
+    second = job_manager.submit('refresh', run, key='refresh')
+    other = job_manager.submit('rescore', run, key='rescore')
+    release.set()
+    _wait(first)
+    _wait(other)
+
+    assert second is first
+    assert other is not first
+    # Once finished, the key is free again
+    third = _wait(job_manager.submit('refresh', lambda job: None, key='refresh'))
+    assert third is not first
+    assert sorted(calls) == sorted([first.id, other.id])
+
+def test_finished_jobs_expire():
+    job_manager = JobManager(retention_seconds=0)
+    job = _wait(job_manager.submit('refresh', lambda job: None))
+    assert job_manager.get(job.id) is job
+
+    time.sleep(0.01)
+    # Expired jobs are pruned on the next submit
+    _wait(job_manager.submit('refresh', lambda job: None))
+    assert job_manager.get(job.id) is None
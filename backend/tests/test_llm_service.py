@@ -0,0 +1,69 @@
+"""
+Local model prompt prefix caching, against a fake llama-cpp model.
+"""
+
+import os
+from types import SimpleNamespace
+import pytest
+from llm_service import LocalLLMService
+from prefix_cache import PrefixStateCache
+
+class FakeLlama:
+    """Just enough of llama_cpp.Llama for prefix caching and streaming"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def n_ctx(self):
+        return 2048
+
+    def reset(self):
+        pass
+
+    def save_state(self):
+        return SimpleNamespace(n_tokens=len(self.prompts[-1]))
+
+    def load_state(self, state):
+        pass
+
+    def __call__(self, prompt, stream=False, **kwargs):
+        self.prompts.append(prompt)
+        if not stream:
+            return {'choices': [{'text': 'x'}]}
+        return self._stream()
+
+    def _stream(self):
+        yield {'choices': [{'text': 'Sure.'}]}
+
+@pytest.fixture
+def service(tmp_path):
+    model_path = tmp_path / 'model.gguf'
+    model_path.write_bytes(b'gguf')
+    service = LocalLLMService(str(model_path), load_async=False)
+    service.model = FakeLlama()
+    service.prefix_cache = PrefixStateCache(service.model, str(model_path))
+    yield service
+    service.close()
+
+def _complete(service, style):
+    task = SimpleNamespace(cancelled=False, emit=lambda text: None)
+    return service._complete('prompt', task, style)
+
+@pytest.mark.parametrize('style', ['unknown', '../../x', ['professional']])
+def test_unknown_styles_reuse_the_professional_prefix(service, tmp_path, style):
+    assert _complete(service, 'professional') == 'Sure.'
+    state_dir = service.prefix_cache.state_dir
+    files = os.listdir(state_dir)
+
+    assert _complete(service, style) == 'Sure.'
+
+    assert service.prefix_cache.metrics() == {'cached_prefixes': ['professional'], 'hits': 2, 'misses': 1}
+    assert os.listdir(state_dir) == files
+    assert sorted(os.listdir(tmp_path)) == ['model.gguf', 'model.gguf.prefix_states']
+
+def test_known_styles_get_their_own_prefix(service):
+    _complete(service, 'professional')
+    _complete(service, 'casual')
+
+    assert service.prefix_cache.metrics()['cached_prefixes'] == ['casual', 'professional']
+    assert len(os.listdir(service.prefix_cache.state_dir)) == 2
@@ -0,0 +1,113 @@
+"""
+OpenAI request pacing and retries, against a fake client.
+"""
+
+import time
+from types import SimpleNamespace
+import httpx
+import openai
+import pytest
+from openai_client import OpenAIRequester, TokenBucket, parse_reset
+
+def _response(status, headers=None):
+    return httpx.Response(status, headers=headers or {}, request=httpx.Request('POST', 'https://api.openai.com/v1'))
+
+class FakeCompletions:
+    """Plays back a list of outcomes: exceptions are raised, anything else is returned"""
+
+    def __init__(self, outcomes, headers=None):
+        self.outcomes = list(outcomes)
+        self.headers = headers or {}
+        self.calls = 0
+        self.with_raw_response = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(headers=self.headers, parse=lambda: outcome)
+
+def _requester(outcomes, headers=None, **options):
+    completions = FakeCompletions(outcomes, headers)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    options.setdefault('base_backoff', 0.001)
+    return OpenAIRequester(client, **options), completions
+
+def _reply(text='Hello'):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2)
+    )
+
+MESSAGES = [{'role': 'user', 'content': 'Hi'}]
+
+@pytest.mark.parametrize('value, seconds', [
+    ('1s', 1), ('6m0s', 360), ('20ms', 0.02), ('1h2m3.5s', 3723.5), ('2.5', 2.5), ('', None), ('soon', None)
+])
+def test_parse_reset(value, seconds):
+    assert parse_reset(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+def test_token_bucket_waits_for_refill_and_honours_deadline():
+    bucket = TokenBucket(capacity=10, period=1.0)
+    assert bucket.acquire(10, deadline=time.monotonic() + 1)
+
+    start = time.monotonic()
+    assert bucket.acquire(2, deadline=time.monotonic() + 1)
+    assert time.monotonic() - start >= 0.1
+    # Refilling 10 units would take a second, past this deadline
+    assert not bucket.acquire(10, deadline=time.monotonic() + 0.05)
+
+def test_token_bucket_follows_headers():
+    bucket = TokenBucket(capacity=100)
+    bucket.update(limit=600, remaining=0, reset_seconds=30)
+
+    assert bucket.capacity == 600
+    assert bucket.tokens == 0
+    assert not bucket.acquire(1, deadline=time.monotonic() + 0.05)
+
+def test_retries_rate_limits_and_server_errors():
+    requester, completions = _requester([
+        openai.RateLimitError('slow down', response=_response(429, {'retry-after': '0.01'}), body=None),
+        openai.InternalServerError('oops', response=_response(500), body=None),
+        _reply()
+    ])
+
+    response = requester.chat(model='gpt-3.5-turbo', messages=MESSAGES, max_tokens=10)
+
+    assert response.choices[0].message.content == 'Hello'
+    assert completions.calls == 3
+    metrics = requester.metrics()
+    assert metrics['retries'] == 2
+    assert metrics['rate_limited'] == 1
+    assert metrics['succeeded'] == 1
+    assert metrics['in_flight'] == 0
+    assert metrics['prompt_tokens'] == 10 and metrics['completion_tokens'] == 2
+
+@pytest.mark.parametrize('error', [
+    openai.BadRequestError('bad', response=_response(400), body=None),
+    openai.AuthenticationError('no key', response=_response(401), body=None),
+    openai.RateLimitError('quota', response=_response(429), body={'code': 'insufficient_quota'})
+])
+def test_does_not_retry_permanent_errors(error):
+    requester, completions = _requester([error, _reply()])
+
+    with pytest.raises(type(error)):
+        requester.chat(model='gpt-3.5-turbo', messages=MESSAGES, max_tokens=10)
+    assert completions.calls == 1
+    assert requester.metrics()['failed'] == 1
+
+def test_gives_up_after_max_retries():
+    errors = [openai.InternalServerError('oops', response=_response(503), body=None) for _ in range(3)]
+    requester, completions = _requester(errors, max_retries=2)
+
+    with pytest.raises(openai.InternalServerError):
+        requester.chat(model='gpt-3.5-turbo', messages=MESSAGES, max_tokens=10)
+    assert completions.calls == 3
+
+def test_concurrency_slot_is_released_after_each_call():
+    requester, _ = _requester([_reply(), _reply(), _reply()], max_concurrency=1, deadline_seconds=1)
+
+    for _ in range(3):
+        requester.chat(model='gpt-3.5-turbo', messages=MESSAGES, max_tokens=10)
+    assert requester.metrics()['succeeded'] == 3
@@ -0,0 +1,119 @@
+"""
+Quoted history stripping and token budget trimming for reply prompts.
+"""
+
+import pytest
+from prompt_builder import ELISION, PromptBuilder, estimate_tokens, fit_to_budget, strip_quoted
+
+def test_strips_quoted_reply_history():
+    body = (
+        "Can we move the call to 3pm?\n"
+        "\n"
+        "On Mon, Jan 1, 2024 at 10:00 AM Bob <bob@example.com> wrote:\n"
+        "> Call at 2pm works.\n"
+        ">> Earlier history\n"
+    )
+
+    assert strip_quoted(body) == "Can we move the call to 3pm?"
+
+def test_strips_outlook_style_history():
+    body = (
+        "Approved.\n"
+        "\n"
+        "From: Alice <alice@example.com>\n"
+        "Sent: Monday, January 1, 2024 10:00 AM\n"
+        "To: Bob\n"
+        "Subject: Budget\n"
+        "\n"
+        "Please approve the budget.\n"
+    )
+
+    assert strip_quoted(body) == "Approved."
+
+def test_keeps_sign_off_and_name_but_drops_signature_and_disclaimer():
+    body = (
+        "The report is attached.\n"
+        "\n"
+        "Best regards,\n"
+        "Alice\n"
+        "Head of Finance | Example Corp\n"
+        "+1 555 0100\n"
+        "\n"
+        "This email and any attachments may be confidential and intended solely for the addressee.\n"
+    )
+
+    assert strip_quoted(body) == "The report is attached.\n\nBest regards,\nAlice"
+
+def test_keeps_text_after_a_sign_off_like_line():
+    body = "Thanks!\n\nOne more thing: can you send the slides too?"
+
+    assert strip_quoted(body) == body
+
+def test_keeps_forwarded_text_but_drops_its_headers():
+    body = (
+        "FYI, see below.\n"
+        "\n"
+        "---------- Forwarded message ---------\n"
+        "From: Carol <carol@example.com>\n"
+        "Date: Mon, Jan 1, 2024\n"
+        "Subject: Launch\n"
+        "\n"
+        "The launch moves to Friday.\n"
+    )
+
+    assert strip_quoted(body) == "FYI, see below.\n\nThe launch moves to Friday."
+
+def test_signature_delimiter_ends_the_message():
+    assert strip_quoted("See you then.\n-- \nBob\nSent from my phone") == "See you then."
+
+@pytest.mark.parametrize('signature', ["Sent from my iPhone", "Sent from my Samsung Galaxy smartphone."])
+def test_device_signature_ends_the_message(signature):
+    assert strip_quoted(f"On my way.\n\n{signature}\n\nOn Mon, Bob wrote:\n> Where are you?") == "On my way."
+
+def test_keeps_text_that_starts_like_a_device_signature():
+    body = "Quick update.\nSent from my desk: here are the Q3 numbers.\nRevenue is up 4%."
+
+    assert strip_quoted(body) == body
+
+def test_fit_to_budget_keeps_the_opening_and_questions():
+    opening = "I wanted to follow up on the proposal."
+    filler = " ".join(f"Detail number {index} about the plan." for index in range(200))
+    question = "Can you confirm the budget by Friday?"
+    text = f"{opening} {filler} {question}"
+
+    fitted = fit_to_budget(text, 60, estimate_tokens)
+
+    assert estimate_tokens(fitted) <= 60
+    assert fitted.startswith(opening)
+    assert question in fitted
+    assert ELISION in fitted
+
+def test_fit_to_budget_leaves_short_text_alone():
+    assert fit_to_budget("Short note.", 100, estimate_tokens) == "Short note."
+
+def test_fit_to_budget_cuts_one_huge_sentence():
+    text = "word " * 1000
+
+    fitted = fit_to_budget(text.strip(), 50, estimate_tokens)
+
+    assert fitted.endswith(ELISION)
+    assert estimate_tokens(fitted) <= 55
+
+def test_prompt_builder_counts_tokens_saved():
+    builder = PromptBuilder()
+    quoted = "\n".join("> old line of the thread" for _ in range(100))
+    body = f"Sounds good.\n\nOn Mon, Jan 1, 2024 Bob <bob@example.com> wrote:\n{quoted}"
+
+    assert builder.prepare_body(body, budget=100) == "Sounds good."
+    assert builder.prepare_body(None, budget=100) == ""
+
+    metrics = builder.metrics()
+    assert metrics['bodies'] == 2
+    assert metrics['trimmed'] == 0
+    assert metrics['tokens_saved'] == estimate_tokens(body) - estimate_tokens("Sounds good.")
+
+@pytest.mark.parametrize('budget', [0, -5])
+def test_prompt_builder_elides_the_body_for_an_empty_budget(budget):
+    text = PromptBuilder().prepare_body("A long sentence that will not fit.", budget)
+
+    assert text.endswith(ELISION)
@@ -0,0 +1,70 @@
+"""
+In-memory cache of fetched Gmail threads.
+A thread is fetched once with threads.get and kept here with all of its
+parsed messages, so showing, drafting and replying to any message in it
+needs no further Gmail calls. Entries are checked against the thread's
+historyId and the least recently used are evicted past a size limit.
+"""
+
+import threading
+from collections import OrderedDict
+
+class ThreadCache:
+    """Size-bounded LRU cache of parsed threads keyed by thread ID"""
+
+    def __init__(self, max_threads=200):
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._threads = OrderedDict()
+        # Message ID -> thread ID for the cached threads
+        self._message_threads = {}
+
+    def get(self, thread_id, min_history_id=None):
+        """Get a cached thread, or None on a miss.
+
+        If min_history_id is given, a thread older than it counts as a miss.
+        """
+        with self._lock:
+            thread = self._threads.get(thread_id)
+            if thread is None:
+                return None
+            if min_history_id is not None and int(thread.get('historyId') or 0) < int(min_history_id):
+                return None
+            self._threads.move_to_end(thread_id)
+            return thread
+
+    def get_message(self, message_id):
+        """Get a message from a cached thread, or None"""
+        with self._lock:
+            thread_id = self._message_threads.get(message_id)
+            thread = self._threads.get(thread_id) if thread_id else None
+            if thread is None:
+                return None
+            self._threads.move_to_end(thread_id)
+        for message in thread['messages']:
+            if message['id'] == message_id:
+                return message
+        return None
+
+    def put(self, thread):
+        """Add or replace a thread"""
+        with self._lock:
+            self._drop(thread['id'])
+            self._threads[thread['id']] = thread
+            for message in thread['messages']:
+                self._message_threads[message['id']] = thread['id']
+            while len(self._threads) > self.max_threads:
+                self._drop(next(iter(self._threads)))
+
+    def invalidate(self, thread_id):
+        """Forget a thread, e.g. after replying to it"""
+        with self._lock:
+            self._drop(thread_id)
+
+    def _drop(self, thread_id):
+        """Remove a thread and its message index (caller holds the lock)"""
+        thread = self._threads.pop(thread_id, None)
+        if thread is not None:
+            for message in thread['messages']:
+                if self._message_threads.get(message['id']) == thread_id:
+                    del self._message_threads[message['id']]
@@ -50,6 +50,15 @@ export const setupLocalLLM = async (modelPath) => {
   return response.data;
 };
 
+/**
+ * Benchmark the local model with different llama-cpp settings and keep the
+ * fastest. Resolves with the finished job once tuning is done.
+ */
+export const autotuneLocalLLM = async (onProgress = null) => {
+  const response = await api.post('/setup/local-llm/autotune');
+  return waitForJob(response.data.id, onProgress);
+};
+
 /**
  * Test the configured LLM provider
  */
@@ -67,13 +76,88 @@ export const getImportantEmails = async () => {
 };
 
 /**
- * Refresh emails from Gmail
+ * Get one filtered, sorted page of emails.
+ * Supported params: limit, cursor, min_score, max_score, processed,
+ * timeframe, since, until, sender, domain, sort, order.
  */
-export const refreshEmails = async () => {
-  const response = await api.post('/emails/refresh');
+export const queryEmails = async (params = {}) => {
+  const response = await api.get('/emails/important', { params });
+  return {
+    emails: response.data,
+    nextCursor: response.headers['x-next-cursor'] || null,
+    total: parseInt(response.headers['x-total-count'] || response.data.length, 10),
+  };
+};
+
+/**
+ * Full-text search over stored emails (subject, sender, snippet and body)
+ */
+export const searchEmails = async (query, limit = 50, offset = 0) => {
+  const response = await api.get('/emails/search', { params: { q: query, limit, offset } });
+  return response.data;
+};
+
+/**
+ * Get precomputed email aggregates.
+ * groupBy is a list of groupings: domain, sender, priority, day, status.
+ */
+export const getEmailAggregates = async (groupBy = ['domain']) => {
+  const response = await api.get('/emails/aggregates', { params: { group_by: groupBy.join(',') } });
+  return response.data;
+};
+
+/**
+ * Get the status and progress of a background job
+ */
+export const getJob = async (jobId) => {
+  const response = await api.get(`/jobs/${jobId}`);
   return response.data;
 };
 
+/**
+ * Poll a background job until it finishes.
+ * Calls onProgress with the job's progress counters on every poll and
+ * resolves with the finished job, or rejects if the job failed.
+ */
+export const waitForJob = async (jobId, onProgress = null, intervalMs = 1000) => {
+  for (;;) {
+    const job = await getJob(jobId);
+    if (onProgress) {
+      onProgress(job.progress);
+    }
+    if (job.status === 'succeeded') {
+      return job;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
+/**
+ * Refresh emails from Gmail.
+ * Runs as a background job on the server; resolves once it has finished.
+ */
+export const refreshEmails = async (onProgress = null) => {
+  const response = await api.post('/emails/refresh');
+  return waitForJob(response.data.id, onProgress);
+};
+
+/**
+ * Subscribe to server events, such as 'new_mail' from the background poller.
+ * handlers maps event names to callbacks that receive the event data.
+ * Returns a function that unsubscribes.
+ */
+export const subscribeToEvents = (handlers) => {
+  // EventSource reconnects by itself if the connection drops
+  const source = new EventSource(`${API_BASE_URL}/events`);
+  Object.entries(handlers).forEach(([event, handler]) => {
+    source.addEventListener(event, (message) => handler(JSON.parse(message.data)));
+  });
+  return () => source.close();
+};
+
 /**
  * Get details of a specific email
  */
@@ -83,16 +167,60 @@ export const getEmailDetails = async (emailId) => {
 };
 
 /**
- * Generate an AI draft reply for a specific email
+ * Generate an AI draft reply for a specific email.
+ * A previously generated draft is reused unless regenerate is true.
  */
-export const generateDraftReply = async (emailId, style = 'professional', customInstructions = '') => {
+export const generateDraftReply = async (emailId, style = 'professional', customInstructions = '', regenerate = false) => {
   const response = await api.post(`/emails/${emailId}/draft-reply`, {
     style,
     custom_instructions: customInstructions,
+    regenerate,
   });
   return response.data;
 };
 
+/**
+ * Stream an AI draft reply for a specific email as it is generated.
+ * Calls onToken with each chunk of text, then onDone with the full draft
+ * and the model that wrote it ({ provider, model }).
+ * A previously generated draft arrives straight away via onDone unless
+ * regenerate is true. While a local model is still loading, onLoading (if
+ * given) receives its loading status.
+ * Returns a function that stops the stream (and generation on the server).
+ */
+export const streamDraftReply = (emailId, style = 'professional', customInstructions = '', regenerate = false, { onToken, onDone, onError, onLoading }) => {
+  const params = new URLSearchParams({ style, custom_instructions: customInstructions });
+  if (regenerate) {
+    params.set('regenerate', 'true');
+  }
+  const source = new EventSource(`${API_BASE_URL}/emails/${emailId}/draft-reply/stream?${params}`);
+
+  source.addEventListener('loading', (event) => {
+    if (onLoading) {
+      onLoading(JSON.parse(event.data));
+    }
+  });
+
+  source.addEventListener('token', (event) => {
+    onToken(JSON.parse(event.data).text);
+  });
+
+  source.addEventListener('done', (event) => {
+    source.close();
+    const data = JSON.parse(event.data);
+    onDone(data.draft, data.served_by);
+  });
+
+  // Fired both for errors sent by the server (with data) and connection failures
+  source.addEventListener('error', (event) => {
+    source.close();
+    const message = event.data ? JSON.parse(event.data).error : 'Connection to the server was lost';
+    onError(new Error(message));
+  });
+
+  return () => source.close();
+};
+
 /**
  * Send a reply to a specific email
  */
@@ -114,9 +242,9 @@ export const getSettings = async () => {
 /**
  * Recalculate importance scores for emails
  */
-export const recalculateImportance = async () => {
+export const recalculateImportance = async (onProgress = null) => {
   const response = await api.post('/emails/recalculate-importance');
-  return response.data;
+  return waitForJob(response.data.id, onProgress);
 };
 
 /**
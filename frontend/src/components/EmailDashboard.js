@@ -52,10 +52,29 @@ import {
   Cell
 } from 'recharts';
 
-import { getImportantEmails, refreshEmails, getSettings, updateSettings, recalculateImportance } from '../api';
+import { getEmailAggregates, queryEmails, searchEmails, refreshEmails, getSettings, updateSettings, recalculateImportance, subscribeToEvents } from '../api';
 
 // Define color scheme for charts
 const CHART_COLORS = ['#8884d8', '#82ca9d', '#ffc658', '#ff8042', '#a4de6c', '#d0ed57'];
+// Rows fetched per page in the data table
+const TABLE_PAGE_SIZE = 100;
+
+// Server aggregate groupings for each dashboard grouping option
+const AGGREGATE_GROUPINGS = {
+  domain: 'domain',
+  sender: 'sender',
+  importance: 'priority',
+  date: 'day'
+};
+
+// Chart labels for the server's priority bands
+const PRIORITY_CHART_LABELS = {
+  'High Priority': 'High (10+)',
+  'Medium Priority': 'Medium (7-9)',
+  'Low Priority': 'Low (4-6)',
+  'Very Low Priority': 'Very Low (0-3)'
+};
+
 const IMPORTANCE_COLORS = {
   high: '#f44336',
   medium: '#ff9800',
@@ -65,9 +84,20 @@ const IMPORTANCE_COLORS = {
 
 const EmailDashboard = () => {
   const navigate = useNavigate();
-  const [emails, setEmails] = useState([]);
+  const [summary, setSummary] = useState({
+    total_emails: 0,
+    avg_importance: 0,
+    unprocessed_emails: 0,
+    unique_senders: 0
+  });
+  const [chartData, setChartData] = useState([]);
+  // Bumped after a refresh or rescoring so aggregates and the table reload
+  const [dataVersion, setDataVersion] = useState(0);
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
+  const [recalculating, setRecalculating] = useState(false);
+  // Progress counters of the running refresh or rescoring job
+  const [jobProgress, setJobProgress] = useState({});
   const [error, setError] = useState(null);
   const [tabValue, setTabValue] = useState(0);
   const [chartType, setChartType] = useState('bar');
@@ -100,6 +130,11 @@ const EmailDashboard = () => {
   const [clusterBy, setClusterBy] = useState('domain');
   const [clusters, setClusters] = useState([]);
   const [selectedCluster, setSelectedCluster] = useState('all');
+  const [tableEmails, setTableEmails] = useState([]);
+  const [tableCursor, setTableCursor] = useState(null);
+  const [tableTotal, setTableTotal] = useState(0);
+  const [tableLoading, setTableLoading] = useState(false);
+  const [searchResults, setSearchResults] = useState(null);
   
   // Format date for display
   const formatDate = (dateString) => {
@@ -111,13 +146,6 @@ const EmailDashboard = () => {
     }
   };
 
-  // Extract domain from email address
-  const extractDomain = (email) => {
-    if (!email) return 'Unknown';
-    const matches = email.match(/@([^>]+)/);
-    return matches ? matches[1] : 'Unknown';
-  };
-
   // Extract sender name from email
   const extractSenderName = (sender) => {
     if (!sender) return 'Unknown';
@@ -125,88 +153,104 @@ const EmailDashboard = () => {
     return namePart || 'Unknown';
   };
 
-  // Define the generateClusters function using useCallback to avoid dependencies issues
-  const generateClusters = useCallback(() => {
-    if (!emails.length) {
-      setClusters([]);
-      return;
-    }
+  // Load precomputed cluster and chart groupings from the server
+  const fetchAggregates = useCallback(async () => {
+    try {
+      setError(null);
+      const clusterGrouping = AGGREGATE_GROUPINGS[clusterBy];
+      const chartAggregateGrouping = AGGREGATE_GROUPINGS[chartGrouping];
+      const data = await getEmailAggregates([clusterGrouping, chartAggregateGrouping]);
 
-    const clustersMap = {};
-    
-    emails.forEach(email => {
-      let clusterKey = 'Unknown';
-      
-      if (clusterBy === 'domain') {
-        clusterKey = extractDomain(email.sender);
-      } else if (clusterBy === 'sender') {
-        clusterKey = extractSenderName(email.sender);
-      } else if (clusterBy === 'importance') {
-        const score = email.importance_score;
-        if (score >= 10) clusterKey = 'High Priority';
-        else if (score >= 7) clusterKey = 'Medium Priority';
-        else if (score >= 4) clusterKey = 'Low Priority';
-        else clusterKey = 'Very Low Priority';
-      } else if (clusterBy === 'date') {
-        try {
-          const date = new Date(email.date);
-          clusterKey = format(date, 'yyyy-MM-dd');
-        } catch (e) {
-          clusterKey = 'Unknown Date';
+      setSummary(data.summary);
+      setClusters(data.groups[clusterGrouping].map(group => ({
+        id: group.name,
+        name: group.name,
+        count: group.count,
+        totalImportance: group.total_importance,
+        avgImportance: group.avg_importance
+      })));
+      setChartData(data.groups[chartAggregateGrouping].map(group => {
+        let name = group.name;
+        if (chartGrouping === 'importance') {
+          name = PRIORITY_CHART_LABELS[group.name] || group.name;
+        } else if (chartGrouping === 'date' && group.name !== 'Unknown Date') {
+          name = format(new Date(`${group.name}T00:00:00`), 'MMM d');
         }
-      }
-      
-      if (!clustersMap[clusterKey]) {
-        clustersMap[clusterKey] = {
-          id: clusterKey,
-          name: clusterKey,
-          emails: [],
-          count: 0,
-          avgImportance: 0,
-          totalImportance: 0
+        return {
+          name,
+          count: group.count,
+          totalImportance: group.total_importance,
+          averageImportance: group.avg_importance
         };
-      }
-      
-      clustersMap[clusterKey].emails.push(email);
-      clustersMap[clusterKey].count += 1;
-      clustersMap[clusterKey].totalImportance += email.importance_score;
-    });
-    
-    // Calculate averages and create array
-    const clustersArray = Object.values(clustersMap).map(cluster => {
-      cluster.avgImportance = cluster.totalImportance / cluster.count;
-      return cluster;
-    });
-    
-    // Sort by name
-    const sortedClusters = clustersArray.sort((a, b) => a.name.localeCompare(b.name));
-    setClusters(sortedClusters);
-  }, [emails, clusterBy, extractDomain, extractSenderName]);
+      }));
+    } catch (err) {
+      console.error('Error fetching email aggregates:', err);
+      setError('Failed to load emails. Please try again later.');
+    } finally {
+      setLoading(false);
+    }
+  }, [clusterBy, chartGrouping]);
 
-  // Get all emails on component mount
+  // Get settings on component mount
   useEffect(() => {
-    fetchEmails();
     fetchSettings();
   }, []);
 
-  // Update clusters when emails change or clustering criteria changes
+  // Reload when the background poller brings in new mail
   useEffect(() => {
-    generateClusters();
-  }, [emails, clusterBy, generateClusters]);
+    return subscribeToEvents({
+      new_mail: () => setDataVersion(version => version + 1),
+    });
+  }, []);
+
+  // Reload aggregates when the data or the grouping changes
+  useEffect(() => {
+    fetchAggregates();
+  }, [dataVersion, fetchAggregates]);
+
+  // Translate the current filters, cluster selection and sort into server query parameters
+  const buildTableQuery = useCallback(() => {
+    const params = {
+      limit: TABLE_PAGE_SIZE,
+      min_score: filters.importance[0],
+      max_score: filters.importance[1],
+      processed: filters.processed,
+      timeframe: filters.timeframe,
+      sort: sortConfig.key,
+      order: sortConfig.direction,
+    };
+
+    // The server filters to exactly the emails counted in the selected group,
+    // including its 'Unknown' groups
+    if (selectedCluster !== 'all') {
+      params.group = AGGREGATE_GROUPINGS[clusterBy];
+      params.group_key = selectedCluster;
+    }
+
+    return params;
+  }, [filters, sortConfig, selectedCluster, clusterBy]);
 
-  const fetchEmails = async () => {
+  const fetchTablePage = useCallback(async (cursor = null) => {
     try {
-      setLoading(true);
-      setError(null);
-      const data = await getImportantEmails();
-      setEmails(data);
+      setTableLoading(true);
+      const params = buildTableQuery();
+      if (cursor) params.cursor = cursor;
+      const page = await queryEmails(params);
+      setTableEmails(previous => (cursor ? [...previous, ...page.emails] : page.emails));
+      setTableCursor(page.nextCursor);
+      setTableTotal(page.total);
     } catch (err) {
-      console.error('Error fetching emails:', err);
+      console.error('Error fetching email table:', err);
       setError('Failed to load emails. Please try again later.');
     } finally {
-      setLoading(false);
+      setTableLoading(false);
     }
-  };
+  }, [buildTableQuery]);
+
+  // Reload the first table page whenever the query or the underlying data change
+  useEffect(() => {
+    fetchTablePage();
+  }, [dataVersion, fetchTablePage]);
 
   const fetchSettings = async () => {
     try {
@@ -232,8 +276,9 @@ const EmailDashboard = () => {
     try {
       setRefreshing(true);
       setError(null);
-      const data = await refreshEmails();
-      setEmails(data);
+      setJobProgress({});
+      await refreshEmails(setJobProgress);
+      setDataVersion(version => version + 1);
     } catch (err) {
       console.error('Error refreshing emails:', err);
       setError('Failed to refresh emails. Please try again later.');
@@ -335,155 +380,32 @@ const EmailDashboard = () => {
     }
   };
 
-  // Apply all filters and search to emails
-  const filteredEmails = emails.filter(email => {
-    // Search query
-    if (searchQuery) {
-      const query = searchQuery.toLowerCase();
-      if (!(
-        (email.subject && email.subject.toLowerCase().includes(query)) ||
-        (email.sender && email.sender.toLowerCase().includes(query)) ||
-        (email.snippet && email.snippet.toLowerCase().includes(query))
-      )) {
-        return false;
-      }
-    }
-    
-    // Importance score range
-    if (email.importance_score < filters.importance[0] || 
-        email.importance_score > filters.importance[1]) {
-      return false;
-    }
-    
-    // Processed state
-    if (filters.processed !== 'all') {
-      if (filters.processed === 'processed' && !email.processed) return false;
-      if (filters.processed === 'unprocessed' && email.processed) return false;
+  // Run the search box through the server's full-text index, debounced while typing
+  useEffect(() => {
+    if (!searchQuery.trim()) {
+      setSearchResults(null);
+      return undefined;
     }
-    
-    // Timeframe filter
-    if (filters.timeframe !== 'all') {
+
+    let cancelled = false;
+    const timer = setTimeout(async () => {
       try {
-        const emailDate = new Date(email.date);
-        const now = new Date();
-        
-        if (filters.timeframe === 'today') {
-          // Check if the email is from today
-          if (emailDate.toDateString() !== now.toDateString()) return false;
-        } else if (filters.timeframe === 'week') {
-          // Check if the email is from the last 7 days
-          const weekAgo = new Date();
-          weekAgo.setDate(now.getDate() - 7);
-          if (emailDate < weekAgo) return false;
-        } else if (filters.timeframe === 'month') {
-          // Check if the email is from the last 30 days
-          const monthAgo = new Date();
-          monthAgo.setDate(now.getDate() - 30);
-          if (emailDate < monthAgo) return false;
-        }
-      } catch (e) {
-        // If date parsing fails, include the email anyway
-      }
-    }
-    
-    // Cluster filter
-    if (selectedCluster !== 'all') {
-      let clusterKey = 'Unknown';
-      
-      if (clusterBy === 'domain') {
-        clusterKey = extractDomain(email.sender);
-      } else if (clusterBy === 'sender') {
-        clusterKey = extractSenderName(email.sender);
-      } else if (clusterBy === 'importance') {
-        const score = email.importance_score;
-        if (score >= 10) clusterKey = 'High Priority';
-        else if (score >= 7) clusterKey = 'Medium Priority';
-        else if (score >= 4) clusterKey = 'Low Priority';
-        else clusterKey = 'Very Low Priority';
-      } else if (clusterBy === 'date') {
-        try {
-          const date = new Date(email.date);
-          clusterKey = format(date, 'yyyy-MM-dd');
-        } catch (e) {
-          clusterKey = 'Unknown Date';
-        }
+        const data = await searchEmails(searchQuery, TABLE_PAGE_SIZE);
+        if (!cancelled) setSearchResults(data);
+      } catch (err) {
+        console.error('Error searching emails:', err);
       }
-      
-      if (clusterKey !== selectedCluster) return false;
-    }
-    
-    return true;
-  });
+    }, 250);
 
-  // Sort emails based on current sort configuration
-  const sortedEmails = [...filteredEmails].sort((a, b) => {
-    if (a[sortConfig.key] < b[sortConfig.key]) {
-      return sortConfig.direction === 'asc' ? -1 : 1;
-    }
-    if (a[sortConfig.key] > b[sortConfig.key]) {
-      return sortConfig.direction === 'asc' ? 1 : -1;
-    }
-    return 0;
-  });
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery, dataVersion]);
 
-  // Group emails for chart data based on selected grouping
-  const prepareChartData = () => {
-    const groupedData = {};
-    
-    filteredEmails.forEach(email => {
-      let key;
-      
-      // Determine grouping key
-      if (chartGrouping === 'sender') {
-        key = extractSenderName(email.sender);
-      } else if (chartGrouping === 'domain') {
-        key = extractDomain(email.sender);
-      } else if (chartGrouping === 'date') {
-        try {
-          const date = new Date(email.date);
-          key = format(date, 'MMM d');
-        } catch (e) {
-          key = 'Unknown';
-        }
-      } else if (chartGrouping === 'importance') {
-        const score = email.importance_score;
-        if (score >= 10) key = 'High (10+)';
-        else if (score >= 7) key = 'Medium (7-9)';
-        else if (score >= 4) key = 'Low (4-6)';
-        else key = 'Very Low (0-3)';
-      } else {
-        key = 'Other';
-      }
-      
-      // Initialize group if it doesn't exist
-      if (!groupedData[key]) {
-        groupedData[key] = {
-          name: key,
-          count: 0,
-          totalImportance: 0,
-          averageImportance: 0,
-          emails: []
-        };
-      }
-      
-      // Update group data
-      groupedData[key].count += 1;
-      groupedData[key].totalImportance += email.importance_score;
-      groupedData[key].emails.push(email);
-    });
-    
-    // Calculate averages and format for charts
-    const result = Object.values(groupedData).map(group => {
-      group.averageImportance = group.totalImportance / group.count;
-      return group;
-    });
-    
-    // Sort by name for consistent display
-    return result.sort((a, b) => a.name.localeCompare(b.name));
-  };
+  // The table is filtered and sorted on the server; a search shows ranked matches instead
+  const sortedEmails = searchResults ? searchResults.results : tableEmails;
 
-  const chartData = prepareChartData();
-  
   // Determine y-axis metric for charts
   const getChartMetricValue = (item) => {
     switch (chartMetric) {
@@ -540,7 +462,9 @@ const EmailDashboard = () => {
           onClick={handleRefresh}
           disabled={refreshing}
         >
-          {refreshing ? 'Refreshing...' : 'Refresh Emails'}
+          {refreshing
+            ? (jobProgress.total ? `Refreshing... (${jobProgress.fetched || 0}/${jobProgress.total})` : 'Refreshing...')
+            : 'Refresh Emails'}
         </Button>
       </Box>
 
@@ -575,7 +499,7 @@ const EmailDashboard = () => {
                         Total Emails
                       </Typography>
                       <Typography variant="h4">
-                        {emails.length}
+                        {summary.total_emails}
                       </Typography>
                     </Grid>
                     <Grid item xs={6}>
@@ -583,9 +507,7 @@ const EmailDashboard = () => {
                         Avg. Importance Score
                       </Typography>
                       <Typography variant="h4">
-                        {emails.length > 0 
-                          ? (emails.reduce((acc, email) => acc + email.importance_score, 0) / emails.length).toFixed(1) 
-                          : '0'}
+                        {summary.avg_importance.toFixed(1)}
                       </Typography>
                     </Grid>
                     <Grid item xs={6}>
@@ -593,7 +515,7 @@ const EmailDashboard = () => {
                         Unprocessed Emails
                       </Typography>
                       <Typography variant="h4">
-                        {emails.filter(e => !e.processed).length}
+                        {summary.unprocessed_emails}
                       </Typography>
                     </Grid>
                     <Grid item xs={6}>
@@ -601,7 +523,7 @@ const EmailDashboard = () => {
                         Unique Senders
                       </Typography>
                       <Typography variant="h4">
-                        {new Set(emails.map(e => extractSenderName(e.sender))).size}
+                        {summary.unique_senders}
                       </Typography>
                     </Grid>
                   </Grid>
@@ -881,9 +803,21 @@ const EmailDashboard = () => {
             </Table>
           </TableContainer>
           
-          <Typography variant="body2" color="text.secondary">
-            Showing {sortedEmails.length} of {emails.length} emails
-          </Typography>
+          <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
+            <Typography variant="body2" color="text.secondary">
+              Showing {sortedEmails.length} of {searchResults ? searchResults.total : tableTotal} emails
+            </Typography>
+            {tableCursor && !searchResults && (
+              <Button
+                variant="outlined"
+                size="small"
+                onClick={() => fetchTablePage(tableCursor)}
+                disabled={tableLoading}
+              >
+                {tableLoading ? 'Loading...' : 'Load More'}
+              </Button>
+            )}
+          </Box>
         </Box>
       )}
 
@@ -1143,23 +1077,25 @@ const EmailDashboard = () => {
                     <Button 
                       variant="contained" 
                       color="primary"
+                      disabled={recalculating}
                       onClick={async () => {
                         try {
+                          setRecalculating(true);
                           setError(null);
-                          const response = await recalculateImportance();
-                          if (response.success) {
-                            await fetchEmails();
-                            alert('Importance scores are being recalculated. This may take a few minutes for large mailboxes.');
-                          } else {
-                            setError('Failed to recalculate importance scores: ' + response.error);
-                          }
+                          setJobProgress({});
+                          await recalculateImportance(setJobProgress);
+                          setDataVersion(version => version + 1);
                         } catch (err) {
                           console.error('Error recalculating importance:', err);
-                          setError('Failed to recalculate importance scores. Please try again.');
+                          setError('Failed to recalculate importance scores: ' + err.message);
+                        } finally {
+                          setRecalculating(false);
                         }
                       }}
                     >
-                      Recalculate All Scores
+                      {recalculating
+                        ? (jobProgress.scored ? `Rescored ${jobProgress.scored} emails` : 'Recalculating...')
+                        : 'Recalculate All Scores'}
                     </Button>
                   </Box>
                   <Typography variant="body2" paragraph>
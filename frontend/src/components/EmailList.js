@@ -47,7 +47,8 @@ const EmailList = () => {
     try {
       setRefreshing(true);
       setError(null);
-      const data = await refreshEmails();
+      await refreshEmails();
+      const data = await getImportantEmails();
       setEmails(data);
     } catch (err) {
       console.error('Error refreshing emails:', err);
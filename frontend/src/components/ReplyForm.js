@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import {
   Paper,
@@ -21,8 +21,9 @@ import SendIcon from '@mui/icons-material/Send';
 import CancelIcon from '@mui/icons-material/Cancel';
 import ArrowBackIcon from '@mui/icons-material/ArrowBack';
 import AutorenewIcon from '@mui/icons-material/Autorenew';
+import StopIcon from '@mui/icons-material/Stop';
 
-import { getEmailDetails, generateDraftReply, sendReply, getSettings } from '../api';
+import { getEmailDetails, streamDraftReply, sendReply, getSettings } from '../api';
 
 const ReplyForm = () => {
   const { emailId } = useParams();
@@ -39,28 +40,76 @@ const ReplyForm = () => {
   const [sending, setSending] = useState(false);
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(null);
+  // Loading status of a local model that isn't ready yet
+  const [modelLoading, setModelLoading] = useState(null);
+  // Which provider and model wrote the current draft
+  const [servedBy, setServedBy] = useState(null);
 
-  // Define generateDraft as a useCallback to properly include it in dependencies
-  const generateDraft = useCallback(async () => {
-    try {
-      setGenerating(true);
-      setError(null);
-      
-      const response = await generateDraftReply(
-        emailId, 
-        responseStyle, 
-        showCustomInstructions ? customInstructions : ''
-      );
-      
-      setReplyText(response.draft);
-    } catch (err) {
-      console.error('Error generating draft:', err);
-      setError('Failed to generate AI reply. Please try again or edit manually.');
-    } finally {
-      setGenerating(false);
+  // Closes the draft stream that is currently open, if any
+  const stopStreamRef = useRef(null);
+
+  const stopGenerating = useCallback(() => {
+    if (stopStreamRef.current) {
+      stopStreamRef.current();
+      stopStreamRef.current = null;
     }
+    setModelLoading(null);
+    setGenerating(false);
+  }, []);
+
+  // Define generateDraft as a useCallback to properly include it in dependencies.
+  // Drafts already generated for this email and style come back from the
+  // server's cache unless regenerate is set.
+  const generateDraft = useCallback((regenerate = false) => {
+    // Only one draft streams at a time
+    if (stopStreamRef.current) {
+      stopStreamRef.current();
+    }
+
+    setGenerating(true);
+    setError(null);
+    setReplyText('');
+    setModelLoading(null);
+    setServedBy(null);
+
+    stopStreamRef.current = streamDraftReply(
+      emailId,
+      responseStyle,
+      showCustomInstructions ? customInstructions : '',
+      regenerate,
+      {
+        onLoading: (status) => setModelLoading(status),
+        onToken: (text) => {
+          setModelLoading(null);
+          setReplyText((current) => current + text);
+        },
+        onDone: (draft, model) => {
+          stopStreamRef.current = null;
+          setModelLoading(null);
+          setReplyText(draft);
+          setServedBy(model || null);
+          setGenerating(false);
+        },
+        onError: (err) => {
+          console.error('Error generating draft:', err);
+          stopStreamRef.current = null;
+          setModelLoading(null);
+          setError('Failed to generate AI reply. Please try again or edit manually.');
+          setGenerating(false);
+        },
+      }
+    );
   }, [emailId, responseStyle, customInstructions, showCustomInstructions]);
 
+  // Stop any draft still streaming when leaving the page
+  useEffect(() => {
+    return () => {
+      if (stopStreamRef.current) {
+        stopStreamRef.current();
+      }
+    };
+  }, []);
+
   useEffect(() => {
     const fetchData = async () => {
       try {
@@ -77,13 +126,14 @@ const ReplyForm = () => {
           setResponseStyle(settings.response_style);
         }
         
-        // Generate initial draft
-        await generateDraft();
+        setLoading(false);
+        
+        // Generate initial draft, streaming it into the reply field
+        generateDraft();
         
       } catch (err) {
         console.error('Error loading data:', err);
         setError('Failed to load email or generate reply. Please try again.');
-      } finally {
         setLoading(false);
       }
     };
@@ -189,14 +239,24 @@ const ReplyForm = () => {
                   <MenuItem value="detailed">Detailed</MenuItem>
                 </Select>
               </FormControl>
-              <Button
-                variant="outlined"
-                startIcon={<AutorenewIcon />}
-                onClick={generateDraft}
-                disabled={generating}
-              >
-                {generating ? 'Generating...' : 'Regenerate'}
-              </Button>
+              {generating ? (
+                <Button
+                  variant="outlined"
+                  color="secondary"
+                  startIcon={<StopIcon />}
+                  onClick={stopGenerating}
+                >
+                  Stop
+                </Button>
+              ) : (
+                <Button
+                  variant="outlined"
+                  startIcon={<AutorenewIcon />}
+                  onClick={() => generateDraft(true)}
+                >
+                  Regenerate
+                </Button>
+              )}
             </Box>
           </Box>
           
@@ -234,9 +294,16 @@ const ReplyForm = () => {
             rows={10}
             value={replyText}
             onChange={(e) => setReplyText(e.target.value)}
-            placeholder="Loading AI-generated reply..."
+            placeholder={modelLoading
+              ? `Loading the AI model (${modelLoading.elapsed_seconds}s${modelLoading.progress ? `, ${Math.round(modelLoading.progress * 100)}%` : ''})...`
+              : 'Loading AI-generated reply...'}
             disabled={generating}
           />
+          {servedBy && servedBy.provider && (
+            <Typography variant="caption" color="text.secondary">
+              Drafted by {servedBy.provider === 'openai' ? 'OpenAI' : 'local model'} · {servedBy.model}
+            </Typography>
+          )}
         </Box>
         
         <Box sx={{ display: 'flex', justifyContent: 'center', gap: 2 }}>
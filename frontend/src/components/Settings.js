@@ -32,13 +32,14 @@ import AddIcon from '@mui/icons-material/Add';
 import PlayArrowIcon from '@mui/icons-material/PlayArrow';
 import FolderOpenIcon from '@mui/icons-material/FolderOpen';
 
-import { getSettings, updateSettings, setupOpenAI, setupLocalLLM, testLLM } from '../api';
+import { getSettings, updateSettings, setupOpenAI, setupLocalLLM, testLLM, autotuneLocalLLM } from '../api';
 
 const Settings = () => {
   const navigate = useNavigate();
   const [settings, setSettings] = useState({
     important_keywords: [],
     important_senders: [],
+    email_check_frequency: 'daily',
     response_style: 'professional',
     custom_prompts: {
       professional: '',
@@ -56,6 +57,8 @@ const Settings = () => {
   const [openaiConfigured, setOpenaiConfigured] = useState(false);
   const [localLLMConfigured, setLocalLLMConfigured] = useState(false);
   const [systemInfo, setSystemInfo] = useState(null);
+  const [autotuning, setAutotuning] = useState(false);
+  const [autotuneProgress, setAutotuneProgress] = useState({});
   
   // For LLM testing
   const [testingLLM, setTestingLLM] = useState(false);
@@ -73,6 +76,7 @@ const Settings = () => {
         const data = await getSettings();
         setSettings({
           ...data,
+          email_check_frequency: data.email_check_frequency || 'daily',
           llm_provider: data.llm_provider || 'openai',
           local_llm_model_path: data.local_llm_model_path || '',
         });
@@ -157,6 +161,45 @@ const Settings = () => {
     }
   };
 
+  const handleAutotune = async () => {
+    try {
+      setAutotuning(true);
+      setAutotuneProgress({});
+      setError(null);
+
+      const job = await autotuneLocalLLM(setAutotuneProgress);
+      const { params, ...summary } = job.result;
+      setSettings((current) => ({
+        ...current,
+        local_llm_settings: {
+          ...current.local_llm_settings,
+          tuned: params,
+          autotune: { params, ...summary },
+        },
+      }));
+      setSuccess(`Auto-tune complete: ${summary.tokens_per_second} tokens/sec`);
+    } catch (err) {
+      console.error('Error auto-tuning local LLM:', err);
+      setError(`Auto-tune failed: ${err.message}`);
+    } finally {
+      setAutotuning(false);
+    }
+  };
+
+  // Blank override fields fall back to the auto-tuned (or default) value
+  const setLocalLLMOverride = (name, value) => {
+    const overrides = { ...(settings.local_llm_settings?.overrides || {}) };
+    if (value === '') {
+      delete overrides[name];
+    } else {
+      overrides[name] = parseInt(value, 10);
+    }
+    setSettings({
+      ...settings,
+      local_llm_settings: { ...settings.local_llm_settings, overrides },
+    });
+  };
+
   const addKeyword = () => {
     if (newKeyword.trim() && !settings.important_keywords.includes(newKeyword.trim())) {
       setSettings({
@@ -334,6 +377,53 @@ const Settings = () => {
               </Button>
             </Box>
             
+            <Box sx={{ mb: 2 }}>
+              <Typography variant="subtitle2" gutterBottom>
+                Performance
+              </Typography>
+              {settings.local_llm_settings?.autotune ? (
+                <Typography variant="body2" sx={{ mb: 1 }}>
+                  Tuned for {settings.local_llm_settings.autotune.model}:{' '}
+                  {settings.local_llm_settings.autotune.tokens_per_second} tokens/sec
+                  ({settings.local_llm_settings.autotune.params.threads} threads,
+                  batch {settings.local_llm_settings.autotune.params.batch_size},
+                  context {settings.local_llm_settings.autotune.params.context_size})
+                </Typography>
+              ) : (
+                <Typography variant="body2" sx={{ mb: 1 }}>
+                  Not tuned yet. Auto-tune benchmarks a few settings on this machine and keeps the fastest.
+                </Typography>
+              )}
+              <Button
+                variant="outlined"
+                onClick={handleAutotune}
+                disabled={autotuning || !localLLMConfigured}
+              >
+                {autotuning
+                  ? `Tuning... (${autotuneProgress.trials || 0}/${autotuneProgress.total || '?'})`
+                  : 'Auto-tune Performance'}
+              </Button>
+              <Box sx={{ display: 'flex', gap: 2, mt: 2 }}>
+                {[
+                  ['threads', 'Threads'],
+                  ['batch_size', 'Batch Size'],
+                  ['context_size', 'Context Size'],
+                ].map(([name, label]) => (
+                  <TextField
+                    key={name}
+                    type="number"
+                    size="small"
+                    label={label}
+                    value={settings.local_llm_settings?.overrides?.[name] ?? ''}
+                    onChange={(e) => setLocalLLMOverride(name, e.target.value)}
+                    placeholder={String(settings.local_llm_settings?.tuned?.[name] ?? 'auto')}
+                    InputLabelProps={{ shrink: true }}
+                    helperText="Blank = auto"
+                  />
+                ))}
+              </Box>
+            </Box>
+
             <Alert severity="warning" sx={{ mb: 2 }}>
               For Milestone 1, you will need to manually install the llama-cpp-python package 
               and download a compatible LLM model file (.gguf format).
@@ -450,6 +540,25 @@ const Settings = () => {
         </Box>
       </Box>
 
+      <Box sx={{ mb: 4 }}>
+        <FormControl fullWidth>
+          <InputLabel>Check for New Mail</InputLabel>
+          <Select
+            value={settings.email_check_frequency}
+            label="Check for New Mail"
+            onChange={(e) => setSettings({ ...settings, email_check_frequency: e.target.value })}
+          >
+            <MenuItem value="every_5_minutes">Every 5 minutes</MenuItem>
+            <MenuItem value="every_15_minutes">Every 15 minutes</MenuItem>
+            <MenuItem value="every_30_minutes">Every 30 minutes</MenuItem>
+            <MenuItem value="hourly">Hourly</MenuItem>
+            <MenuItem value="every_6_hours">Every 6 hours</MenuItem>
+            <MenuItem value="daily">Daily</MenuItem>
+            <MenuItem value="manual">Only when I refresh</MenuItem>
+          </Select>
+        </FormControl>
+      </Box>
+
       <Divider sx={{ my: 3 }} />
       
       <Typography variant="h6" gutterBottom>